@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import weakref
+from urllib.parse import urlsplit
+from http_client import (get_http_client, backoff_delay, DEFAULT_HEADERS, CONNECT_TIMEOUT, READ_TIMEOUT,
+                         MAX_RETRIES, DEFAULT_POOL_SIZE, IDEMPOTENT_METHODS, RETRY_STATUSES)
+
+try:
+    import aiohttp
+except ImportError:  # The async path then runs the requests client on worker threads
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on open connections across all hosts, per event loop
+ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', 100))
+
+# Per-host concurrency, shared by every loop's client (see configure_host)
+_host_pool_sizes = {}
+
+
+def configure_host(base_url: str, pool_size: int = DEFAULT_POOL_SIZE):
+    """Limit concurrent async requests to a host, like FetchClient.configure_host."""
+    _host_pool_sizes[urlsplit(base_url).netloc] = pool_size
+
+
+class AsyncFetchClient:
+    """aiohttp counterpart of http_client.FetchClient for the async scrape path.
+
+    One keep-alive session per event loop, the same timeouts, retry policy
+    and headers as the sync client, and a per-host semaphore in place of the
+    per-host connection pool size.
+    """
+
+    def __init__(self, connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, max_connections: int = ASYNC_MAX_CONNECTIONS):
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self._session = None
+        self._host_limits = {}
+
+    def _session_for_loop(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS,
+                                                  timeout=self.timeout)
+        return self._session
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(_host_pool_sizes.get(host, DEFAULT_POOL_SIZE))
+        return limit
+
+    async def request(self, method: str, url: str, read=None, **kwargs) -> tuple:
+        """Send a request, retrying idempotent methods on transient failures.
+
+        Returns (status, headers, text). read(response), if given, reads the
+        body in place of response.text() (e.g. PageReader.read_aiohttp).
+        """
+        method = method.upper()
+        retries = self.max_retries if method in IDEMPOTENT_METHODS else 0
+        attempt = 0
+        while True:
+            try:
+                async with self._host_limit(url):
+                    async with self._session_for_loop().request(method, url, **kwargs) as response:
+                        if response.status in RETRY_STATUSES and attempt < retries:
+                            delay = backoff_delay(attempt, response.headers.get('Retry-After', ''))
+                            logger.info("Retrying %s in %.2fs after HTTP %d", url, delay, response.status)
+                        else:
+                            body = await (read(response) if read else response.text(errors='replace'))
+                            return response.status, dict(response.headers), body
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.info("Retrying %s in %.2fs after error: %s", url, delay, e)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> tuple:
+        return await self.request('GET', url, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client() -> AsyncFetchClient:
+    """Return the running event loop's fetch client, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncFetchClient()
+    return client
+
+
+async def close_async_http_client():
+    """Close the running loop's client, if it has one."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+async def fetch_url(url: str, reader=None) -> tuple:
+    """GET a page without blocking the event loop. Returns (status, headers, body).
+
+    With a page_stream.PageReader the body is streamed and may stop early.
+    """
+    if aiohttp is None:
+        if reader is None:
+            response = await asyncio.to_thread(get_http_client().get, url)
+            return response.status_code, dict(response.headers), response.text
+        response = await asyncio.to_thread(get_http_client().get, url, stream=True)
+        body = await asyncio.to_thread(reader.read_response, response)
+        return response.status_code, dict(response.headers), body
+    return await get_async_http_client().get(url, read=reader.read_aiohttp if reader else None)
@@ -0,0 +1,92 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future
+from profiling import current_profile, install_task_factory
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+# Fire-and-forget tasks; the event loop itself only keeps weak references
+_background_tasks = set()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop on a daemon thread that runs the async core for synchronous callers."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            # Tasks run for a profiled request are profiled on the loop thread too
+            install_task_factory(_loop)
+            _loop_thread = threading.Thread(target=_loop.run_forever, name='async-core', daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def _submit(coro, context: contextvars.Context) -> Future:
+    loop = get_background_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("Synchronous wrapper called from the async core's own event loop")
+    future = Future()
+
+    def start():
+        if not future.set_running_or_notify_cancel():
+            coro.close()
+            return
+        task = loop.create_task(coro, context=context)
+
+        def done(task):
+            if task.cancelled():
+                future.set_exception(asyncio.CancelledError())
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        task.add_done_callback(done)
+
+    loop.call_soon_threadsafe(start)
+    return future
+
+
+def run_sync(coro):
+    """Run a coroutine on the background loop and wait for its result.
+
+    The caller's context variables are visible to the coroutine; with an
+    active request profile, its steps on the loop thread are profiled.
+    """
+    return _submit(coro, contextvars.copy_context()).result()
+
+
+def iter_sync(agen):
+    """Iterate an async generator from synchronous code, one step at a time on the background loop."""
+    context = contextvars.copy_context()
+    try:
+        while True:
+            try:
+                item = _submit(agen.__anext__(), context).result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        _submit(agen.aclose(), context).result()
+
+
+def keep_running(task: asyncio.Future) -> asyncio.Future:
+    """Hold a reference to a task that should finish even if nobody awaits it."""
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def run_blocking(executor, fn, *args, label: str = ''):
+    """Run blocking fn on executor (None for the loop's default) without blocking the event loop.
+
+    While a request is being profiled the call is profiled on the worker thread too.
+    """
+    profile = current_profile()
+    if profile is not None:
+        fn = profile.wrap(fn, label)
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
@@ -97,6 +97,72 @@ async function fetchPriceComparison(productData) {
   }
 }
 
+// Streams results from /compare-prices/stream, calling onPartial with the
+// results gathered so far as each marketplace finishes. Falls back to the
+// plain JSON endpoint if streaming is unavailable.
+async function streamPriceComparison(productData, onPartial) {
+  let response;
+  try {
+    response = await fetch('http://localhost:8000/compare-prices/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        title: productData.title,
+        currentMarketplace: productData.marketplace,
+        currentPrice: productData.price
+      })
+    });
+  } catch (error) {
+    console.error('[PricePulse-Background] Stream fetch error:', error);
+    return fetchPriceComparison(productData);
+  }
+  if (!response.ok || !response.body) {
+    return fetchPriceComparison(productData);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  const partialResults = [];
+  let buffer = '';
+  let summary = null;
+  let streamError = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let eventName = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event: ')) eventName = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (!data) continue;
+      const payload = JSON.parse(data);
+
+      if (eventName === 'match' && payload.results.length) {
+        partialResults.push(...payload.results);
+        onPartial(partialResults.slice());
+      } else if (eventName === 'summary') {
+        summary = payload;
+      } else if (eventName === 'error') {
+        streamError = payload.message || payload.error;
+      }
+    }
+  }
+
+  if (summary) {
+    return { results: summary.results || [], error: null };
+  }
+  return { results: partialResults, error: streamError || (partialResults.length ? null : 'Server error') };
+}
+
 chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
   if (message.action === 'productDetected' && sender.tab) {
     const tabId = sender.tab.id;
@@ -131,8 +197,21 @@ chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
       }
     });
 
-    // Fetch comparison results asynchronously
-    fetchPriceComparison(productData)
+    // Stream comparison results asynchronously, updating the overlay as each marketplace finishes
+    const sendPartialResults = (partialResults) => {
+      chrome.tabs.sendMessage(tabId, {
+        action: 'updateOverlay',
+        productData: productData,
+        comparisonResults: partialResults,
+        error: null
+      }, (response) => {
+        if (chrome.runtime.lastError) {
+          console.error(`[PricePulse-Background] Error sending partial updateOverlay message to tab ${tabId}:`, chrome.runtime.lastError.message);
+        }
+      });
+    };
+
+    streamPriceComparison(productData, sendPartialResults)
       .then(comparisonResponse => {
         // Send comparison results back to content script to update overlay
         console.log(`[PricePulse-Background] Sending updateOverlay message to tab ${tabId}`);
@@ -0,0 +1,440 @@
+"""End-to-end load test of the price server against the local marketplace stand-in.
+
+Starts benchmarks.marketplace_standin and a price server whose
+marketplaces point at it (or uses a running server with --server), then
+drives a mix of /compare-prices, /search and /compare-prices/batch
+requests from --concurrency closed-loop clients. Reports throughput,
+errors and p50/p95/p99 latency per endpoint, plus the server's CPU use
+and RSS (summed over its process tree, read from /proc). The report is
+saved as JSON so runs with different server settings can be compared.
+
+Usage:
+    python -m benchmarks.load_test [--app flask|asgi] [--concurrency 16] [--duration 30]
+        [--mix compare=6,search=3,batch=1] [--server-env KEY=VALUE ...] [--label NAME]
+        [stand-in options, see benchmarks.marketplace_standin]
+    python -m benchmarks.load_test --compare results/a.json results/b.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import marketplace_standin  # noqa: E402
+from benchmarks.make_fixtures import BRANDS, PRODUCTS  # noqa: E402
+from benchmarks.parser_bench import percentile  # noqa: E402
+from marketplaces import all_adapters  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+SERVER_SCRIPTS = {'flask': 'price_server.py', 'asgi': 'price_asgi.py'}
+ENDPOINTS = ('compare', 'search', 'batch')
+
+# Server settings for a load test; --server-env overrides them
+SERVER_DEFAULTS = {
+    'MARKETPLACE_FETCH': 'requests',
+    # The stand-in has no request budget to protect; pass MARKETPLACE_RPS=0 to test with the real limits
+    'MARKETPLACE_RPS': '1000',
+    'MARKETPLACE_BURST': '1000',
+    'FETCH_MODE': 'live',
+    'WATCHLIST_ENABLED': 'false',
+    'LOG_LEVEL': 'WARNING',
+}
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def process_tree(pid: int) -> list:
+    """pid and all its descendants."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # Fields after the parenthesized command name; the parent pid is the second
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree = [pid]
+    for parent in tree:
+        tree.extend(children.get(parent, ()))
+    return tree
+
+
+def process_usage(pid: int):
+    """(cpu_seconds, rss_bytes) of one process, or None once it has exited."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/statm') as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # utime, stime, and cutime, cstime of reaped children
+    cpu = sum(int(value) for value in fields[11:15]) / CLOCK_TICKS
+    return cpu, rss_pages * PAGE_SIZE
+
+
+class ResourceSampler:
+    """Samples the CPU time and RSS of a process tree from a background thread."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.rss_peak = 0
+        self.processes = 0
+        self._cpu = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self) -> dict:
+        rss = 0
+        pids = process_tree(self.pid)
+        for pid in pids:
+            usage = process_usage(pid)
+            if usage is not None:
+                # Keep exited processes' last reading so CPU totals never go backwards
+                self._cpu[pid] = usage[0]
+                rss += usage[1]
+        self.rss_peak = max(self.rss_peak, rss)
+        self.processes = max(self.processes, len(pids))
+        return {'cpu_seconds': sum(self._cpu.values()), 'rss_bytes': rss}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def make_titles(count: int, seed: int) -> list:
+    """Distinct product titles; fewer titles means more result cache hits."""
+    rng = random.Random(seed)
+    titles = []
+    for index in range(count):
+        titles.append(f"{rng.choice(BRANDS)} {rng.choice(PRODUCTS)} {index}")
+    return titles
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for entry in spec.split(','):
+        name, _, weight = entry.partition('=')
+        if name.strip() not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class LoadClient:
+    """One closed-loop client: sends a request, waits for the whole response, repeats."""
+
+    def __init__(self, server: str, args: argparse.Namespace, titles: list, marketplaces: list, seed: int):
+        self.server = server.rstrip('/')
+        self.args = args
+        self.titles = titles
+        self.marketplaces = marketplaces
+        self.current_marketplaces = args.current_marketplaces.split(',')
+        self.mix = parse_mix(args.mix)
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.samples = []  # (endpoint, started_at, seconds, ok)
+
+    def _compare(self) -> bool:
+        response = self.session.post(f"{self.server}/compare-prices", timeout=self.args.timeout, json={
+            'title': self.rng.choice(self.titles),
+            'currentMarketplace': self.rng.choice(self.current_marketplaces),
+            'currentPrice': '$199.00'
+        })
+        return response.status_code == 200 and 'error' not in response.json()
+
+    def _search(self) -> bool:
+        response = self.session.post(f"{self.server}/search", timeout=self.args.timeout, json={
+            'query': self.rng.choice(self.titles),
+            'marketplace': self.rng.choice(self.marketplaces)
+        })
+        return response.status_code == 200 and 'error' not in response.json()
+
+    def _batch(self) -> bool:
+        items = [{'title': self.rng.choice(self.titles),
+                  'currentMarketplace': self.rng.choice(self.current_marketplaces)}
+                 for _ in range(self.args.batch_size)]
+        with self.session.post(f"{self.server}/compare-prices/batch", timeout=self.args.timeout, stream=True,
+                               json={'items': items, 'order': 'completion'}) as response:
+            if response.status_code != 200:
+                return False
+            for line in response.iter_lines(decode_unicode=True):
+                if line == 'event: done':
+                    return True
+                if line == 'event: error':
+                    return False
+        return False
+
+    def run(self, stop_at: float):
+        endpoints = list(self.mix)
+        weights = [self.mix[endpoint] for endpoint in endpoints]
+        send = {'compare': self._compare, 'search': self._search, 'batch': self._batch}
+        while time.time() < stop_at:
+            endpoint = self.rng.choices(endpoints, weights)[0]
+            started = time.time()
+            try:
+                ok = send[endpoint]()
+            except (requests.RequestException, ValueError):
+                ok = False
+            self.samples.append((endpoint, started, time.time() - started, ok))
+
+
+def summarize(samples: list, seconds: float) -> dict:
+    def stats(timings: list, errors: int) -> dict:
+        return {
+            'requests': len(timings),
+            'errors': errors,
+            'throughput_rps': round(len(timings) / seconds, 2),
+            'p50_ms': round(percentile(timings, 50) * 1000, 1) if timings else None,
+            'p95_ms': round(percentile(timings, 95) * 1000, 1) if timings else None,
+            'p99_ms': round(percentile(timings, 99) * 1000, 1) if timings else None,
+            'max_ms': round(max(timings) * 1000, 1) if timings else None
+        }
+
+    summary = stats([s[2] for s in samples], sum(1 for s in samples if not s[3]))
+    summary['endpoints'] = {}
+    for endpoint in ENDPOINTS:
+        chosen = [s for s in samples if s[0] == endpoint]
+        if chosen:
+            summary['endpoints'][endpoint] = stats([s[2] for s in chosen], sum(1 for s in chosen if not s[3]))
+    return summary
+
+
+def start_standin(args: argparse.Namespace, log) -> tuple:
+    """Start the stand-in in its own process; returns (process, MARKETPLACE_URLS value)."""
+    command = [sys.executable, '-m', 'benchmarks.marketplace_standin',
+               '--latency', args.latency, '--error-rate', str(args.error_rate), '--cards', str(args.cards),
+               '--chrome-blocks', str(args.chrome_blocks), '--bytes-per-second', str(args.bytes_per_second),
+               '--base-port', str(args.base_port), '--seed', str(args.seed)]
+    if args.config:
+        command += ['--config', args.config]
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=subprocess.PIPE, stderr=log, text=True)
+    line = process.stdout.readline().strip()
+    if not line.startswith('MARKETPLACE_URLS='):
+        process.kill()
+        raise RuntimeError('The marketplace stand-in did not start (see the log)')
+    return process, line.split('=', 1)[1]
+
+
+def start_server(args: argparse.Namespace, env: dict, log) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPTS[args.app]], cwd=REPO_DIR,
+                               env=dict(os.environ, **env), stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with status {process.returncode} (see the log)")
+        try:
+            if requests.get(f"http://127.0.0.1:{args.port}/health", timeout=1).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('The server did not become healthy in time (see the log)')
+
+
+def stop(process: subprocess.Popen):
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run(args: argparse.Namespace) -> dict:
+    workdir = tempfile.mkdtemp(prefix='price-load-')
+    log_path = os.path.join(workdir, 'load_test.log')
+    server_env = dict(SERVER_DEFAULTS, PORT=str(args.port),
+                      PRICE_HISTORY_DB=os.path.join(workdir, 'price_history.db'),
+                      PLANNER_STATS_PATH=os.path.join(workdir, 'planner_stats.json'))
+    server_env.update(entry.split('=', 1) for entry in args.server_env)
+
+    standin = server = None
+    with open(log_path, 'w') as log:
+        try:
+            if not args.no_standin:
+                standin, server_env['MARKETPLACE_URLS'] = start_standin(args, log)
+                print(f"Stand-in marketplaces: MARKETPLACE_URLS={server_env['MARKETPLACE_URLS']}")
+            if args.server:
+                url = args.server
+                pid = args.server_pid
+            else:
+                server = start_server(args, server_env, log)
+                url = f"http://127.0.0.1:{args.port}"
+                pid = server.pid
+
+            titles = make_titles(args.titles, args.seed)
+            marketplaces = [adapter.id for adapter in all_adapters()]
+            clients = [LoadClient(url, args, titles, marketplaces, args.seed + i) for i in range(args.concurrency)]
+            sampler = ResourceSampler(pid) if pid and os.path.isdir('/proc') else None
+            if sampler is not None:
+                sampler.start()
+
+            started = time.time()
+            measure_from = started + args.warmup
+            stop_at = measure_from + args.duration
+            threads = [threading.Thread(target=client.run, args=(stop_at,), daemon=True) for client in clients]
+            for thread in threads:
+                thread.start()
+            time.sleep(max(0.0, measure_from - time.time()))
+            usage_start = sampler.sample() if sampler else None
+            rss_peak_before = sampler.rss_peak if sampler else 0
+            if sampler:
+                sampler.rss_peak = 0
+            time.sleep(max(0.0, stop_at - time.time()))
+            usage_end = sampler.sample() if sampler else None
+            measured = time.time() - measure_from
+            # Requests still running at stop_at are counted once they finish
+            for thread in threads:
+                thread.join(args.timeout)
+            if sampler:
+                sampler.stop()
+
+            samples = [s for client in clients for s in client.samples if s[1] >= measure_from]
+            report = {
+                'label': args.label,
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+                'app': args.app if not args.server else args.server,
+                'server_env': {key: value for key, value in server_env.items() if key != 'MARKETPLACE_URLS'},
+                'load': {
+                    'concurrency': args.concurrency,
+                    'duration': args.duration,
+                    'warmup': args.warmup,
+                    'mix': parse_mix(args.mix),
+                    'titles': args.titles,
+                    'batch_size': args.batch_size,
+                    'current_marketplaces': args.current_marketplaces.split(',')
+                },
+                'standin': None if args.no_standin else {
+                    'latency': args.latency,
+                    'error_rate': args.error_rate,
+                    'cards': args.cards,
+                    'chrome_blocks': args.chrome_blocks,
+                    'bytes_per_second': args.bytes_per_second,
+                    'config': args.config
+                },
+                'results': summarize(samples, measured),
+                'server': None
+            }
+            if sampler:
+                cpu_seconds = usage_end['cpu_seconds'] - usage_start['cpu_seconds']
+                report['server'] = {
+                    'cpu_seconds': round(cpu_seconds, 2),
+                    'cpu_cores': round(cpu_seconds / measured, 2),
+                    'rss_start_mib': round(usage_start['rss_bytes'] / 2 ** 20, 1),
+                    'rss_end_mib': round(usage_end['rss_bytes'] / 2 ** 20, 1),
+                    'rss_peak_mib': round(max(sampler.rss_peak, usage_end['rss_bytes']) / 2 ** 20, 1),
+                    'rss_peak_warmup_mib': round(rss_peak_before / 2 ** 20, 1),
+                    'processes': sampler.processes
+                }
+            if standin is not None:
+                try:
+                    report['standin_stats'] = requests.get(f"http://127.0.0.1:{args.base_port}/__stats",
+                                                           timeout=5).json()
+                except requests.RequestException:
+                    pass
+            return report
+        finally:
+            stop(server)
+            stop(standin)
+            print(f"Logs: {log_path}")
+
+
+def print_report(report: dict):
+    results = report['results']
+    print(f"{'endpoint':<10}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(results['endpoints'].items()) + [('all', results)]
+    for name, entry in rows:
+        print(f"{name:<10}{entry['requests']:>10}{entry['errors']:>8}{entry['throughput_rps']:>9}"
+              f"{entry['p50_ms'] or '-':>10}{entry['p95_ms'] or '-':>10}{entry['p99_ms'] or '-':>10}")
+    server = report.get('server')
+    if server:
+        print(f"server: {server['cpu_cores']} cores ({server['cpu_seconds']} CPU s), "
+              f"RSS {server['rss_end_mib']} MiB (peak {server['rss_peak_mib']} MiB, "
+              f"{server['processes']} processes)")
+
+
+def compare(paths: list):
+    """Side-by-side summary of saved reports."""
+    print(f"{'label':<24}{'req/s':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'cores':>7}{'RSS MiB':>9}")
+    for path in paths:
+        with open(path) as f:
+            report = json.load(f)
+        results = report['results']
+        server = report.get('server') or {}
+        label = report.get('label') or os.path.basename(path)
+        print(f"{label[:23]:<24}{results['throughput_rps']:>9}{results['errors']:>8}"
+              f"{results['p50_ms'] or '-':>10}{results['p95_ms'] or '-':>10}{results['p99_ms'] or '-':>10}"
+              f"{server.get('cpu_cores', '-'):>7}{server.get('rss_peak_mib', '-'):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--compare', nargs='+', metavar='REPORT', help='summarize saved reports and exit')
+    parser.add_argument('--app', choices=sorted(SERVER_SCRIPTS), default='flask', help='server entry point to start')
+    parser.add_argument('--port', type=int, default=8765, help='port for the started server')
+    parser.add_argument('--server', help='load test this running server instead of starting one')
+    parser.add_argument('--server-pid', type=int, help='pid of --server, to report its CPU and RSS')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='setting for the started server, e.g. PARSE_PROCESSES=4 (repeatable)')
+    parser.add_argument('--startup-timeout', type=float, default=30)
+    parser.add_argument('--no-standin', action='store_true', help='do not start the marketplace stand-in')
+    parser.add_argument('--concurrency', type=int, default=16, help='closed-loop clients')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of load before measuring')
+    parser.add_argument('--mix', default='compare=6,search=3,batch=1', help='relative weight of each endpoint')
+    parser.add_argument('--batch-size', type=int, default=5, help='titles per batch request')
+    parser.add_argument('--titles', type=int, default=500, help='distinct product titles to draw from')
+    parser.add_argument('--current-marketplaces', default='amazon,amazon_au',
+                        help='currentMarketplace values for comparisons (picks the region)')
+    parser.add_argument('--timeout', type=float, default=120, help='client timeout per request')
+    parser.add_argument('--label', default='', help='name for this run in reports')
+    parser.add_argument('--json', help='report path (default benchmarks/results/<label>-<time>.json)')
+    marketplace_standin.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return 0
+
+    report = run(args)
+    print_report(report)
+    path = args.json or os.path.join(
+        RESULTS_DIR, f"{args.label or 'load'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report: {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
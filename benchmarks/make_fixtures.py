@@ -0,0 +1,134 @@
+"""Generate the synthetic search-result fixtures used by parser_bench.
+
+The pages mirror the markup the scrapers target on each marketplace (JB
+Hi-Fi data-testid tiles, The Good Guys product-card articles and the
+generic product-card/product-item/search-result/item-card containers), one
+or more pages for every registered marketplace, surrounded by the kind of
+navigation, script and tracking markup that makes real pages large.
+Recorded pages (see the fetch record mode) can be dropped into
+benchmarks/fixtures alongside these and listed in manifest.json.
+
+Usage: python -m benchmarks.make_fixtures
+"""
+import gzip
+import json
+import os
+import random
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+BRANDS = ['Apple', 'Samsung', 'Sony', 'LG', 'Dell', 'Lenovo', 'HP', 'Bose', 'JBL', 'Asus', 'Logitech', 'Google']
+PRODUCTS = ['iPhone 15 Pro', 'Galaxy S24 Ultra', 'WH-1000XM5 Headphones', 'OLED55C3 55" TV', 'XPS 13 Laptop',
+            'ThinkPad X1 Carbon', 'Pavilion 15', 'QuietComfort Ultra', 'Flip 6 Speaker', 'ROG Ally', 'MX Master 3S',
+            'Pixel 8 Pro', 'iPad Air 11"', 'Galaxy Tab S9', 'Odyssey G7 27" Monitor']
+CAPACITIES = ['64GB', '128GB', '256GB', '512GB', '1TB', '', '']
+COLOURS = ['Black', 'Silver', 'Blue', 'Natural Titanium', 'Graphite', '']
+
+
+def _title(rng) -> str:
+    parts = [rng.choice(BRANDS), rng.choice(PRODUCTS), rng.choice(CAPACITIES), rng.choice(COLOURS)]
+    return ' '.join(p for p in parts if p)
+
+
+def _card_title(rng, index: int, first_title: str = None) -> str:
+    # Draw a title either way so the rest of the page does not depend on first_title
+    title = _title(rng)
+    return first_title if index == 0 and first_title else title
+
+
+def _price(rng) -> str:
+    return f"${rng.randint(19, 3499):,}.{rng.choice(['00', '95', '99'])}"
+
+
+def _chrome(rng, blocks: int) -> str:
+    """Navigation, inline scripts and tracking markup around the results."""
+    out = []
+    for i in range(blocks):
+        out.append(
+            f'<div class="nav-block nav-{i}"><ul>'
+            + ''.join(f'<li class="nav-item"><a href="/c/{i}/{j}">Category {i}-{j}</a></li>' for j in range(6))
+            + f'</ul><img src="/static/banner-{i}.webp" alt="Save {rng.randint(5, 50)}% today">'
+            + f'<script>window.__track_{i} = {{"id": {rng.randint(1000, 9999)}, "price": "{_price(rng)}"}};</script>'
+            + '</div>'
+        )
+    return ''.join(out)
+
+
+def jbhifi_page(rng, cards: int, first_title: str = None, chrome_blocks: int = 400) -> str:
+    tiles = []
+    for i in range(cards):
+        tiles.append(
+            '<div class="ProductCard_root">'
+            '<div data-testid="product-card-content">'
+            f'<a class="ProductCard_imageLink" href="/products/{rng.randint(100000, 999999)}-{i}">'
+            f'<div data-testid="product-card-image-base"><img src="https://www.jbhifi.com.au/cdn/{i}.jpg"></div></a>'
+            f'<div data-testid="product-card-title">{_card_title(rng, i, first_title)}</div>'
+            f'<span class="PriceTag_was">{_price(rng)}</span>'
+            f'<span class="PriceTag_actual__1eb7mu916">{_price(rng)}</span>'
+            '</div></div>'
+        )
+    return f'<!DOCTYPE html><html><head><title>Search | JB Hi-Fi</title></head><body>{_chrome(rng, chrome_blocks)}<main>{"".join(tiles)}</main>{_chrome(rng, chrome_blocks // 2)}</body></html>'
+
+
+def thegoodguys_page(rng, cards: int, first_title: str = None, chrome_blocks: int = 400) -> str:
+    tiles = []
+    for i in range(cards):
+        tiles.append(
+            '<article data-testid="product-card" class="_card_1pa96_1">'
+            f'<a class="_imageLink_1pa96_24" href="/p/{rng.randint(100000, 999999)}-{i}"><img src="https://www.thegoodguys.com.au/img/{i}.jpg"></a>'
+            f'<h4 class="_title_1pa96_41">{_card_title(rng, i, first_title)}</h4>'
+            f'<span data-price="true" data-testid="product-card-price-section-price">{_price(rng)}</span>'
+            '</article>'
+        )
+    return f'<!DOCTYPE html><html><head><title>Search | The Good Guys</title></head><body>{_chrome(rng, chrome_blocks)}<section>{"".join(tiles)}</section>{_chrome(rng, chrome_blocks // 2)}</body></html>'
+
+
+def generic_page(rng, cards: int, container: str, card_class: str, first_title: str = None,
+                 chrome_blocks: int = 400) -> str:
+    tiles = []
+    for i in range(cards):
+        tiles.append(
+            f'<{container} class="{card_class} s-{i}">'
+            f'<h2 class="product-title"><span>{_card_title(rng, i, first_title)}</span></h2>'
+            f'<div class="rating">4.{rng.randint(0, 9)} out of 5</div>'
+            f'<span class="price">{_price(rng)}</span>'
+            f'<a href="/dp/{rng.randint(100000, 999999)}">View</a>'
+            f'</{container}>'
+        )
+    return f'<!DOCTYPE html><html><head><title>Search</title></head><body>{_chrome(rng, chrome_blocks)}<div id="results">{"".join(tiles)}</div>{_chrome(rng, chrome_blocks // 2)}</body></html>'
+
+
+def main():
+    rng = random.Random(20250702)
+    pages = [
+        ('jbhifi_au_iphone.html.gz', 'jbhifi_au', 'Apple iPhone 15 Pro 128GB Natural Titanium', jbhifi_page(rng, 36)),
+        ('jbhifi_au_headphones.html.gz', 'jbhifi_au', 'Sony WH-1000XM5 Headphones Black', jbhifi_page(rng, 24)),
+        ('thegoodguys_au_tv.html.gz', 'thegoodguys_au', 'LG OLED55C3 55" TV', thegoodguys_page(rng, 36)),
+        ('thegoodguys_au_laptop.html.gz', 'thegoodguys_au', 'Dell XPS 13 Laptop 512GB Silver', thegoodguys_page(rng, 24)),
+        ('amazon_au_speaker.html.gz', 'amazon_au', 'JBL Flip 6 Speaker Blue', generic_page(rng, 48, 'div', 'search-result')),
+        ('target_au_tablet.html.gz', 'target_au', 'Samsung Galaxy Tab S9 256GB Graphite', generic_page(rng, 40, 'article', 'product-card')),
+        ('amazon_mouse.html.gz', 'amazon', 'Logitech MX Master 3S', generic_page(rng, 48, 'li', 'product-item')),
+        # Generic item-card markup, as on the other marketplaces the generic parser reads
+        ('ebay_headphones.html.gz', 'ebay', 'Bose QuietComfort Ultra Headphones',
+         generic_page(rng, 50, 'div', 'item-card', 'Bose QuietComfort Ultra Wireless Noise Cancelling Headphones')),
+        ('ebay_au_phone.html.gz', 'ebay_au', 'Google Pixel 8 Pro 256GB', generic_page(rng, 50, 'li', 'item-card')),
+        ('walmart_monitor.html.gz', 'walmart', 'Samsung Odyssey G7 27" Monitor',
+         generic_page(rng, 40, 'div', 'item-card', 'Samsung 27" Odyssey G7 Curved Gaming Monitor')),
+        ('target_laptop.html.gz', 'target', 'HP Pavilion 15 Laptop 512GB', generic_page(rng, 40, 'article', 'product-card')),
+        ('mydeal_au_console.html.gz', 'mydeal_au', 'Asus ROG Ally Handheld',
+         generic_page(rng, 30, 'div', 'item-card', 'ASUS ROG Ally Z1 Extreme Handheld Gaming Console')),
+    ]
+    manifest = []
+    for filename, marketplace, query, html in pages:
+        # mtime=0 keeps the compressed bytes reproducible
+        with open(os.path.join(FIXTURES_DIR, filename), 'wb') as f:
+            f.write(gzip.compress(html.encode('utf-8'), mtime=0))
+        manifest.append({'file': filename, 'marketplace': marketplace, 'query': query})
+        print(f"Wrote {filename} ({len(html) / 1024:.0f} KiB)")
+    with open(os.path.join(FIXTURES_DIR, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""Local stand-in for the marketplaces, for load testing without touching real retailers.
+
+Serves search results pages for every registered marketplace, one port
+each (starting at --base-port), in the markup its parser reads (see
+make_fixtures). The first product card carries the searched query as its
+title, so comparisons find matches. Response latency, error rate, page
+size and transfer rate are configurable, per marketplace through
+--config. Point the scraper at the stand-in with the MARKETPLACE_URLS
+line it prints, and MARKETPLACE_FETCH=requests so no browser is needed.
+GET /__stats on any port returns the requests served so far.
+
+Usage:
+    python -m benchmarks.marketplace_standin [--latency lognormal:0.3,0.5] [--error-rate 0.02]
+        [--cards 40] [--chrome-blocks 400] [--bytes-per-second 0] [--config standin.json]
+
+--config is a JSON object of per-marketplace overrides, e.g.
+{"amazon_au": {"latency": "fixed:2", "error_rate": 0.5, "cards": 10}}.
+"""
+import argparse
+import html
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.make_fixtures import generic_page, jbhifi_page, thegoodguys_page  # noqa: E402
+from marketplaces import all_adapters  # noqa: E402
+
+QUERY_MARKER = '@@QUERY_TITLE@@'
+WRITE_CHUNK_SIZE = 16 * 1024
+
+# Generic markup per marketplace, so every product card class the generic parser knows gets exercised
+GENERIC_MARKUP = {
+    'amazon': ('li', 'product-item'),
+    'amazon_au': ('div', 'search-result'),
+    'target': ('article', 'product-card'),
+    'target_au': ('article', 'product-card'),
+}
+
+
+def parse_latency(spec: str):
+    """Latency sampler from "fixed:S", "uniform:LOW,HIGH" or "lognormal:MEDIAN,SIGMA" (seconds)."""
+    kind, _, values = spec.partition(':')
+    params = [float(v) for v in values.split(',') if v]
+    if kind == 'fixed' and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == 'uniform' and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == 'lognormal' and len(params) == 2:
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1]) if params[0] > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StandinMarketplace:
+    """Page template, behaviour and counters for one stand-in marketplace."""
+
+    def __init__(self, adapter, latency: str, error_rate: float, cards: int, chrome_blocks: int,
+                 bytes_per_second: int, seed: int):
+        self.id = adapter.id
+        self.latency = latency
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.bytes_per_second = bytes_per_second
+        self.rng = random.Random(f"{seed}:{adapter.id}")
+        self.template = self._page(adapter, cards, chrome_blocks)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _page(self, adapter, cards: int, chrome_blocks: int) -> str:
+        rng = random.Random(f"page:{adapter.id}")
+        if adapter.parser.endswith(':parse_jbhifi'):
+            return jbhifi_page(rng, cards, QUERY_MARKER, chrome_blocks)
+        if adapter.parser.endswith(':parse_thegoodguys'):
+            return thegoodguys_page(rng, cards, QUERY_MARKER, chrome_blocks)
+        container, card_class = GENERIC_MARKUP.get(adapter.id, ('div', 'item-card'))
+        return generic_page(rng, cards, container, card_class, QUERY_MARKER, chrome_blocks)
+
+    def next_response(self):
+        """(latency, failed) for the next request."""
+        with self._lock:
+            self.requests += 1
+            failed = self.rng.random() < self.error_rate
+            self.errors += int(failed)
+            return max(0.0, self.sample_latency(self.rng)), failed
+
+    def render(self, query: str) -> bytes:
+        return self.template.replace(QUERY_MARKER, html.escape(query)).encode('utf-8')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'latency': self.latency,
+                'error_rate': self.error_rate,
+                'page_bytes': len(self.template.encode('utf-8'))
+            }
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = 'text/html; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        rate = self.server.marketplace.bytes_per_second
+        for start in range(0, len(body), WRITE_CHUNK_SIZE):
+            chunk = body[start:start + WRITE_CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if rate > 0:
+                time.sleep(len(chunk) / rate)
+
+    def do_GET(self):
+        marketplace = self.server.marketplace
+        parts = urlsplit(self.path)
+        try:
+            if parts.path == '/__stats':
+                self._send(200, json.dumps(self.server.standin.stats()).encode('utf-8'), 'application/json')
+                return
+            latency, failed = marketplace.next_response()
+            time.sleep(latency)
+            if failed:
+                self._send(503, b'<html><body>Service Unavailable</body></html>')
+                return
+            # The search term is the first query parameter whatever the marketplace calls it
+            params = parse_qsl(parts.query)
+            self._send(200, marketplace.render(params[0][1] if params else ''))
+        except (BrokenPipeError, ConnectionResetError):
+            # Streaming fetches hang up once they have enough product cards
+            self.close_connection = True
+
+
+class MarketplaceStandin:
+    """One HTTP server per marketplace, each on its own port, served from daemon threads."""
+
+    def __init__(self, host: str = '127.0.0.1', base_port: int = 9100, latency: str = 'lognormal:0.3,0.5',
+                 error_rate: float = 0.0, cards: int = 40, chrome_blocks: int = 400, bytes_per_second: int = 0,
+                 overrides: dict = None, seed: int = 0):
+        self.host = host
+        self.servers = {}
+        overrides = overrides or {}
+        for offset, adapter in enumerate(all_adapters()):
+            settings = overrides.get(adapter.id, {})
+            marketplace = StandinMarketplace(
+                adapter,
+                latency=settings.get('latency', latency),
+                error_rate=float(settings.get('error_rate', error_rate)),
+                cards=int(settings.get('cards', cards)),
+                chrome_blocks=int(settings.get('chrome_blocks', chrome_blocks)),
+                bytes_per_second=int(settings.get('bytes_per_second', bytes_per_second)),
+                seed=seed
+            )
+            server = ThreadingHTTPServer((host, base_port + offset), StandinHandler)
+            server.daemon_threads = True
+            server.marketplace = marketplace
+            server.standin = self
+            self.servers[adapter.id] = server
+
+    def marketplace_urls(self) -> str:
+        """Value for the scraper's MARKETPLACE_URLS setting."""
+        return ','.join(f"{marketplace}=http://{self.host}:{server.server_address[1]}"
+                        for marketplace, server in self.servers.items())
+
+    def start(self):
+        for marketplace, server in self.servers.items():
+            threading.Thread(target=server.serve_forever, name=f"standin-{marketplace}", daemon=True).start()
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def stats(self) -> dict:
+        return {marketplace: server.marketplace.stats() for marketplace, server in self.servers.items()}
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Stand-in settings, shared with the load test harness."""
+    parser.add_argument('--latency', default='lognormal:0.3,0.5',
+                        help='response latency: fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of searches answered with a 503')
+    parser.add_argument('--cards', type=int, default=40, help='product cards per search page')
+    parser.add_argument('--chrome-blocks', type=int, default=400,
+                        help='navigation/script blocks around the results (page size; 400 is about 330 KiB)')
+    parser.add_argument('--bytes-per-second', type=int, default=0, help='per-response transfer rate, 0 for unlimited')
+    parser.add_argument('--config', help='JSON file of per-marketplace overrides of the settings above')
+    parser.add_argument('--base-port', type=int, default=9100, help='port of the first marketplace')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def from_arguments(args: argparse.Namespace, host: str = '127.0.0.1') -> MarketplaceStandin:
+    overrides = {}
+    if args.config:
+        with open(args.config) as f:
+            overrides = json.load(f)
+    return MarketplaceStandin(host, args.base_port, args.latency, args.error_rate, args.cards, args.chrome_blocks,
+                              args.bytes_per_second, overrides, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    standin = from_arguments(args, args.host)
+    standin.start()
+    print(f"MARKETPLACE_URLS={standin.marketplace_urls()}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == '__main__':
+    main()
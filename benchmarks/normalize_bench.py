@@ -0,0 +1,135 @@
+"""Compare the compiled title normalization and price extraction with the
+original per-call implementations.
+
+The legacy functions below are verbatim copies of the code they replaced.
+The run checks that titles normalize identically and that both extractors
+find the same set of price values (the legacy one also reports overlapping
+duplicates), on whole pages and on the batch of parsed product prices that
+every search results page goes through, then prints timings for each.
+
+Usage: python -m benchmarks.normalize_bench [--iterations N]
+"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_scraper import PriceScraper  # noqa: E402
+from text_normalization import clean_title  # noqa: E402
+from benchmarks.parser_bench import load_fixtures, parse_page  # noqa: E402
+
+
+def legacy_clean_product_title(title: str) -> str:
+    if not title:
+        return ""
+    stop_words = ['gaming', 'monitor', 'inches', 'curved', 'ultra', 'hd', 'hz', 'ms', 'amd', 'freesync', 'nvidia', 'g-sync', 'adaptive', 'sync', 'technology', 'oled', 'qhd', 'uhd', 'display', 'studio', 'portable', 'with', 'for', 'by', 'gen', 'inch']
+    cleaned = re.sub(r'\b(amazon|ebay|walmart|target)\b', '', title, flags=re.IGNORECASE)
+    words = cleaned.split()
+    cleaned_words = [word for word in words if word.lower() not in stop_words]
+    cleaned = ' '.join(cleaned_words)
+    cleaned = re.sub(r'[^\w\s-]', ' ', cleaned)
+    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+    return cleaned
+
+
+def legacy_extract_prices_from_text(text: str, selectors: list) -> list:
+    prices = []
+    for pattern in selectors:
+        matches = re.findall(pattern, text, re.IGNORECASE)
+        for match in matches:
+            price_str = re.sub(r'[^\d.,]', '', match)
+            if price_str and '.' in price_str:
+                try:
+                    price_value = float(price_str.replace(',', ''))
+                    if 1 <= price_value <= 10000:
+                        prices.append({
+                            'price': f"${price_value:.2f}",
+                            'raw_text': match
+                        })
+                except ValueError:
+                    continue
+    return prices
+
+
+def timed(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    scraper = PriceScraper()
+    fixtures = load_fixtures()
+    with contextlib.redirect_stdout(io.StringIO()):
+        products = {f['file']: parse_page(scraper, f['html'], f['marketplace'], f['query']) for f in fixtures}
+    titles = [p['title'] for f in fixtures for p in products[f['file']]]
+    titles += [f['query'] for f in fixtures]
+    # Display prices of each page's products, as _label_products extracts them
+    product_prices = [(f['marketplace'], [p.get('price') or '' for p in products[f['file']]]) for f in fixtures]
+
+    failures = []
+    for title in titles:
+        if clean_title(title) != legacy_clean_product_title(title):
+            failures.append(f"title differs: {title!r}")
+
+    legacy_count = new_count = 0
+    for fixture in fixtures:
+        selectors = scraper.marketplaces[fixture['marketplace']]['price_selectors']
+        legacy = legacy_extract_prices_from_text(fixture['html'], selectors)
+        new = scraper.extract_prices_from_text(fixture['html'], fixture['marketplace'])
+        legacy_count += len(legacy)
+        new_count += len(new)
+        if {p['price'] for p in legacy} != {p['price'] for p in new}:
+            failures.append(f"price values differ: {fixture['file']}")
+    for marketplace, prices in product_prices:
+        selectors = scraper.marketplaces[marketplace]['price_selectors']
+        legacy = [[p['price'] for p in legacy_extract_prices_from_text(price, selectors)][:1] for price in prices]
+        new = [[p['price'] for p in found][:1] for found in scraper.extract_prices_batch(prices, marketplace)]
+        if legacy != new:
+            failures.append(f"product price values differ: {marketplace}")
+
+    # Cold calls measure the compiled pipeline itself; warm calls hit the memo cache
+    def compiled_cold():
+        clean_title.cache_clear()
+        for title in titles:
+            clean_title(title)
+
+    rows = [
+        ('clean_product_title legacy', timed(lambda: [legacy_clean_product_title(t) for t in titles], args.iterations), len(titles)),
+        ('clean_product_title compiled', timed(compiled_cold, args.iterations), len(titles)),
+        ('clean_product_title memoized', timed(lambda: [clean_title(t) for t in titles], args.iterations), len(titles)),
+    ]
+    legacy_pages = lambda: [legacy_extract_prices_from_text(f['html'], scraper.marketplaces[f['marketplace']]['price_selectors'])
+                            for f in fixtures]
+    compiled_pages = lambda: [scraper.extract_prices_from_text(f['html'], f['marketplace']) for f in fixtures]
+    rows.append(('extract_prices legacy', timed(legacy_pages, max(1, args.iterations // 4)), len(fixtures)))
+    rows.append(('extract_prices compiled', timed(compiled_pages, max(1, args.iterations // 4)), len(fixtures)))
+    legacy_products = lambda: [[legacy_extract_prices_from_text(price, scraper.marketplaces[m]['price_selectors'])
+                                for price in prices] for m, prices in product_prices]
+    batched_products = lambda: [scraper.extract_prices_batch(prices, m) for m, prices in product_prices]
+    product_count = sum(len(prices) for _, prices in product_prices)
+    rows.append(('product prices legacy', timed(legacy_products, args.iterations), product_count))
+    rows.append(('product prices batch', timed(batched_products, args.iterations), product_count))
+
+    print(f"{'function':<32}{'ms/batch':>10}{'items':>8}")
+    for name, seconds, items in rows:
+        print(f"{name:<32}{seconds * 1000:>10.3f}{items:>8}")
+    print(f"\nprices reported: legacy={legacy_count} compiled={new_count} (duplicates removed: {legacy_count - new_count})")
+
+    for failure in failures:
+        print(f"MISMATCH: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Parsing throughput with and without the parser process pool.
+
+Parses the saved search pages from many threads at once, as concurrent
+marketplace searches do, first in-process and then through ParsePool with
+1..N worker processes. Reports pages/sec and the speedup over in-process
+parsing, and checks that pool output matches in-process output.
+
+Usage:
+    python -m benchmarks.parse_pool_bench [--pages N] [--max-processes N] [--json results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.parser_bench import load_fixtures  # noqa: E402
+from parse_pool import ParsePool, parse_page  # noqa: E402
+
+
+def run(pool: ParsePool, fixtures: list, pages: int) -> float:
+    """Parse pages pages from concurrent threads; returns pages/sec."""
+    work = [fixtures[i % len(fixtures)] for i in range(pages)]
+    with ThreadPoolExecutor(max_workers=max(pool.queue_size, 8)) as threads:
+        start = time.perf_counter()
+        list(threads.map(lambda f: pool.parse(f['marketplace'], f['html'], f['query']), work))
+        return pages / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=100, help='pages parsed per configuration')
+    parser.add_argument('--max-processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--json', help='write the machine-readable report to this path')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    report = {'pages': args.pages, 'cpu_count': os.cpu_count(), 'runs': []}
+
+    inline = run(ParsePool(processes=0), fixtures, args.pages)
+    report['runs'].append({'processes': 0, 'pages_per_sec': round(inline, 1), 'speedup': 1.0})
+
+    mismatches = []
+    for processes in range(1, args.max_processes + 1):
+        pool = ParsePool(processes=processes, min_bytes=0)
+        try:
+            # Start the workers and check their output before timing
+            for fixture in fixtures:
+                if pool.parse(fixture['marketplace'], fixture['html'], fixture['query']) != \
+                        parse_page(fixture['marketplace'], fixture['html'], fixture['query']):
+                    mismatches.append(f"{fixture['file']}: pool output differs with {processes} processes")
+            rate = run(pool, fixtures, args.pages)
+        finally:
+            pool.shutdown()
+        report['runs'].append({'processes': processes, 'pages_per_sec': round(rate, 1),
+                               'speedup': round(rate / inline, 2)})
+
+    print(f"{'processes':<12}{'pages/s':>10}{'speedup':>10}")
+    for entry in report['runs']:
+        label = entry['processes'] or 'in-process'
+        print(f"{label:<12}{entry['pages_per_sec']:>10}{entry['speedup']:>10}")
+
+    report['mismatches'] = mismatches
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    for mismatch in mismatches:
+        print(f"MISMATCH: {mismatch}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
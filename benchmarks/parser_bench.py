@@ -0,0 +1,243 @@
+"""Offline benchmark and golden-output check for the scraping pipeline.
+
+Runs the parsers (extract_product_info_from_search, _scrape_jbhifi,
+_scrape_thegoodguys), extract_prices_from_text and _find_best_match over
+the saved pages listed in fixtures/manifest.json. Reports pages/sec,
+latency percentiles, peak memory and product counts for each stage, and
+exits non-zero if any output differs from the stored golden files.
+
+It also matches every fixture's query against the products of all pages at
+once, per page with _find_best_match and as one cross-marketplace batch
+with ProductMatcher.best_matches, and fails if the two pick different
+matches.
+
+Usage:
+    python -m benchmarks.parser_bench [--iterations N] [--json results.json]
+    python -m benchmarks.parser_bench --update-golden
+"""
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_scraper import PriceScraper  # noqa: E402
+from product_matcher import ProductMatcher  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+GOLDEN_DIR = os.path.join(BENCH_DIR, 'golden')
+
+
+def load_fixtures() -> list:
+    with open(os.path.join(FIXTURES_DIR, 'manifest.json')) as f:
+        manifest = json.load(f)
+    for entry in manifest:
+        path = os.path.join(FIXTURES_DIR, entry['file'])
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            entry['html'] = f.read().decode('utf-8')
+    return manifest
+
+
+def parse_page(scraper: PriceScraper, html: str, marketplace: str, query: str) -> list:
+    """Dispatch to the same parser search_marketplace would use."""
+    if marketplace == 'jbhifi_au':
+        return scraper._scrape_jbhifi(html)
+    if marketplace == 'thegoodguys_au':
+        return scraper._scrape_thegoodguys(html)
+    return scraper.extract_product_info_from_search(html, scraper.clean_product_title(query), marketplace)
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn, iterations: int) -> dict:
+    """Time fn over several iterations and record its peak traced memory once."""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {'timings': timings, 'peak_bytes': peak}
+
+
+def golden_output(scraper: PriceScraper, fixture: dict) -> dict:
+    """Canonical outputs of every stage for one fixture."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        products = parse_page(scraper, fixture['html'], fixture['marketplace'], fixture['query'])
+        prices = scraper.extract_prices_from_text(fixture['html'], fixture['marketplace'])
+        best_match = scraper._find_best_match(products, fixture['query'])
+    prices_json = json.dumps(prices, sort_keys=True)
+    return {
+        'products': products,
+        'prices': {'count': len(prices), 'sha256': hashlib.sha256(prices_json.encode('utf-8')).hexdigest()},
+        'best_match': best_match
+    }
+
+
+def golden_path(fixture: dict) -> str:
+    name = fixture['file'].split('.')[0]
+    return os.path.join(GOLDEN_DIR, f"{name}.json")
+
+
+def run(iterations: int) -> dict:
+    scraper = PriceScraper()
+    fixtures = load_fixtures()
+    stages = {
+        'parse': lambda f: (lambda: parse_page(scraper, f['html'], f['marketplace'], f['query'])),
+        'extract_prices': lambda f: (lambda: scraper.extract_prices_from_text(f['html'], f['marketplace'])),
+        'find_best_match': lambda f: (lambda products=parse_page(scraper, f['html'], f['marketplace'], f['query']):
+                                      scraper._find_best_match(products, f['query'])),
+    }
+    report = {'iterations': iterations, 'fixtures': len(fixtures), 'stages': {}, 'pages': []}
+    for stage, make_fn in stages.items():
+        timings = []
+        peak = 0
+        for fixture in fixtures:
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn = make_fn(fixture)
+            result = measure(fn, iterations)
+            timings.extend(result['timings'])
+            peak = max(peak, result['peak_bytes'])
+        total = sum(timings)
+        report['stages'][stage] = {
+            'pages_per_sec': round(len(timings) / total, 1) if total else None,
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            'p99_ms': round(percentile(timings, 99) * 1000, 3),
+            'peak_mem_kib': round(peak / 1024, 1)
+        }
+    for fixture in fixtures:
+        output = golden_output(scraper, fixture)
+        report['pages'].append({
+            'file': fixture['file'],
+            'marketplace': fixture['marketplace'],
+            'bytes': len(fixture['html'].encode('utf-8')),
+            'products': len(output['products']),
+            'prices': output['prices']['count'],
+            'matched': bool(output['best_match'])
+        })
+    return report
+
+
+def compare_batch_matching(scraper: PriceScraper, fixtures: list, iterations: int) -> tuple:
+    """Time matching each query against every page, page by page and as one batch.
+
+    Returns ({'per_page_ms', 'batch_ms', 'candidates'}, mismatches).
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        pages = {f['file']: parse_page(scraper, f['html'], f['marketplace'], f['query']) for f in fixtures}
+    queries = [f['query'] for f in fixtures]
+
+    def per_page():
+        matches = []
+        for query in queries:
+            matcher = ProductMatcher(query)
+            best = {}
+            for page, products in pages.items():
+                found = scraper._find_best_match(products, query, matcher)
+                if found:
+                    best[page] = (found[0]['match_score'], found[0]['title'])
+            matches.append(best)
+        return matches
+
+    def batch():
+        return [{page: (score, product['title']) for page, (score, product) in
+                 ProductMatcher(query).best_matches(pages).items()} for query in queries]
+
+    mismatches = [f"batch matching differs for query {query!r}"
+                  for query, expected, actual in zip(queries, per_page(), batch()) if expected != actual]
+    per_page_seconds = min(measure(per_page, iterations)['timings'])
+    batch_seconds = min(measure(batch, iterations)['timings'])
+    return {
+        'queries': len(queries),
+        'candidates': sum(len(products) for products in pages.values()),
+        'per_page_ms': round(per_page_seconds * 1000, 3),
+        'batch_ms': round(batch_seconds * 1000, 3)
+    }, mismatches
+
+
+def check_golden(update: bool) -> list:
+    """Compare outputs with the golden files; returns the fixtures that differ."""
+    scraper = PriceScraper()
+    mismatches = []
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    for fixture in load_fixtures():
+        output = json.loads(json.dumps(golden_output(scraper, fixture)))
+        path = golden_path(fixture)
+        if update:
+            with open(path, 'w') as f:
+                json.dump(output, f, indent=2, sort_keys=True)
+                f.write('\n')
+            continue
+        if not os.path.exists(path):
+            mismatches.append(f"{fixture['file']}: no golden output (run with --update-golden)")
+            continue
+        with open(path) as f:
+            expected = json.load(f)
+        for key in ('products', 'prices', 'best_match'):
+            if output[key] != expected[key]:
+                mismatches.append(f"{fixture['file']}: {key} differs from golden output")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5, help='timed runs per fixture and stage')
+    parser.add_argument('--json', help='write the machine-readable report to this path')
+    parser.add_argument('--update-golden', action='store_true', help='rewrite golden outputs from current code')
+    args = parser.parse_args()
+
+    mismatches = check_golden(args.update_golden)
+    if args.update_golden:
+        print(f"Golden outputs written to {GOLDEN_DIR}")
+        return 0
+
+    report = run(args.iterations)
+    report['batch_matching'], batch_mismatches = compare_batch_matching(PriceScraper(), load_fixtures(),
+                                                                        args.iterations)
+    mismatches += batch_mismatches
+    report['golden_mismatches'] = mismatches
+
+    print(f"{'stage':<18}{'pages/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>12}")
+    for stage, stats in report['stages'].items():
+        print(f"{stage:<18}{stats['pages_per_sec']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['peak_mem_kib']:>12}")
+    print()
+    for page in report['pages']:
+        print(f"{page['file']:<34}{page['bytes'] // 1024:>6} KiB  products={page['products']:<4}"
+              f"prices={page['prices']:<5}matched={page['matched']}")
+    batch = report['batch_matching']
+    print(f"\nmatching {batch['queries']} queries against all {batch['candidates']} candidates: "
+          f"per page {batch['per_page_ms']} ms, cross-marketplace batch {batch['batch_ms']} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if mismatches:
+        print()
+        for mismatch in mismatches:
+            print(f"GOLDEN MISMATCH: {mismatch}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Path to your ChromeDriver executable
+CHROMEDRIVER_PATH = '/Users/sheridangomes/PricePulse/chromedriver' # Adjust this path if you placed it elsewhere
+
+# Pool settings
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', 3))
+BROWSER_MAX_PAGES = int(os.getenv('BROWSER_MAX_PAGES', 50))
+BROWSER_ACQUIRE_TIMEOUT = float(os.getenv('BROWSER_ACQUIRE_TIMEOUT', 30))
+
+# Light browsing: skip heavy assets and stop waiting once product cards are in the DOM
+BROWSER_LIGHT_MODE = os.getenv('BROWSER_LIGHT_MODE', 'true').lower() == 'true'
+BROWSER_WAIT_TIMEOUT = float(os.getenv('BROWSER_WAIT_TIMEOUT', 5))
+BROWSER_FULL_WAIT_TIMEOUT = float(os.getenv('BROWSER_FULL_WAIT_TIMEOUT', 10))
+
+# Requests Chrome drops in light mode: images, media, fonts and common third-party hosts
+BLOCKED_URL_PATTERNS = [
+    '*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.avif*', '*.svg*', '*.ico*',
+    '*.mp4*', '*.webm*', '*.m3u8*', '*.mp3*',
+    '*.woff*', '*.ttf*', '*.otf*', '*.eot*',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*googlesyndication.com*',
+    '*facebook.net*', '*facebook.com/tr*', '*hotjar.com*', '*criteo.*', '*bing.com/bat*',
+    '*tiktok.com*', '*pinterest.com*', '*clarity.ms*', '*newrelic.com*', '*nr-data.net*',
+    '*quantummetric.com*', '*adobedtm.com*', '*demdex.net*', '*omtrdc.net*', '*optimizely.com*'
+]
+
+
+class BrowserSession:
+    """A long-lived headless Chrome session checked out from the pool."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created = time.time()
+        self.blocking = False
+
+    def set_blocking(self, enabled: bool):
+        """Turn light-mode request blocking on or off for the next page loads."""
+        if enabled == self.blocking:
+            return
+        if enabled:
+            self.driver.execute_cdp_cmd('Network.enable', {})
+        self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS if enabled else []})
+        self.blocking = enabled
+
+    def is_healthy(self) -> bool:
+        """Check the browser still responds to commands."""
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning("Error closing browser session: %s", e)
+
+
+class BrowserPool:
+    """Bounded pool of warm headless Chrome sessions.
+
+    Sessions are recycled after max_pages page loads or when they crash, and
+    at most max_size browsers are alive at any time.
+    """
+
+    def __init__(self, max_size: int = BROWSER_POOL_SIZE, max_pages: int = BROWSER_MAX_PAGES):
+        self.max_size = max_size
+        self.max_pages = max_pages
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._closed = False
+
+    def _create_session(self) -> BrowserSession:
+        # Selenium is only imported once a browser is actually needed
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--no-sandbox")
+        options.add_argument("window-size=1920x1080")
+        # Return from get() at DOMContentLoaded; fetch() decides how much longer to wait
+        options.page_load_strategy = 'eager'
+        service = Service(CHROMEDRIVER_PATH)
+        return BrowserSession(webdriver.Chrome(service=service, options=options))
+
+    def acquire(self, timeout: float = BROWSER_ACQUIRE_TIMEOUT) -> BrowserSession:
+        """Check out a healthy session, starting a new browser if the pool has room."""
+        deadline = time.time() + timeout
+        while True:
+            if self._closed:
+                raise RuntimeError("Browser pool is shut down")
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                session = None
+
+            if session is not None:
+                if session.is_healthy():
+                    return session
+                self._discard(session)
+                continue
+
+            with self._lock:
+                can_create = self._size < self.max_size
+                if can_create:
+                    self._size += 1
+            if can_create:
+                try:
+                    return self._create_session()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                    raise
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError("Timed out waiting for a browser session")
+            # Poll so a slot freed by a discarded session is noticed too
+            try:
+                session = self._idle.get(timeout=min(remaining, 0.5))
+            except queue.Empty:
+                continue
+            self._idle.put(session)
+
+    def release(self, session: BrowserSession, broken: bool = False):
+        """Return a session to the pool, recycling it if it crashed or is worn out."""
+        session.pages += 1
+        if broken or self._closed or session.pages >= self.max_pages:
+            self._discard(session)
+        else:
+            self._idle.put(session)
+
+    def _discard(self, session: BrowserSession):
+        session.quit()
+        with self._lock:
+            self._size -= 1
+
+    @contextmanager
+    def session(self):
+        """Context manager that checks a session out and always returns it."""
+        session = self.acquire()
+        broken = False
+        try:
+            yield session
+        except Exception:
+            broken = not session.is_healthy()
+            raise
+        finally:
+            self.release(session, broken=broken)
+
+    def fetch(self, url: str, wait_selector: str = None, light: bool = BROWSER_LIGHT_MODE) -> tuple:
+        """Load a page in a pooled browser and return (html, complete).
+
+        In light mode images, media, fonts and known third-party hosts are
+        blocked and the page is read as soon as wait_selector (a CSS selector
+        for the marketplace's product cards) matches, or after
+        BROWSER_WAIT_TIMEOUT. Otherwise the page is read once fully loaded.
+        complete is False if the wait timed out and the HTML is whatever had
+        rendered by then.
+        """
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        with self.session() as session:
+            session.set_blocking(light)
+            session.driver.get(url)
+            complete = True
+            try:
+                if light:
+                    WebDriverWait(session.driver, BROWSER_WAIT_TIMEOUT).until(
+                        EC.presence_of_element_located((By.CSS_SELECTOR, wait_selector or 'body')))
+                else:
+                    WebDriverWait(session.driver, BROWSER_FULL_WAIT_TIMEOUT).until(
+                        lambda driver: driver.execute_script('return document.readyState') == 'complete')
+            except TimeoutException:
+                # Parse whatever has rendered; the parser reports an empty page if nothing has
+                logger.debug("Timed out waiting for %s on %s", wait_selector or 'page load', url)
+                complete = False
+            return session.driver.page_source, complete
+
+    def stats(self) -> dict:
+        return {
+            'size': self._size,
+            'idle': self._idle.qsize(),
+            'max_size': self.max_size,
+            'max_pages': self.max_pages
+        }
+
+    def shutdown(self):
+        """Quit every idle browser; sessions still checked out are closed on release."""
+        self._closed = True
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(session)
+
+
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Return the process-wide browser pool, creating it on first use."""
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool()
+            atexit.register(_browser_pool.shutdown)
+        return _browser_pool
+
+
+def shutdown_browser_pool():
+    """Close all pooled browsers (called when the server exits)."""
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is not None:
+            _browser_pool.shutdown()
+            _browser_pool = None
@@ -0,0 +1,176 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Fetch backend settings
+FETCH_MODE = os.getenv('FETCH_MODE', 'live')  # live, record, replay or cache
+FETCH_STORE_DIR = os.getenv('FETCH_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fetch_store'))
+FETCH_REPLAY_LATENCY = os.getenv('FETCH_REPLAY_LATENCY', '')  # seconds, e.g. "0.3" or "0.1-1.5"
+FETCH_CACHE_TTL = float(os.getenv('FETCH_CACHE_TTL', 300))
+
+FETCH_MODES = ('live', 'record', 'replay', 'cache')
+
+# Set by live fetches whose body was cut short (early stop, render timeout); such pages are never stored
+TRUNCATED_HEADER = 'X-Fetch-Truncated'
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+class FetchStore:
+    """Compressed, content-addressed store of fetched pages.
+
+    Bodies are gzip files named by the SHA-256 of their content, so identical
+    pages are stored once. A small JSON index entry per URL records the
+    status, headers, fetch time and body hash.
+    """
+
+    def __init__(self, root: str = FETCH_STORE_DIR):
+        self.root = root
+        self.bodies_dir = os.path.join(root, 'bodies')
+        self.index_dir = os.path.join(root, 'index')
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, url: str, body: str, headers: dict = None, status: int = 200, backend: str = 'requests'):
+        encoded = body.encode('utf-8')
+        body_hash = hashlib.sha256(encoded).hexdigest()
+        body_path = os.path.join(self.bodies_dir, f"{body_hash}.gz")
+        if not os.path.exists(body_path):
+            self._write_atomic(body_path, gzip.compress(encoded, mtime=0))
+        entry = {
+            'url': url,
+            'status': status,
+            'headers': dict(headers or {}),
+            'backend': backend,
+            'body_sha256': body_hash,
+            'fetched_at': time.time()
+        }
+        self._write_atomic(os.path.join(self.index_dir, f"{url_key(url)}.json"), json.dumps(entry).encode('utf-8'))
+
+    def get(self, url: str):
+        """Return the stored entry for url with its 'body', or None if not recorded."""
+        index_path = os.path.join(self.index_dir, f"{url_key(url)}.json")
+        try:
+            with open(index_path) as f:
+                entry = json.load(f)
+            with gzip.open(os.path.join(self.bodies_dir, f"{entry['body_sha256']}.gz"), 'rb') as f:
+                entry['body'] = f.read().decode('utf-8')
+        except (OSError, ValueError, KeyError):
+            return None
+        return entry
+
+
+def _parse_latency(spec: str):
+    """Parse "0.3" or "0.1-1.5" into a (low, high) range in seconds."""
+    if not spec:
+        return None
+    low, _, high = spec.partition('-')
+    return float(low), float(high or low)
+
+
+class FetchBackend:
+    """Chooses between live fetching, recording and replaying from a FetchStore.
+
+    - live: always fetch from the site
+    - record: fetch live and save every complete 200 response to the store
+    - replay: serve only from the store, optionally with simulated latency
+    - cache: serve from the store when younger than cache_ttl, else record
+    """
+
+    def __init__(self, mode: str = FETCH_MODE, store_dir: str = FETCH_STORE_DIR,
+                 replay_latency: str = FETCH_REPLAY_LATENCY, cache_ttl: float = FETCH_CACHE_TTL):
+        if mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode: {mode}")
+        self.mode = mode
+        self.store = FetchStore(store_dir) if mode != 'live' else None
+        self.replay_latency = _parse_latency(replay_latency)
+        self.cache_ttl = cache_ttl
+
+    @property
+    def records(self) -> bool:
+        """Whether live fetches are saved; callers should then read whole pages rather than stop early."""
+        return self.mode in ('record', 'cache')
+
+    @staticmethod
+    def _storable(status: int, headers: dict) -> bool:
+        # An error page must not replace a recording or be replayed as one, nor a page that was cut short
+        return status == 200 and TRUNCATED_HEADER not in (headers or {})
+
+    def fetch(self, url: str, live_fetch, backend: str = 'requests') -> str:
+        """Return the page body for url; live_fetch() -> (status, headers, body)."""
+        if self.mode == 'live':
+            status, _, body = live_fetch()
+            return body if status == 200 else ""
+
+        if self.mode in ('replay', 'cache'):
+            entry = self.store.get(url)
+            if entry is not None and (self.mode == 'replay' or time.time() - entry['fetched_at'] <= self.cache_ttl):
+                if self.mode == 'replay' and self.replay_latency:
+                    time.sleep(random.uniform(*self.replay_latency))
+                return entry['body'] if entry['status'] == 200 else ""
+            if self.mode == 'replay':
+                logger.warning("No recorded response for %s", url)
+                return ""
+
+        status, headers, body = live_fetch()
+        if self._storable(status, headers):
+            self.store.put(url, body, headers, status, backend)
+        return body if status == 200 else ""
+
+    async def fetch_async(self, url: str, live_fetch, backend: str = 'requests') -> str:
+        """Async form of fetch; live_fetch() is awaited. Store reads and writes run on worker threads."""
+        if self.mode == 'live':
+            status, _, body = await live_fetch()
+            return body if status == 200 else ""
+
+        if self.mode in ('replay', 'cache'):
+            entry = await asyncio.to_thread(self.store.get, url)
+            if entry is not None and (self.mode == 'replay' or time.time() - entry['fetched_at'] <= self.cache_ttl):
+                if self.mode == 'replay' and self.replay_latency:
+                    await asyncio.sleep(random.uniform(*self.replay_latency))
+                return entry['body'] if entry['status'] == 200 else ""
+            if self.mode == 'replay':
+                logger.warning("No recorded response for %s", url)
+                return ""
+
+        status, headers, body = await live_fetch()
+        if self._storable(status, headers):
+            await asyncio.to_thread(self.store.put, url, body, headers, status, backend)
+        return body if status == 200 else ""
+
+
+_fetch_backend = None
+_fetch_backend_lock = threading.Lock()
+
+
+def get_fetch_backend() -> FetchBackend:
+    """Return the process-wide fetch backend configured from the environment."""
+    global _fetch_backend
+    with _fetch_backend_lock:
+        if _fetch_backend is None:
+            _fetch_backend = FetchBackend()
+        return _fetch_backend
+
+
+def set_fetch_backend(backend: FetchBackend):
+    """Swap the process-wide fetch backend (e.g. to replay mode for a load test)."""
+    global _fetch_backend
+    with _fetch_backend_lock:
+        _fetch_backend = backend
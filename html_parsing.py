@@ -0,0 +1,32 @@
+import os
+from bs4 import BeautifulSoup, SoupStrainer
+
+
+def _default_parser() -> str:
+    """Prefer the C-based lxml parser when it is installed."""
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+# Parser backend used for all marketplace pages: 'lxml' or 'html.parser'
+HTML_PARSER = os.getenv('HTML_PARSER') or _default_parser()
+
+SUPPORTED_PARSERS = ('lxml', 'html.parser')
+
+
+def make_soup(html_content, parse_only: SoupStrainer = None, parser: str = None) -> BeautifulSoup:
+    """Parse HTML with the configured backend.
+
+    When parse_only is given only the matching elements (and their subtrees)
+    are built, which skips the navigation, scripts and footer markup that
+    make up most of a search results page.
+    """
+    parser = parser or HTML_PARSER
+    if parser not in SUPPORTED_PARSERS:
+        raise ValueError(f"Unsupported HTML parser: {parser}")
+    if isinstance(html_content, bytes):
+        return BeautifulSoup(html_content, parser, parse_only=parse_only, from_encoding="utf-8")
+    return BeautifulSoup(html_content, parser, parse_only=parse_only)
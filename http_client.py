@@ -0,0 +1,131 @@
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Fetch settings (seconds)
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 15))
+MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 2))
+BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 0.5))
+BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', 8))
+DEFAULT_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 4))
+
+# Only retry methods that are safe to repeat
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _accept_encoding() -> str:
+    """Advertise only the encodings urllib3 can actually decode here."""
+    encodings = ['gzip', 'deflate']
+    try:
+        import brotli  # noqa: F401
+        encodings.append('br')
+    except ImportError:
+        try:
+            import brotlicffi  # noqa: F401
+            encodings.append('br')
+        except ImportError:
+            pass
+    try:
+        import zstandard  # noqa: F401
+        encodings.append('zstd')
+    except ImportError:
+        pass
+    return ', '.join(encodings)
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': _accept_encoding(),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+def backoff_delay(attempt: int, retry_after: str = '') -> float:
+    """Exponential backoff with full jitter, honouring a numeric Retry-After when given."""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+class FetchClient:
+    """Shared HTTP client with keep-alive connection pools, timeouts and retries.
+
+    Each marketplace host gets its own adapter so its pool size can be tuned
+    separately; other hosts share the default adapter.
+    """
+
+    def __init__(self, connect_timeout: float = CONNECT_TIMEOUT, read_timeout: float = READ_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, pool_size: int = DEFAULT_POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        default_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', default_adapter)
+        self.session.mount('https://', default_adapter)
+
+    def configure_host(self, base_url: str, pool_size: int = DEFAULT_POOL_SIZE):
+        """Give a host its own connection pool of the given size."""
+        parts = urlsplit(base_url)
+        prefix = f"{parts.scheme}://{parts.netloc}/"
+        with self._lock:
+            if self._hosts.get(prefix) == pool_size:
+                return
+            self._hosts[prefix] = pool_size
+            self.session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
+
+    def request(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+        """Send a request, retrying idempotent methods on transient failures."""
+        method = method.upper()
+        retries = self.max_retries if method in IDEMPOTENT_METHODS else 0
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.info("Retrying %s in %.2fs after error: %s", url, delay, e)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                delay = backoff_delay(attempt, response.headers.get('Retry-After', ''))
+                response.close()
+                logger.info("Retrying %s in %.2fs after HTTP %d", url, delay, response.status_code)
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> FetchClient:
+    """Return the process-wide fetch client, creating it on first use."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = FetchClient()
+        return _http_client
@@ -0,0 +1,229 @@
+"""Per-marketplace health: rolling outcome and latency stats, circuit breakers and hedge delays.
+
+A marketplace whose searches keep failing (no content or an exception) is
+skipped for a cooldown instead of being scraped on every comparison. Once
+the cooldown passes, one probe search is let through: success closes the
+breaker, failure opens it again for twice as long (up to
+BREAKER_MAX_COOLDOWN). The p95 of recent fetch latencies is the delay
+after which a slow fetch is hedged with a second one.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from metrics import REGISTRY
+
+# Rolling window of recent searches per marketplace
+HEALTH_WINDOW = int(os.getenv('HEALTH_WINDOW', 100))
+HEALTH_WINDOW_SECONDS = float(os.getenv('HEALTH_WINDOW_SECONDS', 600))
+
+# Circuit breaker settings
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))  # consecutive failures that open the breaker
+BREAKER_ERROR_RATE = float(os.getenv('BREAKER_ERROR_RATE', 0.5))  # or this error rate over the window...
+BREAKER_MIN_SAMPLES = int(os.getenv('BREAKER_MIN_SAMPLES', 10))  # ...once it holds this many searches
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', 60))
+BREAKER_MAX_COOLDOWN = float(os.getenv('BREAKER_MAX_COOLDOWN', 600))
+# A probe that never reports back (e.g. cancelled) frees the half-open slot after this long
+BREAKER_PROBE_TIMEOUT = float(os.getenv('BREAKER_PROBE_TIMEOUT', 30))
+
+# Hedged fetches
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'true').lower() == 'true'
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 20))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 0.05))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+BREAKER_STATES = (CLOSED, HALF_OPEN, OPEN)
+
+BREAKER_STATE = REGISTRY.gauge(
+    'price_breaker_state',
+    'Circuit breaker state per marketplace: 0 closed, 1 half open, 2 open',
+    ('marketplace',)
+)
+BREAKER_TRIPS = REGISTRY.counter(
+    'price_breaker_trips_total',
+    'Times a marketplace circuit breaker opened',
+    ('marketplace',)
+)
+HEDGED_FETCHES = REGISTRY.counter(
+    'price_hedged_fetches_total',
+    'Fetches hedged with a second request, by whose content was used (none if neither had any)',
+    ('marketplace', 'winner')
+)
+
+
+class BreakerOpen(Exception):
+    """A search was not let through because the marketplace's circuit breaker is open (or probing)."""
+
+    def __init__(self, marketplace: str, retry_in: float = 0.0):
+        super().__init__(f"Circuit breaker open for {marketplace}")
+        self.marketplace = marketplace
+        self.retry_in = retry_in
+
+
+def _percentile(ordered: list, pct: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+class MarketplaceHealth:
+    """Rolling stats and circuit breaker for one marketplace."""
+
+    def __init__(self, marketplace: str):
+        self.marketplace = marketplace
+        self.samples = deque(maxlen=HEALTH_WINDOW)  # (finished_at, ok, fetch_seconds)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.probe_started = None
+        self.trips = 0
+
+    def _prune(self, now: float):
+        while self.samples and now - self.samples[0][0] > HEALTH_WINDOW_SECONDS:
+            self.samples.popleft()
+
+    def _set_state(self, state: str):
+        self.state = state
+        BREAKER_STATE.set(BREAKER_STATES.index(state), marketplace=self.marketplace)
+
+    def available(self, now: float) -> bool:
+        """Whether a search would be let through now (without claiming a probe)."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return now - self.opened_at >= self.cooldown
+        return self.probe_started is None or now - self.probe_started >= BREAKER_PROBE_TIMEOUT
+
+    def allow(self, now: float) -> bool:
+        """Let a search through, claiming the probe slot once an open breaker has cooled down."""
+        if not self.available(now):
+            return False
+        if self.state != CLOSED:
+            self._set_state(HALF_OPEN)
+            self.probe_started = now
+        return True
+
+    def record(self, now: float, ok: bool, seconds: float):
+        self._prune(now)
+        self.samples.append((now, ok, seconds))
+        if ok:
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                # Probe succeeded: start over with a clean window
+                self.samples.clear()
+                self.samples.append((now, ok, seconds))
+                self.cooldown = BREAKER_COOLDOWN
+                self.probe_started = None
+                self._set_state(CLOSED)
+            return
+
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+            self._open(now)
+        elif self.state == CLOSED and (self.consecutive_failures >= BREAKER_FAILURES or
+                                       (len(self.samples) >= BREAKER_MIN_SAMPLES and
+                                        self.error_rate() >= BREAKER_ERROR_RATE)):
+            self._open(now)
+
+    def _open(self, now: float):
+        self.opened_at = now
+        self.probe_started = None
+        self.trips += 1
+        BREAKER_TRIPS.inc(marketplace=self.marketplace)
+        self._set_state(OPEN)
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok, _ in self.samples if not ok) / len(self.samples)
+
+    def latencies(self) -> list:
+        return sorted(seconds for _, ok, seconds in self.samples if ok)
+
+    def hedge_delay(self):
+        latencies = self.latencies()
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(_percentile(latencies, 95), HEDGE_MIN_DELAY)
+
+    def stats(self, now: float) -> dict:
+        self._prune(now)
+        latencies = self.latencies()
+        return {
+            'state': self.state,
+            'retry_in': round(max(0.0, self.opened_at + self.cooldown - now), 1) if self.state == OPEN else 0,
+            'cooldown': self.cooldown,
+            'trips': self.trips,
+            'consecutive_failures': self.consecutive_failures,
+            'samples': len(self.samples),
+            'error_rate': round(self.error_rate(), 3),
+            'p50': round(_percentile(latencies, 50), 3) if latencies else None,
+            'p95': round(_percentile(latencies, 95), 3) if latencies else None,
+            'hedge_delay': self.hedge_delay() if HEDGE_ENABLED else None
+        }
+
+
+class HealthTracker:
+    """Health of every marketplace; safe to use from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._health = {}
+
+    def _get(self, marketplace: str) -> MarketplaceHealth:
+        health = self._health.get(marketplace)
+        if health is None:
+            health = self._health[marketplace] = MarketplaceHealth(marketplace)
+        return health
+
+    def available(self, marketplace: str) -> bool:
+        with self._lock:
+            return self._get(marketplace).available(time.time())
+
+    def allow(self, marketplace: str) -> bool:
+        with self._lock:
+            return self._get(marketplace).allow(time.time())
+
+    def record(self, marketplace: str, ok: bool, seconds: float):
+        """Record a finished search: ok is False for a failure (no content or an error)."""
+        with self._lock:
+            self._get(marketplace).record(time.time(), ok, seconds)
+
+    def hedge_delay(self, marketplace: str):
+        """Seconds after which to hedge a fetch, or None to not hedge (too few samples or disabled)."""
+        if not HEDGE_ENABLED:
+            return None
+        with self._lock:
+            return self._get(marketplace).hedge_delay()
+
+    def retry_in(self, marketplace: str) -> float:
+        with self._lock:
+            return self._get(marketplace).stats(time.time())['retry_in']
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.time()
+            return {marketplace: health.stats(now) for marketplace, health in self._health.items()}
+
+    def reset(self, marketplace: str = None):
+        """Forget a marketplace's history and close its breaker (all marketplaces if None)."""
+        with self._lock:
+            for name in ([marketplace] if marketplace else list(self._health)):
+                if self._health.pop(name, None) is not None:
+                    BREAKER_STATE.set(0, marketplace=name)
+
+
+_health_tracker = None
+_health_tracker_lock = threading.Lock()
+
+
+def get_health_tracker() -> HealthTracker:
+    """Return the process-wide marketplace health tracker."""
+    global _health_tracker
+    with _health_tracker_lock:
+        if _health_tracker is None:
+            _health_tracker = HealthTracker()
+        return _health_tracker
@@ -0,0 +1,136 @@
+"""Search results parsers referenced by the marketplace adapters.
+
+Loaded on first use through MarketplaceAdapter.parse, so BeautifulSoup
+and the HTML parser backend are only imported once a page needs parsing.
+"""
+import logging
+import os
+import random
+import re
+from urllib.parse import urljoin
+from bs4 import SoupStrainer
+from html_parsing import make_soup
+
+logger = logging.getLogger(__name__)
+
+# Product card patterns and strainers, compiled once so each page only builds card subtrees
+GENERIC_CARD_CLASS = re.compile(r'product-card|product-item|search-result|item-card', re.I)
+GENERIC_TITLE_CLASS = re.compile(r'product-title|item-title|title', re.I)
+GENERIC_PRICE_CLASS = re.compile(r'price|product-price|item-price', re.I)
+GENERIC_CARD_STRAINER = SoupStrainer(['div', 'li', 'article'], class_=GENERIC_CARD_CLASS)
+JBHIFI_CARD_STRAINER = SoupStrainer('div', attrs={'data-testid': 'product-card-content'})
+THEGOODGUYS_CARD_STRAINER = SoupStrainer('article', attrs={'data-testid': 'product-card'})
+
+# Fraction of empty JB Hi-Fi pages whose raw HTML is logged when DEBUG logging is on
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.05))
+
+
+def parse_generic(html_content: str, query: str, adapter) -> list:
+    """Extract product information from search results HTML content."""
+    products = []
+    soup = make_soup(html_content, parse_only=GENERIC_CARD_STRAINER)
+
+    # Common selectors for product containers
+    product_containers = soup.find_all(['div', 'li', 'article'], class_=GENERIC_CARD_CLASS)
+
+    if not product_containers:
+        logger.debug("No generic product containers found for query: %s on %s", query, adapter.id)
+        return []
+
+    for container in product_containers:
+        title_tag = container.find(['h2', 'h3', 'h4', 'a'], class_=GENERIC_TITLE_CLASS)
+        price_tag = container.find(['span', 'div'], class_=GENERIC_PRICE_CLASS)
+        link_tag = container.find('a', href=True)
+
+        title = title_tag.get_text(strip=True) if title_tag else None
+        price = price_tag.get_text(strip=True) if price_tag else None
+        url = urljoin(adapter.base_url, link_tag['href']) if link_tag else None
+
+        if title and price and url:
+            products.append({
+                'title': title,
+                'price': price,
+                'url': url,
+                'image': ''  # Placeholder
+            })
+    return products
+
+
+def parse_jbhifi(html_content: str, query: str, adapter) -> list:
+    """Scrape product information specifically from JB Hi-Fi search results."""
+    products = []
+    soup = make_soup(html_content, parse_only=JBHIFI_CARD_STRAINER)
+
+    # Look for product tiles using the data-testid attribute
+    product_tiles = soup.find_all('div', attrs={'data-testid': 'product-card-content'})
+
+    if not product_tiles:
+        logger.debug("No product tiles found for JB Hi-Fi with data-testid='product-card-content'.")
+        if logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE:
+            logger.debug("Raw HTML content for JB Hi-Fi (first 1000 chars):\n%s", html_content[:1000])
+
+    for tile in product_tiles:
+        title_tag = tile.find('div', attrs={'data-testid': 'product-card-title'})
+        price_tag = tile.find('span', class_='PriceTag_actual__1eb7mu916')
+        link_tag = tile.find('a', class_='ProductCard_imageLink', href=True)
+        image_tag = tile.find('div', attrs={'data-testid': 'product-card-image-base'}).find('img')
+
+        title = title_tag.get_text(strip=True) if title_tag else None
+        price = price_tag.get_text(strip=True) if price_tag else None
+        url = urljoin(adapter.base_url, link_tag['href']) if link_tag else None
+        image_url = image_tag['src'] if image_tag and 'src' in image_tag.attrs else ''
+
+        if title and price and url:
+            products.append({
+                'title': title,
+                'price': price,
+                'url': url,
+                'image': image_url
+            })
+    return products
+
+
+def parse_thegoodguys(html_content: str, query: str, adapter) -> list:
+    """Scrape product information specifically from The Good Guys search results."""
+    products = []
+    soup = make_soup(html_content, parse_only=THEGOODGUYS_CARD_STRAINER)
+
+    product_tiles = soup.find_all('article', attrs={'data-testid': 'product-card'})
+
+    if not product_tiles:
+        logger.debug("No product tiles found for The Good Guys.")
+
+    for tile in product_tiles:
+        title_tag = tile.find('h4', class_='_title_1pa96_41')
+        price_tag = tile.find('span', attrs={'data-price': 'true', 'data-testid': 'product-card-price-section-price'})
+        link_tag = tile.find('a', class_='_imageLink_1pa96_24', href=True)
+        image_tag = tile.find('a', class_='_imageLink_1pa96_24').find('img')
+
+        title = title_tag.get_text(strip=True) if title_tag else None
+        price = price_tag.get_text(strip=True) if price_tag else None
+        url = urljoin(adapter.base_url, link_tag['href']) if link_tag else None
+        image_url = image_tag['src'] if image_tag and 'src' in image_tag.attrs else ''
+
+        if title and price and url:
+            products.append({
+                'title': title,
+                'price': price,
+                'url': url,
+                'image': image_url
+            })
+    return products
+
+
+# Card matchers: the same elements as the strainers above, tested on a streamed
+# page's elements (tag, attributes) to count product cards as they arrive
+
+def is_generic_card(tag: str, attrs) -> bool:
+    return tag in ('div', 'li', 'article') and bool(GENERIC_CARD_CLASS.search(attrs.get('class', '')))
+
+
+def is_jbhifi_card(tag: str, attrs) -> bool:
+    return tag == 'div' and attrs.get('data-testid') == 'product-card-content'
+
+
+def is_thegoodguys_card(tag: str, attrs) -> bool:
+    return tag == 'article' and attrs.get('data-testid') == 'product-card'
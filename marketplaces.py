@@ -0,0 +1,290 @@
+import importlib
+import os
+import threading
+from urllib.parse import quote_plus, urlsplit
+
+GENERIC_PARSER = 'marketplace_parsers:parse_generic'
+GENERIC_CARD_MATCHER = 'marketplace_parsers:is_generic_card'
+
+# Product cards the generic parser reads; light browsing stops waiting once one is in the DOM
+GENERIC_WAIT_SELECTOR = ('[class*="product-card"], [class*="product-item"], '
+                         '[class*="search-result"], [class*="item-card"]')
+
+# Marketplaces whose pages break in light browsing mode, e.g. "target,target_au"
+LIGHT_BROWSING_DISABLED = {m.strip() for m in os.getenv('LIGHT_BROWSING_DISABLED', '').split(',') if m.strip()}
+
+# Load testing: send marketplaces' requests elsewhere, e.g. to benchmarks/marketplace_standin.py.
+# MARKETPLACE_URLS maps marketplaces to replacement origins: "amazon=http://127.0.0.1:9001,ebay=..."
+MARKETPLACE_URLS = dict(
+    (part.strip() for part in entry.split('=', 1))
+    for entry in os.getenv('MARKETPLACE_URLS', '').split(',') if '=' in entry
+)
+MARKETPLACE_FETCH = os.getenv('MARKETPLACE_FETCH', '')  # force 'requests' or 'selenium' for every marketplace
+MARKETPLACE_RPS = float(os.getenv('MARKETPLACE_RPS', 0))  # replaces each marketplace's own rate limit when > 0
+MARKETPLACE_BURST = int(os.getenv('MARKETPLACE_BURST', 0))
+
+
+def redirect_url(url: str, origin: str) -> str:
+    """url with its scheme and host replaced by origin (which may add a path prefix)."""
+    parts = urlsplit(url)
+    return origin.rstrip('/') + parts.path + (f"?{parts.query}" if parts.query else '')
+
+
+class MarketplaceAdapter:
+    """Declarative description of one marketplace.
+
+    Declares the marketplace's URLs, how its pages are fetched ('requests'
+    or 'selenium'), which parser reads its search results, and its request
+    budget. parser is an import path ('module:function') resolved on first
+    use, so a worker only imports the parsing code, and the libraries behind
+    it, for the marketplaces it actually scrapes.
+
+    prior_match_rate seeds the query planner's statistics. Marketplaces
+    whose results have rarely matched start below PLANNER_MIN_MATCH_RATE,
+    so they are only searched occasionally, to explore, until their
+    statistics say otherwise.
+    """
+
+    def __init__(self, id: str, name: str, region: str, base_url: str, search_url: str, price_selectors: list,
+                 fetch: str = 'requests', parser: str = GENERIC_PARSER, pool_size: int = 2,
+                 requests_per_second: float = 0.5, burst: int = 2, prior_match_rate: float = 0.5,
+                 wait_selector: str = GENERIC_WAIT_SELECTOR, light_browsing: bool = True,
+                 card_matcher: str = GENERIC_CARD_MATCHER):
+        fetch = MARKETPLACE_FETCH or fetch
+        if fetch not in ('requests', 'selenium'):
+            raise ValueError(f"Unknown fetch strategy for {id}: {fetch}")
+        if id in MARKETPLACE_URLS:
+            base_url = redirect_url(base_url, MARKETPLACE_URLS[id])
+            search_url = redirect_url(search_url, MARKETPLACE_URLS[id])
+        self.id = id
+        self.name = name
+        self.region = region
+        self.base_url = base_url
+        self.search_url = search_url
+        self.price_selectors = list(price_selectors)
+        self.fetch = fetch
+        self.parser = parser
+        self.pool_size = pool_size
+        self.requests_per_second = MARKETPLACE_RPS or requests_per_second
+        self.burst = MARKETPLACE_BURST or burst
+        # Share of searches expected to find a match before the query planner has statistics
+        self.prior_match_rate = prior_match_rate
+        # Selenium only: CSS selector for a product card, and whether to browse in light mode
+        self.wait_selector = wait_selector
+        self.light_browsing = light_browsing and id not in LIGHT_BROWSING_DISABLED
+        # Import path of a (tag, attrs) -> bool test for the parser's product cards, used by streaming fetches
+        self.card_matcher = card_matcher
+        self._parse = None
+        self._is_card = None
+        self._lock = threading.Lock()
+
+    @property
+    def use_selenium(self) -> bool:
+        return self.fetch == 'selenium'
+
+    def browser_options(self) -> dict:
+        """Keyword arguments for BrowserPool.fetch."""
+        return {'wait_selector': self.wait_selector, 'light': self.light_browsing}
+
+    def search_url_for(self, query: str) -> str:
+        return self.search_url.format(query=quote_plus(query))
+
+    @staticmethod
+    def _resolve(path: str):
+        module_name, _, function_name = path.partition(':')
+        return getattr(importlib.import_module(module_name), function_name)
+
+    def load_parser(self):
+        """Import the parser function on first use."""
+        if self._parse is None:
+            with self._lock:
+                if self._parse is None:
+                    self._parse = self._resolve(self.parser)
+        return self._parse
+
+    def load_card_matcher(self):
+        """Import the card matcher on first use."""
+        if self._is_card is None:
+            with self._lock:
+                if self._is_card is None:
+                    self._is_card = self._resolve(self.card_matcher)
+        return self._is_card
+
+    def parse(self, html_content: str, query: str) -> list:
+        """Products found on one of this marketplace's search results pages."""
+        return self.load_parser()(html_content, query, self)
+
+    def config(self) -> dict:
+        """Settings in the dict form used by PriceScraper.marketplaces."""
+        return {
+            'name': self.name,
+            'region': self.region,
+            'base_url': self.base_url,
+            'search_url': self.search_url,
+            'price_selectors': list(self.price_selectors),
+            'fetch': self.fetch,
+            'light_browsing': self.light_browsing,
+            'pool_size': self.pool_size,
+            'requests_per_second': self.requests_per_second,
+            'burst': self.burst
+        }
+
+    def describe(self) -> dict:
+        """Public description, as reported by /marketplaces."""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'region': self.region,
+            'base_url': self.base_url,
+            'fetch': self.fetch,
+            'prior_match_rate': self.prior_match_rate,
+            'supported': True
+        }
+
+
+MARKETPLACES = {}
+
+
+def register(adapter: MarketplaceAdapter) -> MarketplaceAdapter:
+    """Add (or replace) a marketplace adapter."""
+    MARKETPLACES[adapter.id] = adapter
+    return adapter
+
+
+def get_adapter(marketplace: str):
+    return MARKETPLACES.get(marketplace)
+
+
+def all_adapters() -> list:
+    return list(MARKETPLACES.values())
+
+
+register(MarketplaceAdapter(
+    'amazon', 'Amazon US', 'us',
+    base_url='https://www.amazon.com',
+    search_url='https://www.amazon.com/s?k={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'Price:\s*\$[\d,]+\.?\d*',
+        r'Currently:\s*\$[\d,]+\.?\d*'
+    ],
+    fetch='selenium',
+    pool_size=2, requests_per_second=0.5, burst=2
+))
+register(MarketplaceAdapter(
+    'amazon_au', 'Amazon AU', 'au',
+    base_url='https://www.amazon.com.au',
+    search_url='https://www.amazon.com.au/s?k={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'AUD\s*\$[\d,]+\.?\d*',
+        r'Price:\s*\$[\d,]+\.?\d*',
+        r'Currently:\s*\$[\d,]+\.?\d*'
+    ],
+    pool_size=4, requests_per_second=0.5, burst=2
+))
+register(MarketplaceAdapter(
+    'ebay', 'eBay US', 'us',
+    base_url='https://www.ebay.com',
+    search_url='https://www.ebay.com/sch/i.html?_nkw={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'US\s*\$[\d,]+\.?\d*',
+        r'Price:\s*\$[\d,]+\.?\d*'
+    ],
+    pool_size=4, requests_per_second=0.5, burst=2,
+    prior_match_rate=0.02
+))
+register(MarketplaceAdapter(
+    'ebay_au', 'eBay AU', 'au',
+    base_url='https://www.ebay.com.au',
+    search_url='https://www.ebay.com.au/sch/i.html?_nkw={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'AU\s*\$[\d,]+\.?\d*',
+        r'AUD\s*\$[\d,]+\.?\d*',
+        r'Price:\s*\$[\d,]+\.?\d*'
+    ],
+    pool_size=4, requests_per_second=0.5, burst=2,
+    prior_match_rate=0.02
+))
+register(MarketplaceAdapter(
+    'walmart', 'Walmart', 'us',
+    base_url='https://www.walmart.com',
+    search_url='https://www.walmart.com/search?q={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'current price\s*\$[\d,]+\.?\d*',
+        r'was\s*\$[\d,]+\.?\d*'
+    ],
+    pool_size=4, requests_per_second=0.3, burst=1,
+    prior_match_rate=0.02
+))
+register(MarketplaceAdapter(
+    'target', 'Target US', 'us',
+    base_url='https://www.target.com',
+    search_url='https://www.target.com/s?searchTerm={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'current price\s*\$[\d,]+\.?\d*',
+        r'reg\s*\$[\d,]+\.?\d*'
+    ],
+    fetch='selenium',
+    pool_size=2, requests_per_second=0.5, burst=2
+))
+register(MarketplaceAdapter(
+    'target_au', 'Target AU', 'au',
+    base_url='https://www.target.com.au',
+    search_url='https://www.target.com.au/s?searchTerm={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'current price\s*\$[\d,]+\.?\d*',
+        r'was\s*\$[\d,]+\.?\d*'
+    ],
+    fetch='selenium',
+    pool_size=2, requests_per_second=0.5, burst=2
+))
+register(MarketplaceAdapter(
+    'jbhifi_au', 'JB Hi-Fi AU', 'au',
+    base_url='https://www.jbhifi.com.au',
+    search_url='https://www.jbhifi.com.au/search?query={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'AUD\s*\$[\d,]+\.?\d*',
+        r'Price:\s*\$[\d,]+\.?\d*',
+        r'Now:\s*\$[\d,]+\.?\d*'
+    ],
+    fetch='selenium',
+    parser='marketplace_parsers:parse_jbhifi',
+    wait_selector='div[data-testid="product-card-content"]',
+    card_matcher='marketplace_parsers:is_jbhifi_card',
+    pool_size=2, requests_per_second=0.5, burst=2
+))
+register(MarketplaceAdapter(
+    'thegoodguys_au', 'The Good Guys AU', 'au',
+    base_url='https://www.thegoodguys.com.au',
+    search_url='https://www.thegoodguys.com.au/search?q={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'AUD\s*\$[\d,]+\.?\d*',
+        r'Price:\s*\$[\d,]+\.?\d*'
+    ],
+    fetch='selenium',
+    parser='marketplace_parsers:parse_thegoodguys',
+    wait_selector='article[data-testid="product-card"]',
+    card_matcher='marketplace_parsers:is_thegoodguys_card',
+    pool_size=2, requests_per_second=0.5, burst=2
+))
+register(MarketplaceAdapter(
+    'mydeal_au', 'MyDeal AU', 'au',
+    base_url='https://www.mydeal.com.au',
+    search_url='https://www.mydeal.com.au/search?q={query}',
+    price_selectors=[
+        r'\$[\d,]+\.?\d*',
+        r'AUD\s*\$[\d,]+\.?\d*',
+        r'Price:\s*\$[\d,]+\.?\d*'
+    ],
+    fetch='selenium',
+    pool_size=2, requests_per_second=0.3, burst=1,
+    prior_match_rate=0.02
+))
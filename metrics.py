@@ -0,0 +1,205 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from profiling import current_profile
+
+# Histogram buckets (seconds) sized for page fetches as well as in-process stages
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items: list) -> list:
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}' for key, value in items]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set."""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Point-in-time value per label set."""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Bucketed observations per label set, exported cumulatively with _sum and _count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = STAGE_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self, **labels) -> dict:
+        """Count, sum and cumulative bucket counts for one label set."""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            if entry is None:
+                return {'count': 0, 'sum': 0.0, 'buckets': {}}
+            counts, total, count = list(entry[0]), entry[1], entry[2]
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            running += bucket_count
+            cumulative[bound] = running
+        return {'count': count, 'sum': total, 'buckets': cumulative}
+
+    def _render_samples(self, items: list) -> list:
+        lines = []
+        for key, (counts, total, count) in items:
+            running = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                running += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, key, le)} {running}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(round(total, 6))}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, label_names: tuple = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: tuple = (),
+                  buckets: tuple = STAGE_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'price_stage_seconds',
+    'Time spent in each comparison pipeline stage.',
+    ('stage', 'marketplace', 'backend')
+)
+MARKETPLACE_SEARCHES = REGISTRY.counter(
+    'price_marketplace_searches_total',
+    'Live marketplace searches by outcome (success, empty or error).',
+    ('marketplace', 'outcome')
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    'price_http_requests_total',
+    'HTTP requests served by endpoint and status code.',
+    ('endpoint', 'method', 'status')
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'price_http_request_seconds',
+    'Time to produce an HTTP response (for streams, until the stream starts).',
+    ('endpoint', 'method')
+)
+
+
+@contextmanager
+def time_stage(stage: str, marketplace: str = '', backend: str = ''):
+    """Record the duration of the enclosed block in price_stage_seconds.
+
+    While a request is being profiled the block is also added to its timeline.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage, marketplace=marketplace, backend=backend)
+        profile = current_profile()
+        if profile is not None:
+            profile.add_span(stage, started, elapsed, marketplace, backend)
+
+
+def observe_stage(stage: str, seconds: float, marketplace: str = '', backend: str = ''):
+    """Record a stage duration measured elsewhere (e.g. time spent queued)."""
+    STAGE_SECONDS.observe(seconds, stage=stage, marketplace=marketplace, backend=backend)
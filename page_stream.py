@@ -0,0 +1,140 @@
+"""Streaming, byte-capped reading of search results pages.
+
+A PageReader decodes a response body chunk by chunk and feeds it to lxml's
+incremental HTML parser, counting the marketplace's product cards as they
+close. Reading stops, and the connection is closed, once max_cards cards
+have arrived or max_bytes of body have been read; the parser then only
+sees that prefix of the page. Bytes read and skipped are counted in the
+price_stream_bytes_total metric.
+"""
+import codecs
+import logging
+import os
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Streaming settings
+STREAM_PAGES = os.getenv('STREAM_PAGES', 'true').lower() == 'true'
+STREAM_MAX_BYTES = int(os.getenv('STREAM_MAX_BYTES', 2 * 1024 * 1024))
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 16 * 1024))
+
+STREAM_BYTES = REGISTRY.counter(
+    'price_stream_bytes_total',
+    'Search page bytes read by streaming fetches, and bytes left unread by stopping early',
+    ('marketplace', 'kind')
+)
+STREAM_STOPS = REGISTRY.counter(
+    'price_stream_stops_total',
+    'Streaming fetches by why reading stopped: cards, byte_cap or complete',
+    ('marketplace', 'reason')
+)
+
+_etree = None
+
+
+def _load_etree():
+    """lxml.etree, imported on the first streamed page; None without lxml (only the byte cap applies)."""
+    global _etree
+    if _etree is None:
+        try:
+            from lxml import etree
+            _etree = etree
+        except ImportError:
+            _etree = False
+    return _etree or None
+
+
+class PageReader:
+    """Reads one response body, stopping early once enough product cards have arrived.
+
+    is_card(tag, attrs) recognizes a product card element; with no matcher
+    (or no lxml) only the byte cap applies. A reader is used for one page.
+    """
+
+    def __init__(self, marketplace: str, is_card=None, max_cards: int = 0, max_bytes: int = STREAM_MAX_BYTES):
+        self.marketplace = marketplace
+        self.is_card = is_card
+        self.max_cards = max_cards
+        self.max_bytes = max_bytes
+        self.cards = 0
+        self.bytes_read = 0
+        self.bytes_saved = None
+        self.reason = 'complete'
+        self._parts = []
+        self._decoder = None
+        self._parser = None
+        self._etree = None
+
+    def _start(self, encoding: str):
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        etree = _load_etree() if self.is_card is not None and self.max_cards > 0 else None
+        if etree is not None:
+            self._etree = etree
+            self._parser = etree.HTMLPullParser(events=('end',))
+
+    def _feed(self, chunk: bytes) -> bool:
+        """Take one chunk of body; returns False once reading should stop."""
+        self.bytes_read += len(chunk)
+        text = self._decoder.decode(chunk)
+        self._parts.append(text)
+        if self._parser is not None and text:
+            self._parser.feed(text)
+            for _, element in self._parser.read_events():
+                if isinstance(element.tag, str) and self.is_card(element.tag, element.attrib):
+                    self.cards += 1
+                # Only the count is needed; drop finished subtrees to keep the tree small
+                element.clear()
+            if self.cards >= self.max_cards:
+                self.reason = 'cards'
+                return False
+        if self.bytes_read >= self.max_bytes:
+            self.reason = 'byte_cap'
+            return False
+        return True
+
+    def _finish(self, content_length, wire_bytes) -> str:
+        self._parts.append(self._decoder.decode(b'', final=True))
+        if self._parser is not None:
+            try:
+                self._parser.close()
+            except self._etree.Error:
+                pass
+            self._parser = None
+        if self.reason != 'complete' and content_length and content_length.isdigit() and wire_bytes is not None:
+            self.bytes_saved = max(0, int(content_length) - wire_bytes)
+            STREAM_BYTES.inc(self.bytes_saved, marketplace=self.marketplace, kind='saved')
+        STREAM_BYTES.inc(wire_bytes if wire_bytes is not None else self.bytes_read,
+                         marketplace=self.marketplace, kind='read')
+        STREAM_STOPS.inc(marketplace=self.marketplace, reason=self.reason)
+        logger.debug("Read %d bytes from %s (%s, %d cards, %s bytes saved)", self.bytes_read, self.marketplace,
+                     self.reason, self.cards, self.bytes_saved if self.bytes_saved is not None else 'unknown')
+        return ''.join(self._parts)
+
+    def read_response(self, response) -> str:
+        """Read a requests response opened with stream=True."""
+        # requests' own .text guesses the charset from the whole body when the headers give none
+        self._start(response.encoding or 'utf-8')
+        try:
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                if not self._feed(chunk):
+                    break
+            wire_bytes = response.raw.tell()
+        finally:
+            # Closing an unfinished response drops the connection instead of draining it
+            response.close()
+        return self._finish(response.headers.get('Content-Length', ''), wire_bytes)
+
+    async def read_aiohttp(self, response) -> str:
+        """Read an aiohttp response."""
+        self._start(response.charset or 'utf-8')
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            if not self._feed(chunk):
+                response.close()
+                break
+        # aiohttp hands over decompressed bytes, which only match wire bytes for an unencoded body
+        wire_bytes = self.bytes_read if not response.headers.get('Content-Encoding') else None
+        return self._finish(response.headers.get('Content-Length', ''), wire_bytes)
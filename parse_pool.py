@@ -0,0 +1,140 @@
+"""Optional process pool for parsing search results pages.
+
+BeautifulSoup parsing is CPU-bound pure Python, so parser threads in one
+server process serialize on the GIL. With PARSE_PROCESSES > 0, pages of
+at least PARSE_PROCESS_MIN_BYTES go to long-lived worker processes, which
+return plain product dicts. Smaller pages, and every page when the pool
+is disabled, are parsed in-process on a thread.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from async_runtime import run_blocking
+from marketplaces import get_adapter
+from metrics import REGISTRY
+
+# Worker processes for parsing; 0 parses every page in-process
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES', 0))
+# Pages smaller than this are cheaper to parse here than to ship to a worker
+PARSE_PROCESS_MIN_BYTES = int(os.getenv('PARSE_PROCESS_MIN_BYTES', 32 * 1024))
+# Pages submitted to the pool but not yet parsed; further pages wait for a slot
+PARSE_QUEUE_SIZE = int(os.getenv('PARSE_QUEUE_SIZE', 0)) or 2 * max(PARSE_PROCESSES, 1)
+
+PARSED_PAGES = REGISTRY.counter(
+    'price_parsed_pages_total',
+    'Search results pages parsed, by where they were parsed',
+    ('marketplace', 'mode')
+)
+
+
+def parse_page(marketplace: str, html_content: str, query: str) -> list:
+    """Parse one page with its marketplace adapter's parser."""
+    return get_adapter(marketplace).parse(html_content, query)
+
+
+def _warm_worker():
+    # Import the parsers (and bs4/lxml) once per worker rather than on its first page
+    import marketplace_parsers  # noqa: F401
+
+
+class ParsePool:
+    """Long-lived parser processes behind a bounded submission queue.
+
+    At most queue_size pages are in flight; submitters wait for a slot,
+    so a burst of fetched pages cannot pile up unbounded HTML in memory.
+    """
+
+    def __init__(self, processes: int = PARSE_PROCESSES, min_bytes: int = PARSE_PROCESS_MIN_BYTES,
+                 queue_size: int = PARSE_QUEUE_SIZE):
+        self.processes = processes
+        self.min_bytes = min_bytes
+        self.queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # forkserver: workers do not inherit the server's threads and locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=_warm_worker
+                )
+            return self._executor
+
+    def use_processes(self, html_content: str) -> bool:
+        return self.processes > 0 and len(html_content) >= self.min_bytes
+
+    def _submit(self, marketplace: str, html_content: str, query: str):
+        """Submit a page once a slot has been acquired; the slot is freed when it is parsed."""
+        try:
+            future = self._get_executor().submit(parse_page, marketplace, html_content, query)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def parse(self, marketplace: str, html_content: str, query: str) -> list:
+        """Parse a page, in a worker process if it is large enough."""
+        if not self.use_processes(html_content):
+            PARSED_PAGES.inc(marketplace=marketplace, mode='inline')
+            return parse_page(marketplace, html_content, query)
+        self._slots.acquire()
+        PARSED_PAGES.inc(marketplace=marketplace, mode='process')
+        return self._submit(marketplace, html_content, query).result()
+
+    async def parse_async(self, marketplace: str, html_content: str, query: str) -> list:
+        """Async form of parse; small pages are parsed on the loop's default thread pool."""
+        if not self.use_processes(html_content):
+            PARSED_PAGES.inc(marketplace=marketplace, mode='inline')
+            return await run_blocking(None, parse_page, marketplace, html_content, query, label=marketplace)
+        if not self._slots.acquire(blocking=False):
+            # Wait for a slot on a worker thread, releasing the slot if this task is cancelled meanwhile
+            acquire = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire))
+            try:
+                await asyncio.shield(acquire)
+            except asyncio.CancelledError:
+                acquire.add_done_callback(lambda _: self._slots.release())
+                raise
+        PARSED_PAGES.inc(marketplace=marketplace, mode='process')
+        return await asyncio.wrap_future(self._submit(marketplace, html_content, query))
+
+    def stats(self) -> dict:
+        return {
+            'processes': self.processes,
+            'min_bytes': self.min_bytes,
+            'queue_size': self.queue_size
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ParsePool:
+    """Return the process-wide parse pool configured from the environment."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ParsePool()
+        return _parse_pool
+
+
+def shutdown_parse_pool():
+    """Stop the parser processes (called when the server exits)."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown()
+            _parse_pool = None
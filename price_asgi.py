@@ -0,0 +1,367 @@
+"""ASGI entry point for the price comparison server.
+
+Comparisons run natively on the event loop through the async scrape path,
+so hundreds of concurrent /compare-prices and /compare-prices/stream
+requests share a handful of threads. Every other route is served by the
+Flask app in price_server, run on a small thread pool.
+
+Run with:
+    python price_asgi.py
+or:
+    uvicorn price_asgi:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import hmac
+import io
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from async_http import close_async_http_client
+from browser_pool import shutdown_browser_pool
+from metrics import HTTP_REQUESTS, HTTP_REQUEST_SECONDS
+from parse_pool import shutdown_parse_pool
+from price_scraper import search_product_prices_async, stream_product_prices_async, get_default_scraper
+from price_server import (app as flask_app, watchlist, WATCHLIST_ENABLED, ADMIN_TOKEN, PROFILE_HEADER,
+                          profiling_switch, parse_deadline)
+from profiling import RequestProfile, current_profile, get_profile_store, install_task_factory
+from single_flight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Production server settings
+ASGI_HOST = os.getenv('HOST', '0.0.0.0')
+ASGI_PORT = int(os.getenv('PORT', 8000))
+ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', 1))  # caches, rate limits and browsers are per worker process
+ASGI_LIMIT_CONCURRENCY = int(os.getenv('ASGI_LIMIT_CONCURRENCY', 1000))
+ASGI_KEEP_ALIVE = int(os.getenv('ASGI_KEEP_ALIVE', 5))
+ASGI_BACKLOG = int(os.getenv('ASGI_BACKLOG', 2048))
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', 8))
+
+# Largest request body accepted by the native routes
+MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', 1024 * 1024))
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+    (b'access-control-allow-origin', b'*')
+]
+JSON_HEADERS = [
+    (b'content-type', b'application/json'),
+    (b'access-control-allow-origin', b'*')
+]
+
+# Concurrent identical comparisons attach to the scrape already running
+comparison_flights = AsyncSingleFlight()
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise RequestTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def send_json(send, payload: dict, status: int = 200):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': JSON_HEADERS + [(b'content-length', str(len(body)).encode('ascii'))]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def sse_event(event: str, payload) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode('utf-8')
+
+
+async def comparison_request(scope, receive):
+    """Parse a comparison request from a JSON body or the query string.
+
+    Returns ((title, current_marketplace, current_price, deadline), None) or
+    (None, (error_payload, status)).
+    """
+    if scope['method'] == 'GET':
+        data = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+    else:
+        try:
+            data = json.loads(await read_body(receive) or b'null')
+        except ValueError:
+            data = None
+    if not isinstance(data, dict) or not data:
+        return None, ({'error': 'No JSON data provided'}, 400)
+    if not data.get('title'):
+        return None, ({'error': 'Product title is required'}, 400)
+    try:
+        deadline = parse_deadline(data.get('deadline'))
+    except ValueError as e:
+        return None, ({'error': 'Invalid parameter', 'message': str(e)}, 400)
+    return (data['title'], data.get('currentMarketplace'), data.get('currentPrice'), deadline), None
+
+
+async def compare_prices(scope, receive, send):
+    """Native async form of POST /compare-prices."""
+    parsed, error = await comparison_request(scope, receive)
+    if error is not None:
+        await send_json(send, *error)
+        return error[1]
+    title, current_marketplace, current_price, deadline = parsed
+
+    watchlist.track(title, current_marketplace)
+    profile = current_profile()
+    if profile is not None:
+        profile.meta.update(query=title, marketplace=current_marketplace)
+    try:
+        # Only comparisons with the same deadline share a flight, so nobody gets a result cut short by another's
+        flight_key = (get_default_scraper().clean_product_title(title).lower(), current_marketplace, deadline)
+        results, shared = await comparison_flights.do(flight_key, search_product_prices_async, title,
+                                                      current_marketplace, current_price, deadline)
+        if shared:
+            results = dict(results, query=title, current_price=current_price, shared=True)
+    except Exception as e:
+        logger.exception("Error in compare_prices: %s", e)
+        await send_json(send, {'error': 'Internal server error', 'message': str(e)}, 500)
+        return 500
+    if profile is not None:
+        results = dict(results, profile_id=profile.id)
+    await send_json(send, results)
+    return 200
+
+
+async def compare_prices_stream(scope, receive, send):
+    """Native async form of /compare-prices/stream (Server-Sent Events)."""
+    parsed, error = await comparison_request(scope, receive)
+    if error is not None:
+        await send_json(send, *error)
+        return error[1]
+    title, current_marketplace, current_price, deadline = parsed
+
+    watchlist.track(title, current_marketplace)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+
+    # Stop scraping for a client that has gone away
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    events = stream_product_prices_async(title, current_marketplace, current_price, deadline)
+    try:
+        async for event, payload in events:
+            if disconnected.done():
+                break
+            await send({'type': 'http.response.body', 'body': sse_event(event, payload), 'more_body': True})
+    except Exception as e:
+        logger.exception("Error in compare_prices_stream: %s", e)
+        await send({'type': 'http.response.body', 'more_body': True,
+                    'body': sse_event('error', {'error': 'Internal server error', 'message': str(e)})})
+    finally:
+        await events.aclose()
+        disconnected.cancel()
+    await send({'type': 'http.response.body', 'body': b''})
+    return 200
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+NATIVE_ROUTES = {
+    ('POST', '/compare-prices'): compare_prices,
+    ('GET', '/compare-prices/stream'): compare_prices_stream,
+    ('POST', '/compare-prices/stream'): compare_prices_stream
+}
+# Native routes that can be profiled, like price_server.PROFILED_ENDPOINTS
+PROFILED_ROUTES = ('/compare-prices',)
+
+
+def _should_profile(scope) -> bool:
+    """X-Profile from an admin (see price_server.is_admin_request), or the admin profiling toggle."""
+    headers = dict(scope.get('headers') or [])
+    if headers.get(PROFILE_HEADER.lower().encode('latin-1')):
+        if ADMIN_TOKEN:
+            is_admin = hmac.compare_digest(headers.get(b'x-admin-token', b'').decode('latin-1'), ADMIN_TOKEN)
+        else:
+            is_admin = (scope.get('client') or ('',))[0] in ('127.0.0.1', '::1')
+        if is_admin:
+            return True
+    return profiling_switch.take()
+
+
+def _profiled_send(send, profile: RequestProfile):
+    """send that stops and saves profile before the response starts, and adds X-Profile-Id."""
+    async def profiled_send(message):
+        if message['type'] == 'http.response.start':
+            profile.stop()
+            try:
+                await asyncio.to_thread(get_profile_store().save, profile)
+                message = dict(message, headers=list(message.get('headers', [])) +
+                               [(b'x-profile-id', profile.id.encode('ascii'))])
+            except OSError as e:
+                logger.error("Error saving profile %s: %s", profile.id, e)
+        await send(message)
+    return profiled_send
+
+
+class WsgiAdapter:
+    """Serves a WSGI app from ASGI, running it on a thread pool.
+
+    Response bodies are streamed chunk by chunk, so Flask's Server-Sent
+    Event routes still stream (holding one pool thread each).
+    """
+
+    def __init__(self, wsgi_app, threads: int = WSGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    @staticmethod
+    def environ(scope, body: bytes) -> dict:
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f'HTTP_{name}'
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        try:
+            body = await read_body(receive)
+        except RequestTooLarge:
+            await send_json(send, {'error': 'Request body too large'}, 413)
+            return
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+
+        iterable = await loop.run_in_executor(self.executor, self.wsgi_app, self.environ(scope, body),
+                                              start_response)
+        chunks = iter(iterable)
+        try:
+            chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+            await send({'type': 'http.response.start', 'status': started['status'],
+                        'headers': started['headers']})
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+
+wsgi = WsgiAdapter(flask_app)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if WATCHLIST_ENABLED:
+                watchlist.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            watchlist.stop()
+            await close_async_http_client()
+            await asyncio.to_thread(shutdown_browser_pool)
+            shutdown_parse_pool()
+            await asyncio.to_thread(get_default_scraper().planner.save)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path'].rstrip('/') or '/'
+    route = NATIVE_ROUTES.get((scope['method'], path))
+    if route is None:
+        # Flask records its own request metrics
+        await wsgi(scope, receive, send)
+        return
+
+    started = time.perf_counter()
+    profile = None
+    if path in PROFILED_ROUTES and _should_profile(scope):
+        # Steps of this request's tasks are profiled on the loop thread, not the whole thread
+        install_task_factory(asyncio.get_running_loop())
+        profile = RequestProfile(path.lstrip('/').replace('-', '_'), {'path': path})
+        profile.start(profile_thread=False)
+        send = _profiled_send(send, profile)
+    try:
+        if profile is not None:
+            status = await profile.profile_coroutine(route(scope, receive, send))
+        else:
+            status = await route(scope, receive, send)
+    except RequestTooLarge:
+        await send_json(send, {'error': 'Request body too large'}, 413)
+        status = 413
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=path, method=scope['method'])
+    HTTP_REQUESTS.inc(endpoint=path, method=scope['method'], status=status)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+    uvicorn.run(
+        'price_asgi:app',
+        host=ASGI_HOST,
+        port=ASGI_PORT,
+        workers=ASGI_WORKERS,
+        lifespan='on',
+        limit_concurrency=ASGI_LIMIT_CONCURRENCY,
+        timeout_keep_alive=ASGI_KEEP_ALIVE,
+        backlog=ASGI_BACKLOG,
+        proxy_headers=True,
+        log_config=None
+    )
@@ -0,0 +1,233 @@
+import atexit
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Price history settings
+PRICE_HISTORY_DB = os.getenv('PRICE_HISTORY_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'price_history.db'))
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', 200))
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', 1.0))
+HISTORY_MAX_POINTS = int(os.getenv('HISTORY_MAX_POINTS', 500))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS offers (
+    id INTEGER PRIMARY KEY,
+    normalized_title TEXT NOT NULL,
+    marketplace TEXT NOT NULL,
+    title TEXT,
+    price TEXT,
+    price_value REAL,
+    url TEXT,
+    scraped_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS offers_title_market_time ON offers (normalized_title, marketplace, scraped_at);
+CREATE INDEX IF NOT EXISTS offers_market_time ON offers (marketplace, scraped_at);
+"""
+
+PRICE_VALUE_RE = re.compile(r'[\d,]+(?:\.\d+)?')
+
+
+def parse_price_value(price: str):
+    """Numeric value of a display price such as '$1,299.00', or None."""
+    match = PRICE_VALUE_RE.search(price or '')
+    if not match:
+        return None
+    try:
+        return float(match.group(0).replace(',', ''))
+    except ValueError:
+        return None
+
+
+class PriceHistoryStore:
+    """SQLite store of every scraped offer, written in batches off the request path.
+
+    record() only enqueues; a writer thread drains the queue and inserts in
+    batches inside one transaction. The database runs in WAL mode so reads
+    from request threads never wait on the writer.
+    """
+
+    def __init__(self, path: str = PRICE_HISTORY_DB, batch_size: int = HISTORY_BATCH_SIZE,
+                 flush_interval: float = HISTORY_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._closed = False
+        connection = self._connect()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+        connection.commit()
+        self._writer = threading.Thread(target=self._write_loop, name='price-history-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        """One read connection per thread (sqlite3 connections are not shared)."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def record(self, normalized_title: str, marketplace: str, products: list, scraped_at: float = None):
+        """Queue scraped offers for writing; never blocks on the database."""
+        if self._closed or not products:
+            return
+        scraped_at = scraped_at or time.time()
+        for product in products:
+            self._queue.put((
+                normalized_title,
+                marketplace,
+                product.get('title'),
+                product.get('price'),
+                parse_price_value(product.get('price')),
+                product.get('url'),
+                scraped_at
+            ))
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._closed:
+                    break
+                continue
+            if item is None:
+                self._queue.task_done()
+                break
+            batch.append(item)
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.task_done()
+                    self._closed = True
+                    break
+                batch.append(item)
+            self._insert(connection, batch)
+            for _ in batch:
+                self._queue.task_done()
+            if self._closed and self._queue.empty():
+                break
+        connection.close()
+
+    @staticmethod
+    def _insert(connection: sqlite3.Connection, batch: list):
+        try:
+            with connection:
+                connection.executemany(
+                    'INSERT INTO offers (normalized_title, marketplace, title, price, price_value, url, scraped_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    batch
+                )
+        except sqlite3.Error as e:
+            logger.error("Error writing price history: %s", e)
+
+    def latest_offers(self, normalized_title: str, marketplace: str, max_age: float) -> list:
+        """Offers from the most recent scrape of a marketplace, if it is younger than max_age."""
+        row = self._reader().execute(
+            'SELECT MAX(scraped_at) FROM offers WHERE normalized_title = ? AND marketplace = ?',
+            (normalized_title, marketplace)
+        ).fetchone()
+        if not row or row[0] is None or time.time() - row[0] > max_age:
+            return []
+        rows = self._reader().execute(
+            'SELECT title, price, url, scraped_at FROM offers '
+            'WHERE normalized_title = ? AND marketplace = ? AND scraped_at = ? ORDER BY id',
+            (normalized_title, marketplace, row[0])
+        ).fetchall()
+        return [
+            {'title': title, 'price': price, 'url': url, 'image': '', 'marketplace': marketplace,
+             'scraped_at': scraped_at}
+            for title, price, url, scraped_at in rows
+        ]
+
+    def history(self, normalized_title: str, marketplace: str = None, since: float = None, until: float = None,
+                max_points: int = HISTORY_MAX_POINTS) -> dict:
+        """Min/max/latest price series per marketplace, downsampled to at most max_points buckets."""
+        until = until or time.time()
+        since = since if since is not None else 0.0
+        max_points = max(1, min(max_points, HISTORY_MAX_POINTS))
+        params = [normalized_title, since, until]
+        market_filter = ''
+        if marketplace:
+            market_filter = ' AND marketplace = ?'
+            params.append(marketplace)
+
+        bounds = self._reader().execute(
+            'SELECT MIN(scraped_at), MAX(scraped_at) FROM offers '
+            'WHERE normalized_title = ? AND scraped_at BETWEEN ? AND ?' + market_filter,
+            params
+        ).fetchone()
+        if not bounds or bounds[0] is None:
+            return {}
+        first, last = bounds
+        width = max((last - first) / max_points, 1e-6)
+
+        rows = self._reader().execute(
+            'WITH bucketed AS ('
+            ' SELECT marketplace, MIN(CAST((scraped_at - ?) / ? AS INTEGER), ?) AS bucket, price_value, scraped_at, id'
+            ' FROM offers WHERE normalized_title = ? AND scraped_at BETWEEN ? AND ? AND price_value IS NOT NULL'
+            + market_filter +
+            '), ranked AS ('
+            ' SELECT *, FIRST_VALUE(price_value) OVER ('
+            '  PARTITION BY marketplace, bucket ORDER BY scraped_at DESC, id DESC) AS latest'
+            ' FROM bucketed'
+            ') '
+            'SELECT marketplace, bucket, MIN(price_value), MAX(price_value), MAX(scraped_at), MAX(latest), COUNT(*) '
+            'FROM ranked GROUP BY marketplace, bucket ORDER BY marketplace, bucket',
+            [first, width, max_points - 1] + params
+        ).fetchall()
+
+        series = {}
+        for market, bucket, low, high, latest_at, latest, count in rows:
+            series.setdefault(market, []).append({
+                'time': round(first + bucket * width, 3),
+                'min': low,
+                'max': high,
+                'latest': latest,
+                'latest_at': latest_at,
+                'count': count
+            })
+        return series
+
+    def flush(self, timeout: float = 5):
+        """Wait (briefly) for queued offers to be written."""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+
+    def close(self):
+        if not self._closed:
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+            self._closed = True
+
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+
+def get_history_store() -> PriceHistoryStore:
+    """Return the process-wide price history store, creating it on first use."""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            _history_store = PriceHistoryStore()
+            atexit.register(_history_store.close)
+        return _history_store
@@ -1,466 +1,996 @@
-import requests
-from bs4 import BeautifulSoup
-import re
+import asyncio
 import json
-from urllib.parse import quote_plus, urljoin
-import time
+import logging
 import random
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from urllib.parse import urljoin
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http_client import get_http_client, DEFAULT_POOL_SIZE
+from result_cache import ResultCache, get_result_cache, MISS, STALE
+from single_flight import AsyncSingleFlight
+from rate_limiter import RateLimitScheduler, DEFAULT_RATE, DEFAULT_BURST
+from fetch_store import TRUNCATED_HEADER, get_fetch_backend
+from product_matcher import ProductMatcher
+from text_normalization import clean_title, PriceExtractor
+from price_history import PriceHistoryStore, get_history_store
+from metrics import time_stage, STAGE_SECONDS, MARKETPLACE_SEARCHES
+from async_http import fetch_url, configure_host as configure_async_host
+from async_runtime import run_sync, iter_sync, keep_running, run_blocking
+from marketplace_health import get_health_tracker, BreakerOpen, HEDGED_FETCHES
+from marketplaces import all_adapters, MarketplaceAdapter
+from page_stream import PageReader, STREAM_PAGES
+from parse_pool import get_parse_pool
+from query_planner import QueryPlanner, Plan, get_query_planner, PLANNER_ENOUGH_MATCHES, PLANNER_CONFIDENT_SCORE
+
+logger = logging.getLogger(__name__)
+
+# Concurrent marketplace search settings (seconds)
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', 8))
+COMPARE_DEADLINE = float(os.getenv('COMPARE_DEADLINE', 30))
+MARKETPLACE_TIMEOUT = float(os.getenv('MARKETPLACE_TIMEOUT', 20))
+BATCH_DEADLINE = float(os.getenv('BATCH_DEADLINE', 600))
+
+# Serve offers scraped within this many seconds from the price history store (0 disables)
+HISTORY_MAX_AGE = float(os.getenv('HISTORY_MAX_AGE', 0))
+
+# Upper bound on products kept per marketplace search
+MAX_SEARCH_RESULTS = int(os.getenv('MAX_SEARCH_RESULTS', 50))
+
+# Fraction of searches whose full product lists are logged when DEBUG logging is on
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.05))
+
+_search_executor = None
+_selenium_executor = None
+
+# Identical marketplace searches in flight share one fetch across all scrapers
+_search_flights = AsyncSingleFlight()
+
+
+def _debug_sampled() -> bool:
+    """True if DEBUG logging is enabled and this call falls within LOG_SAMPLE_RATE."""
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE
+
+
+def get_search_executor() -> ThreadPoolExecutor:
+    """Shared worker pool for marketplace searches.
+
+    The pool outlives individual comparisons so a search that misses its
+    deadline keeps running in the background instead of blocking the caller.
+    """
+    global _search_executor
+    if _search_executor is None:
+        _search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='marketplace-search')
+    return _search_executor
+
 
-# Path to your ChromeDriver executable
-CHROMEDRIVER_PATH = '/Users/sheridangomes/PricePulse/chromedriver' # Adjust this path if you placed it elsewhere
+def get_selenium_executor() -> ThreadPoolExecutor:
+    """Threads that drive pooled browsers for the async path, one per browser.
 
-def get_website_text_content(url: str, use_selenium: bool = False) -> str:
+    Selenium is synchronous, so async searches hand Chrome work to these
+    threads. Searches waiting for a free browser wait on the event loop,
+    not on a thread.
+    """
+    global _selenium_executor
+    if _selenium_executor is None:
+        from browser_pool import BROWSER_POOL_SIZE
+        _selenium_executor = ThreadPoolExecutor(max_workers=BROWSER_POOL_SIZE, thread_name_prefix='selenium-fetch')
+    return _selenium_executor
+
+
+# _search_concurrently's result for a search turned away by an open circuit breaker
+SKIPPED = 'skipped'
+
+# Per-marketplace request budgets; queued searches run on the search executor
+rate_limiter = RateLimitScheduler(get_search_executor)
+
+def _fetch_live(url: str, use_selenium: bool = False, browser_options: dict = None,
+                reader: PageReader = None) -> tuple:
+    """Fetch a page from the live site. Returns (status, headers, body).
+
+    browser_options are passed to BrowserPool.fetch (see MarketplaceAdapter.browser_options).
+    A reader streams a requests body and may stop reading early.
+    """
+    if use_selenium:
+        # Reuse a warm browser from the pool instead of starting Chrome per fetch
+        from browser_pool import get_browser_pool
+        html, complete = get_browser_pool().fetch(url, **(browser_options or {}))
+        return 200, ({} if complete else {TRUNCATED_HEADER: 'render_timeout'}), html
+    if reader is not None:
+        response = get_http_client().get(url, stream=True)
+        body = reader.read_response(response)
+        return response.status_code, _mark_truncated(dict(response.headers), reader), body
+    response = get_http_client().get(url)
+    return response.status_code, dict(response.headers), response.text
+
+
+def _mark_truncated(headers: dict, reader: PageReader) -> dict:
+    """Flag a streamed body that stopped early, so the fetch store does not keep it as the whole page."""
+    if reader is not None and reader.reason != 'complete':
+        headers[TRUNCATED_HEADER] = reader.reason
+    return headers
+
+
+def get_website_text_content(url: str, use_selenium: bool = False, browser_options: dict = None,
+                             reader: PageReader = None) -> str:
     """
     Extract main text content from a website using requests and BeautifulSoup.
     Returns cleaned text content that's easier to process.
+
+    Goes through the configured fetch backend, so pages can be recorded to
+    and replayed from the on-disk fetch store (see FETCH_MODE).
     """
     try:
-        if use_selenium:
-            options = Options()
-            options.add_argument("--headless")
-            options.add_argument("--disable-gpu")
-            options.add_argument("--no-sandbox")
-            options.add_argument("window-size=1920x1080")
-            service = Service(CHROMEDRIVER_PATH)
-            driver = webdriver.Chrome(service=service, options=options)
-            driver.get(url)
-            # Wait for the body to be present
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            content = driver.page_source
-            driver.quit()
-            return content
-        else:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                return response.text
-            return ""
+        return get_fetch_backend().fetch(url, lambda: _fetch_live(url, use_selenium, browser_options, reader),
+                                         backend='selenium' if use_selenium else 'requests')
     except Exception as e:
-        print(f"Error extracting content from {url}: {e}")
+        logger.warning("Error extracting content from %s: %s", url, e)
         return ""
 
 
+async def _fetch_live_async(url: str, use_selenium: bool = False, browser_options: dict = None,
+                            reader: PageReader = None) -> tuple:
+    """Async form of _fetch_live. Returns (status, headers, body)."""
+    if use_selenium:
+        return await run_blocking(get_selenium_executor(), _fetch_live, url, True, browser_options)
+    status, headers, body = await fetch_url(url, reader)
+    return status, _mark_truncated(dict(headers), reader), body
+
+
+async def get_website_text_content_async(url: str, use_selenium: bool = False,
+                                         browser_options: dict = None, reader: PageReader = None) -> str:
+    """Async form of get_website_text_content."""
+    try:
+        return await get_fetch_backend().fetch_async(
+            url, lambda: _fetch_live_async(url, use_selenium, browser_options, reader),
+            backend='selenium' if use_selenium else 'requests')
+    except Exception as e:
+        logger.warning("Error extracting content from %s: %s", url, e)
+        return ""
+
+
+async def _reserve(marketplace: str):
+    """Wait on the event loop until the marketplace's rate limit allows a request."""
+    await asyncio.wrap_future(rate_limiter.reserve(marketplace))
+
+
 class PriceScraper:
-    def __init__(self):
-        self.marketplaces = {
-            'amazon': {
-                'base_url': 'https://www.amazon.com',
-                'search_url': 'https://www.amazon.com/s?k={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'Price:\s*\$[\d,]+\.?\d*',
-                    r'Currently:\s*\$[\d,]+\.?\d*'
-                ]
-            },
-            'amazon_au': {
-                'base_url': 'https://www.amazon.com.au',
-                'search_url': 'https://www.amazon.com.au/s?k={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'AUD\s*\$[\d,]+\.?\d*',
-                    r'Price:\s*\$[\d,]+\.?\d*',
-                    r'Currently:\s*\$[\d,]+\.?\d*'
-                ]
-            },
-            'ebay': {
-                'base_url': 'https://www.ebay.com',
-                'search_url': 'https://www.ebay.com/sch/i.html?_nkw={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'US\s*\$[\d,]+\.?\d*',
-                    r'Price:\s*\$[\d,]+\.?\d*'
-                ]
-            },
-            'ebay_au': {
-                'base_url': 'https://www.ebay.com.au',
-                'search_url': 'https://www.ebay.com.au/sch/i.html?_nkw={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'AU\s*\$[\d,]+\.?\d*',
-                    r'AUD\s*\$[\d,]+\.?\d*',
-                    r'Price:\s*\$[\d,]+\.?\d*'
-                ]
-            },
-            'walmart': {
-                'base_url': 'https://www.walmart.com',
-                'search_url': 'https://www.walmart.com/search?q={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'current price\s*\$[\d,]+\.?\d*',
-                    r'was\s*\$[\d,]+\.?\d*'
-                ]
-            },
-            'target': {
-                'base_url': 'https://www.target.com',
-                'search_url': 'https://www.target.com/s?searchTerm={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'current price\s*\$[\d,]+\.?\d*',
-                    r'reg\s*\$[\d,]+\.?\d*'
-                ]
-            },
-            'target_au': {
-                'base_url': 'https://www.target.com.au',
-                'search_url': 'https://www.target.com.au/s?searchTerm={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'current price\s*\$[\d,]+\.?\d*',
-                    r'was\s*\$[\d,]+\.?\d*'
-                ]
-            },
-            'jbhifi_au': {
-                'base_url': 'https://www.jbhifi.com.au',
-                'search_url': 'https://www.jbhifi.com.au/search?query={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'AUD\s*\$[\d,]+\.?\d*',
-                    r'Price:\s*\$[\d,]+\.?\d*',
-                    r'Now:\s*\$[\d,]+\.?\d*'
-                ]
-            },
-            'thegoodguys_au': {
-                'base_url': 'https://www.thegoodguys.com.au',
-                'search_url': 'https://www.thegoodguys.com.au/search?q={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'AUD\s*\$[\d,]+\.?\d*',
-                    r'Price:\s*\$[\d,]+\.?\d*'
-                ]
-            },
-            'mydeal_au': {
-                'base_url': 'https://www.mydeal.com.au',
-                'search_url': 'https://www.mydeal.com.au/search?q={query}',
-                'price_selectors': [
-                    r'\$[\d,]+\.?\d*',
-                    r'AUD\s*\$[\d,]+\.?\d*',
-                    r'Price:\s*\$[\d,]+\.?\d*'
-                ]
-            }
-        }
+    def __init__(self, cache: ResultCache = None, history: PriceHistoryStore = None, planner: QueryPlanner = None):
+        # Optional per-marketplace search result cache and persistent price history
+        self.cache = cache
+        self.history = history
+        # Marketplace statistics behind comparison plans; in memory only unless one is given
+        self.planner = planner or QueryPlanner(path='')
+        self._price_extractors = {}
+        # Marketplace adapters from the registry, and their settings in dict form
+        self.adapters = {adapter.id: adapter for adapter in all_adapters()}
+        self.marketplaces = {marketplace: adapter.config() for marketplace, adapter in self.adapters.items()}
+
+        # Give each marketplace host its own keep-alive connection pool and request budget
+        http_client = get_http_client()
+        for marketplace, config in self.marketplaces.items():
+            http_client.configure_host(config['base_url'], config.get('pool_size', DEFAULT_POOL_SIZE))
+            configure_async_host(config['base_url'], config.get('pool_size', DEFAULT_POOL_SIZE))
+            rate_limiter.configure(marketplace, config.get('requests_per_second', DEFAULT_RATE),
+                                   config.get('burst', DEFAULT_BURST))
     
     def clean_product_title(self, title: str) -> str:
         """Clean product title for better search results."""
-        if not title:
-            return ""
-        
-        # Remove common marketplace-specific terms and generic descriptive words
-        stop_words = ['gaming', 'monitor', 'inches', 'curved', 'ultra', 'hd', 'hz', 'ms', 'amd', 'freesync', 'nvidia', 'g-sync', 'adaptive', 'sync', 'technology', 'oled', 'qhd', 'uhd', 'display', 'studio', 'portable', 'with', 'for', 'by', 'gen', 'inch']
-        cleaned = re.sub(r'\b(amazon|ebay|walmart|target)\b', '', title, flags=re.IGNORECASE)
-        
-        words = cleaned.split()
-        cleaned_words = [word for word in words if word.lower() not in stop_words]
-        cleaned = ' '.join(cleaned_words)
-
-        # Remove extra whitespace and special characters
-        cleaned = re.sub(r'[^\w\s-]', ' ', cleaned)
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-        
-        return cleaned
+        return clean_title(title or "")
+    
+    def price_extractor(self, marketplace: str) -> PriceExtractor:
+        """Compiled price extractor for a marketplace, built on first use."""
+        extractor = self._price_extractors.get(marketplace)
+        if extractor is None:
+            extractor = PriceExtractor(self.marketplaces[marketplace]['price_selectors'])
+            self._price_extractors[marketplace] = extractor
+        return extractor
     
     def extract_prices_from_text(self, text: str, marketplace: str) -> list:
-        """Extract prices from text content using regex patterns."""
+        """Extract prices from text content in one pass over the marketplace's patterns."""
         if not text or marketplace not in self.marketplaces:
             return []
-        
-        prices = []
-        selectors = self.marketplaces[marketplace]['price_selectors']
-        
-        for pattern in selectors:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                # Clean and validate price
-                price_str = re.sub(r'[^\d.,]', '', match)
-                if price_str and '.' in price_str:
-                    try:
-                        price_value = float(price_str.replace(',', ''))
-                        if 1 <= price_value <= 10000:  # Reasonable price range
-                            prices.append({
-                                'price': f"${price_value:.2f}",
-                                'raw_text': match
-                            })
-                    except ValueError:
-                        continue
-        
-        return prices
+        return self.price_extractor(marketplace).extract(text)
+    
+    def extract_prices_batch(self, texts: list, marketplace: str) -> list:
+        """Extract prices from several documents with the same compiled extractor."""
+        if marketplace not in self.marketplaces:
+            return [[] for _ in texts]
+        return self.price_extractor(marketplace).extract_batch(texts)
     
     def extract_product_info_from_search(self, html_content: str, query: str, marketplace: str) -> list:
         """Extract product information from search results HTML content."""
-        products = []
-        soup = BeautifulSoup(html_content, 'html.parser', from_encoding="utf-8")
-
-        # Common selectors for product containers
-        product_containers = soup.find_all(['div', 'li', 'article'], class_=re.compile(r'product-card|product-item|search-result|item-card', re.I))
+        from marketplace_parsers import parse_generic
+        return parse_generic(html_content, query, self.adapters[marketplace])
 
-        if not product_containers:
-            print(f"No generic product containers found for query: {query} on {marketplace}")
-            return []
-
-        for container in product_containers:
-            title_tag = container.find(['h2', 'h3', 'h4', 'a'], class_=re.compile(r'product-title|item-title|title', re.I))
-            price_tag = container.find(['span', 'div'], class_=re.compile(r'price|product-price|item-price', re.I))
-            link_tag = container.find('a', href=True)
-
-            title = title_tag.get_text(strip=True) if title_tag else None
-            price = price_tag.get_text(strip=True) if price_tag else None
-            url = urljoin(self.marketplaces[marketplace]['base_url'], link_tag['href']) if link_tag else None
-
-            if title and price and url:
-                products.append({
-                    'title': title,
-                    'price': price,
-                    'url': url,
-                    'image': ''  # Placeholder
-                })
-        return products
-    
     def _scrape_jbhifi(self, html_content: str) -> list:
         """Scrape product information specifically from JB Hi-Fi search results."""
-        products = []
-        soup = BeautifulSoup(html_content, 'html.parser', from_encoding="utf-8")
-        
-        # Look for product tiles using the data-testid attribute
-        product_tiles = soup.find_all('div', attrs={'data-testid': 'product-card-content'})
-        
-        if not product_tiles:
-            print("No product tiles found for JB Hi-Fi with data-testid='product-card-content'.")
-            print(f"Raw HTML content for JB Hi-Fi (first 1000 chars):\n{html_content[:1000]}") # Debug print
-
-        for tile in product_tiles:
-            title_tag = tile.find('div', attrs={'data-testid': 'product-card-title'})
-            price_tag = tile.find('span', class_='PriceTag_actual__1eb7mu916')
-            link_tag = tile.find('a', class_='ProductCard_imageLink', href=True)
-            image_tag = tile.find('div', attrs={'data-testid': 'product-card-image-base'}).find('img')
-            
-            title = title_tag.get_text(strip=True) if title_tag else None
-            price = price_tag.get_text(strip=True) if price_tag else None
-            url = urljoin('https://www.jbhifi.com.au', link_tag['href']) if link_tag else None
-            image_url = image_tag['src'] if image_tag and 'src' in image_tag.attrs else ''
-
-            if title and price and url:
-                products.append({
-                    'title': title,
-                    'price': price,
-                    'url': url,
-                    'image': image_url
-                })
-        return products
+        from marketplace_parsers import parse_jbhifi
+        return parse_jbhifi(html_content, '', self.adapters['jbhifi_au'])
 
     def _scrape_thegoodguys(self, html_content: str) -> list:
         """Scrape product information specifically from The Good Guys search results."""
-        products = []
-        soup = BeautifulSoup(html_content, 'html.parser', from_encoding="utf-8")
-        
-        product_tiles = soup.find_all('article', attrs={'data-testid': 'product-card'})
-        
-        if not product_tiles:
-            print("No product tiles found for The Good Guys.")
-
-        for tile in product_tiles:
-            title_tag = tile.find('h4', class_='_title_1pa96_41')
-            price_tag = tile.find('span', attrs={'data-price': 'true', 'data-testid': 'product-card-price-section-price'})
-            link_tag = tile.find('a', class_='_imageLink_1pa96_24', href=True)
-            image_tag = tile.find('a', class_='_imageLink_1pa96_24').find('img')
-            
-            title = title_tag.get_text(strip=True) if title_tag else None
-            price = price_tag.get_text(strip=True) if price_tag else None
-            url = urljoin('https://www.thegoodguys.com.au', link_tag['href']) if link_tag else None
-            image_url = image_tag['src'] if image_tag and 'src' in image_tag.attrs else ''
-
-            if title and price and url:
-                products.append({
-                    'title': title,
-                    'price': price,
-                    'url': url,
-                    'image': image_url
-                })
-        return products
+        from marketplace_parsers import parse_thegoodguys
+        return parse_thegoodguys(html_content, '', self.adapters['thegoodguys_au'])
+
+    def search_marketplace(self, query: str, marketplace: str, exclude_marketplace: str = None,
+                           throttle: bool = True) -> list:
+        """Search for products on a specific marketplace.
+
+        With throttle=False the caller has already spent the marketplace's
+        rate limit budget (for example via rate_limiter.schedule).
+
+        Synchronous wrapper around search_marketplace_async; a marketplace
+        whose circuit breaker is open gives no products.
+        """
+        try:
+            return run_sync(self.search_marketplace_async(query, marketplace, exclude_marketplace, throttle))
+        except BreakerOpen:
+            return []
 
-    def search_marketplace(self, query: str, marketplace: str, exclude_marketplace: str = None) -> list:
-        """Search for products on a specific marketplace."""
+    async def search_marketplace_async(self, query: str, marketplace: str, exclude_marketplace: str = None,
+                                       throttle: bool = True) -> list:
+        """Search for products on a specific marketplace without blocking the event loop.
+
+        Raises BreakerOpen if the marketplace's circuit breaker does not let the search through.
+        """
         if marketplace == exclude_marketplace:
             return []
         
         if marketplace not in self.marketplaces:
             return []
         
+        # Clean query for search
+        clean_query = self.clean_product_title(query)
+        if not clean_query:
+            return []
+        
+        # Only the search that leads the flight spends rate limit budget; identical ones join it for free
+        products, shared = await _search_flights.do((clean_query.lower(), marketplace),
+                                                    self._search_marketplace_live, clean_query, marketplace, throttle)
+        if shared:
+            # Followers get their own copies of the leader's product dicts
+            products = [dict(product) for product in products]
+        return products
+
+    async def _search_marketplace_live(self, clean_query: str, marketplace: str, throttle: bool = True) -> list:
+        """Wait for rate limit budget (unless throttle is False), then fetch and parse one search results page."""
+        health = get_health_tracker()
+        if throttle:
+            # Don't queue for budget behind a breaker that would turn the search away anyway
+            if not health.available(marketplace):
+                MARKETPLACE_SEARCHES.inc(marketplace=marketplace, outcome='skipped')
+                raise BreakerOpen(marketplace, health.retry_in(marketplace))
+            await _reserve(marketplace)
+        if not health.allow(marketplace):
+            # Open, or half open with another search probing it; callers report the marketplace as skipped
+            logger.debug("Skipping %s: circuit breaker is open", marketplace)
+            MARKETPLACE_SEARCHES.inc(marketplace=marketplace, outcome='skipped')
+            raise BreakerOpen(marketplace, health.retry_in(marketplace))
+        started = time.perf_counter()
         try:
-            # Clean query for search
-            clean_query = self.clean_product_title(query)
-            if not clean_query:
-                return []
-            
             # Build search URL
-            search_url = self.marketplaces[marketplace]['search_url'].format(
-                query=quote_plus(clean_query)
-            )
+            adapter = self.adapters[marketplace]
+            search_url = adapter.search_url_for(clean_query)
             
-            print(f"Searching {marketplace}: {search_url}")
-            
-            # Add random delay to avoid rate limiting
-            time.sleep(random.uniform(1, 3))
+            logger.debug("Searching %s: %s", marketplace, search_url)
             
             # Get search results content
-            if marketplace in ['jbhifi_au', 'thegoodguys_au', 'target_au', 'amazon', 'target', 'mydeal_au']:
-                content = get_website_text_content(search_url, use_selenium=True)
-            else:
-                content = get_website_text_content(search_url)
+            with time_stage('fetch', marketplace, adapter.fetch):
+                content = await self._fetch_search_page(adapter, search_url)
+            fetch_seconds = time.perf_counter() - started
 
             if not content:
-                print(f"No content retrieved from {marketplace}")
+                logger.info("No content retrieved from %s", marketplace)
+                MARKETPLACE_SEARCHES.inc(marketplace=marketplace, outcome='error')
+                health.record(marketplace, False, fetch_seconds)
                 return []
 
-            # Extract product information based on marketplace
-            if marketplace == 'jbhifi_au':
-                products = self._scrape_jbhifi(content)
-            elif marketplace == 'thegoodguys_au':
-                products = self._scrape_thegoodguys(content)
-            else:
-                products = self.extract_product_info_from_search(content, clean_query, marketplace)
-
-            # Add marketplace info to products
-            for product in products:
-                product['marketplace'] = marketplace
-                # The URL is already absolute if extracted by _scrape_jbhifi or _scrape_thegoodguys or extract_product_info_from_search
-                # If not, it needs to be made absolute here.
-                if not product.get('url') or not product['url'].startswith(('http://', 'https://')):
-                    product['url'] = urljoin(self.marketplaces[marketplace]['base_url'], product.get('url', ''))
-                product['image'] = ''  # Placeholder, needs more sophisticated extraction
-
-            print(f"Found {len(products)} products on {marketplace}")
-            return products[:3]  # Limit to top 3 results
+            # Parsing is CPU bound; keep it off the event loop (and, for large pages, out of this process)
+            with time_stage('parse', marketplace):
+                products = await get_parse_pool().parse_async(marketplace, content, clean_query)
+            products = self._label_products(products, marketplace)
+
+            logger.debug("Found %d products on %s", len(products), marketplace)
+            MARKETPLACE_SEARCHES.inc(marketplace=marketplace, outcome='success' if products else 'empty')
+            health.record(marketplace, True, fetch_seconds)
+            return products[:MAX_SEARCH_RESULTS]
             
         except Exception as e:
-            print(f"Error searching {marketplace}: {e}")
+            logger.error("Error searching %s: %s", marketplace, e)
+            MARKETPLACE_SEARCHES.inc(marketplace=marketplace, outcome='error')
+            health.record(marketplace, False, time.perf_counter() - started)
             return []
+
+    async def _fetch_search_page(self, adapter: MarketplaceAdapter, search_url: str) -> str:
+        """Fetch a search results page, hedging it once it runs past the marketplace's p95 fetch time.
+
+        The hedge is a second request for the same page, sent only if the
+        marketplace's rate limit has budget for it right now; whichever
+        request returns content first wins and the other is cancelled. If
+        neither returns content the page is empty.
+        """
+        def fetch():
+            # Stream plain HTTP pages, stopping once MAX_SEARCH_RESULTS product cards have arrived
+            reader = None
+            # Pages saved to the fetch store are read whole, so replays and cache hits are complete pages
+            if STREAM_PAGES and not adapter.use_selenium and not get_fetch_backend().records:
+                reader = PageReader(adapter.id, adapter.load_card_matcher(), MAX_SEARCH_RESULTS)
+            return asyncio.ensure_future(get_website_text_content_async(
+                search_url, use_selenium=adapter.use_selenium, browser_options=adapter.browser_options(),
+                reader=reader))
+
+        primary = fetch()
+        # Browsers are scarce, so only plain HTTP fetches are hedged
+        delay = None if adapter.use_selenium else get_health_tracker().hedge_delay(adapter.id)
+        if delay is None:
+            return await primary
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not rate_limiter.try_reserve(adapter.id):
+                return await primary
+            logger.debug("Hedging %s fetch after %.2fs", adapter.id, delay)
+            tasks.add(fetch())
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                # Both requests can finish in the same round; whichever has content wins
+                for task in done:
+                    try:
+                        content = task.result()
+                    except Exception as e:
+                        logger.debug("Hedged fetch for %s failed: %s", adapter.id, e)
+                        continue
+                    if content:
+                        HEDGED_FETCHES.inc(marketplace=adapter.id, winner='primary' if task is primary else 'hedge')
+                        return content
+            HEDGED_FETCHES.inc(marketplace=adapter.id, winner='none')
+            return ""
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _label_products(self, products: list, marketplace: str) -> list:
+        """Add marketplace info, and the numeric value of each display price, to parsed products."""
+        # Every display price on the page goes through the marketplace's compiled extractor as one batch
+        prices = self.extract_prices_batch([product.get('price') or '' for product in products], marketplace)
+        for product, product_prices in zip(products, prices):
+            product['marketplace'] = marketplace
+            product['price_value'] = product_prices[0]['value'] if product_prices else None
+            # The URL is already absolute if extracted by one of the marketplace_parsers
+            # If not, it needs to be made absolute here.
+            if not product.get('url') or not product['url'].startswith(('http://', 'https://')):
+                product['url'] = urljoin(self.marketplaces[marketplace]['base_url'], product.get('url', ''))
+            product['image'] = ''  # Placeholder, needs more sophisticated extraction
+        return products
     
     def get_relevant_marketplaces(self, current_marketplace: str = None) -> list:
         """Get relevant marketplaces to search based on current marketplace region."""
-        if not current_marketplace:
+        adapter = self.adapters.get(current_marketplace)
+        if adapter is None:
             return list(self.marketplaces.keys())
-        
-        # If user is on Australian site, prioritize Australian marketplaces
-        if current_marketplace.endswith('_au'):
-            au_marketplaces = [k for k in self.marketplaces.keys() if k.endswith('_au')]
-            us_marketplaces = [k for k in self.marketplaces.keys() if not k.endswith('_au') and '_' not in k]
-            return au_marketplaces + us_marketplaces
-        
-        # If user is on US site, prioritize US marketplaces
-        elif current_marketplace in ['amazon', 'ebay', 'walmart', 'target']:
-            us_marketplaces = [k for k in self.marketplaces.keys() if not '_' in k]
-            au_marketplaces = [k for k in self.marketplaces.keys() if k.endswith('_au')]
-            return us_marketplaces + au_marketplaces
-        
-        # Default: return all marketplaces
-        return list(self.marketplaces.keys())
 
-    def compare_prices(self, product_title: str, current_marketplace: str = None, current_price: str = None) -> dict:
-        """Compare prices across all supported marketplaces."""
+        # Marketplaces in the user's region first, then the rest
+        local = [m for m, a in self.adapters.items() if a.region == adapter.region]
+        return local + [m for m in self.adapters if m not in local]
+
+    def plan_comparison(self, product_title: str = '', current_marketplace: str = None, budget: float = None,
+                        explore: bool = True, count: bool = True) -> Plan:
+        """Plan which other marketplaces a comparison searches, best first, within budget seconds.
+
+        Pass count=False for plans that are only inspected, so they stay out of the decision metrics.
+        """
+        current = self.adapters.get(current_marketplace)
+        candidates = [self.adapters[m] for m in self.get_relevant_marketplaces(current_marketplace)
+                      if m != current_marketplace]
+        return self.planner.plan(candidates, product_title, current.region if current else None, budget, explore,
+                                 count)
+
+    def compare_prices(self, product_title: str, current_marketplace: str = None, current_price: str = None,
+                       concurrent: bool = True, deadline: float = None, marketplace_timeout: float = None,
+                       history_max_age: float = None) -> dict:
+        """Compare prices across all supported marketplaces.
+
+        In concurrent mode every marketplace is searched in parallel. Searches
+        still running when the overall deadline passes, or that run longer
+        than the per-marketplace timeout, are reported in 'timed_out' and the
+        results gathered so far are returned. Marketplaces whose circuit
+        breaker is open (see marketplace_health) are listed in 'skipped'.
+
+        Marketplaces scraped within history_max_age seconds are served from
+        the price history store instead of being scraped again.
+
+        Synchronous wrapper around compare_prices_async.
+        """
+        return run_sync(self.compare_prices_async(product_title, current_marketplace, current_price, concurrent,
+                                                  deadline, marketplace_timeout, history_max_age))
+
+    async def compare_prices_async(self, product_title: str, current_marketplace: str = None,
+                                   current_price: str = None, concurrent: bool = True, deadline: float = None,
+                                   marketplace_timeout: float = None, history_max_age: float = None) -> dict:
+        """Async form of compare_prices."""
+        async for event, payload in self.iter_compare_prices_async(product_title, current_marketplace,
+                                                                   current_price, concurrent, deadline,
+                                                                   marketplace_timeout, history_max_age):
+            if event == 'summary':
+                return payload
+
+    def iter_compare_prices(self, product_title: str, current_marketplace: str = None, current_price: str = None,
+                            concurrent: bool = True, deadline: float = None, marketplace_timeout: float = None,
+                            history_max_age: float = None):
+        """Incremental form of compare_prices.
+
+        Yields ('match', {...}) as soon as each marketplace's best match is
+        known, ('timeout', {...}) for marketplaces that ran out of time,
+        ('skipped', {...}) for marketplaces whose circuit breaker is open, and
+        finally ('summary', results) with the price-sorted comparison.
+        """
+        return iter_sync(self.iter_compare_prices_async(product_title, current_marketplace, current_price,
+                                                        concurrent, deadline, marketplace_timeout, history_max_age))
+
+    async def iter_compare_prices_async(self, product_title: str, current_marketplace: str = None,
+                                        current_price: str = None, concurrent: bool = True, deadline: float = None,
+                                        marketplace_timeout: float = None, history_max_age: float = None):
+        """Async generator form of iter_compare_prices."""
+        started = time.time()
+        # Normalize and tokenize the query once for every marketplace's candidates
+        matcher = ProductMatcher(product_title)
         results = {
             'query': product_title,
             'current_marketplace': current_marketplace,
             'current_price': current_price,
             'results': [],
-            'timestamp': time.time()
+            'timed_out': [],
+            'skipped': [],
+            'pruned': {},
+            'stopped_early': [],
+            'cache': {},
+            'timestamp': started
         }
+        deadline = COMPARE_DEADLINE if deadline is None else deadline
+        
+        # Plan which other marketplaces to search, best first, within the deadline
+        plan = self.plan_comparison(product_title, current_marketplace, deadline)
+        results['pruned'] = plan.pruned
+        relevant_marketplaces = plan.marketplaces
         
-        # Get relevant marketplaces to search
-        relevant_marketplaces = [m for m in self.get_relevant_marketplaces(current_marketplace) if m not in ['ebay', 'ebay_au', 'walmart', 'mydeal_au']]
+        # Serve marketplaces with cached results first and only search the rest
+        if self.cache is not None:
+            uncached = []
+            for marketplace in relevant_marketplaces:
+                products = self._cached_products(product_title, marketplace, current_marketplace, results)
+                if products is None:
+                    uncached.append(marketplace)
+                else:
+                    yield 'match', self._add_best_match(results, products, product_title, marketplace, matcher)
+            relevant_marketplaces = uncached
         
-        # Search relevant marketplaces except the current one
+        # Then marketplaces with a recent enough scrape in the price history store
+        history_max_age = HISTORY_MAX_AGE if history_max_age is None else history_max_age
+        if self.history is not None and history_max_age > 0:
+            normalized_title = self.clean_product_title(product_title).lower()
+            unrecorded = []
+            for marketplace in relevant_marketplaces:
+                offers = await asyncio.to_thread(self.history.latest_offers, normalized_title, marketplace,
+                                                 history_max_age)
+                if not offers:
+                    unrecorded.append(marketplace)
+                    continue
+                results['cache'][marketplace] = {'status': 'history',
+                                                 'age': round(time.time() - offers[0]['scraped_at'], 1)}
+                yield 'match', self._add_best_match(results, offers, product_title, marketplace, matcher)
+            relevant_marketplaces = unrecorded
+        
+        # Skip marketplaces whose circuit breaker is open rather than wait on them
+        health = get_health_tracker()
         for marketplace in relevant_marketplaces:
-            if marketplace != current_marketplace:
-                products = self.search_marketplace(
-                    product_title, 
-                    marketplace, 
-                    current_marketplace
-                )
-                print(f"Raw products found for {marketplace}: {products}") # Debug print
-                # Find the best match from the scraped products for this marketplace
-                best_match_for_marketplace = self._find_best_match(products, product_title)
-                print(f"Best match for {marketplace}: {best_match_for_marketplace}") # Debug print
-                results['results'].extend(best_match_for_marketplace)
+            if not health.available(marketplace):
+                results['skipped'].append(marketplace)
+                yield 'skipped', {'marketplace': marketplace, 'retry_in': health.retry_in(marketplace)}
+        relevant_marketplaces = [m for m in relevant_marketplaces if m not in results['skipped']]
         
-        print(f"Final results before returning: {results['results']}") # Debug print
-        # Sort results by price (if available)
-        def sort_key(product):
-            try:
-                price_str = product.get('price', '').replace('$', '').replace(',', '')
-                return float(price_str) if price_str else float('inf')
-            except:
-                return float('inf')
+        if concurrent:
+            async for event in self._compare_concurrently(product_title, current_marketplace, relevant_marketplaces,
+                                                          results, matcher, deadline,
+                                                          MARKETPLACE_TIMEOUT if marketplace_timeout is None else marketplace_timeout,
+                                                          plan):
+                yield event
+        else:
+            for position, marketplace in enumerate(relevant_marketplaces):
+                if self._can_stop_early(results, plan, relevant_marketplaces[position:]):
+                    results['stopped_early'].extend(relevant_marketplaces[position:])
+                    break
+                search_started = time.perf_counter()
+                try:
+                    products = await self._search_and_cache_async(
+                        product_title, 
+                        marketplace, 
+                        current_marketplace
+                    )
+                except BreakerOpen as e:
+                    results['skipped'].append(marketplace)
+                    yield 'skipped', {'marketplace': marketplace, 'retry_in': e.retry_in}
+                    continue
+                event = self._add_best_match(results, products, product_title, marketplace, matcher)
+                self._record_search(plan, marketplace, event, time.perf_counter() - search_started)
+                yield 'match', event
         
-        results['results'].sort(key=sort_key)
+        if _debug_sampled():
+            logger.debug("Final results before sorting: %s", results['results'])
+        # Sort results by price (if available)
+        with time_stage('sort'):
+            results['results'].sort(key=self._price_sort_key)
+        results['elapsed'] = round(time.time() - started, 3)
+        STAGE_SECONDS.observe(results['elapsed'], stage='compare')
         
-        return results
+        yield 'summary', results
+
+    def iter_compare_batch(self, items: list, in_order: bool = True, deadline: float = None,
+                           marketplace_timeout: float = None, history_max_age: float = None):
+        """Compare prices for many products, sharing marketplace searches between them.
+
+        items are dicts with a 'title' and optional 'current_marketplace' and
+        'current_price'. Titles that normalize to the same query share one
+        search per marketplace, and every search is queued at once through
+        the rate limiter onto the shared search executor. Cached and recent
+        history results are used first, as in iter_compare_prices.
+
+        Yields ('result', results) per item, with the item's 'index', in
+        input order (in_order=True) or as soon as all of an item's searches
+        have finished, then ('done', stats).
+        """
+        started = time.time()
+        deadline = BATCH_DEADLINE if deadline is None else deadline
+        marketplace_timeout = MARKETPLACE_TIMEOUT if marketplace_timeout is None else marketplace_timeout
+        history_max_age = HISTORY_MAX_AGE if history_max_age is None else history_max_age
+
+        # Plan every item's searches; items with the same normalized query share them
+        plans = []
+        searches = {}
+        search_plans = {}
+        waiting = {}
+        for index, item in enumerate(items):
+            title = item.get('title') or ''
+            keys = []
+            if self.clean_product_title(title):
+                plan = self.plan_comparison(title, item.get('current_marketplace'))
+                keys = [self._cache_key(title, marketplace) for marketplace in plan.marketplaces]
+                for key in keys:
+                    # A shared search's outcome is reported to the planner once, under the first item's plan
+                    search_plans.setdefault(key, plan)
+            plans.append(keys)
+            for key in keys:
+                searches.setdefault(key, title)
+                waiting.setdefault(key, []).append(index)
+
+        outcomes = {}
+        for key, title in searches.items():
+            normalized_title, marketplace = key
+            if self.cache is not None:
+                lookup = {'cache': {}}
+                products = self._cached_products(title, marketplace, None, lookup)
+                if products is not None:
+                    outcomes[key] = (products, lookup['cache'][marketplace])
+                    continue
+            if self.history is not None and history_max_age > 0:
+                offers = self.history.latest_offers(normalized_title, marketplace, history_max_age)
+                if offers:
+                    outcomes[key] = (offers, {'status': 'history',
+                                              'age': round(time.time() - offers[0]['scraped_at'], 1)})
+
+        # Searches on marketplaces with an open circuit breaker are skipped
+        health = get_health_tracker()
+        for key in searches:
+            if key not in outcomes and not health.available(key[1]):
+                outcomes[key] = (None, 'skipped')
+
+        remaining = [len([key for key in keys if key not in outcomes]) for keys in plans]
+        search_seconds = {}
+        ready = set()
+        next_index = 0
+
+        def finish(index):
+            item = items[index]
+            title = item.get('title') or ''
+            matcher = ProductMatcher(title)
+            results = {
+                'index': index,
+                'query': title,
+                'current_marketplace': item.get('current_marketplace'),
+                'current_price': item.get('current_price'),
+                'results': [],
+                'timed_out': [],
+                'skipped': [],
+                'cache': {},
+                'timestamp': started
+            }
+            found = {}
+            for key in plans[index]:
+                marketplace = key[1]
+                products, cache_info = outcomes[key]
+                if products is None:
+                    results['skipped' if cache_info == 'skipped' else 'timed_out'].append(marketplace)
+                    continue
+                results['cache'][marketplace] = cache_info
+                found[marketplace] = products
+            # Every marketplace's results are in, so they are matched as one batch
+            events = self._add_best_matches(results, found, title, matcher)
+            for key in plans[index]:
+                if key[1] in events and waiting[key][0] == index:
+                    self._record_search(search_plans[key], key[1], events[key[1]], search_seconds.get(key))
+            with time_stage('sort'):
+                results['results'].sort(key=self._price_sort_key)
+            results['elapsed'] = round(time.time() - started, 3)
+            return results
+
+        def release(indexes):
+            """Results for finished items, in the requested order."""
+            nonlocal next_index
+            if not in_order:
+                return [finish(index) for index in indexes]
+            ready.update(indexes)
+            released = []
+            while next_index in ready:
+                released.append(finish(next_index))
+                ready.discard(next_index)
+                next_index += 1
+            return released
+
+        for results in release([index for index, count in enumerate(remaining) if count == 0]):
+            yield 'result', results
+
+        live = {key: (title, key[1]) for key, title in searches.items() if key not in outcomes}
+        timed_out = 0
+        for key, products, seconds in self._search_concurrently(live, None, deadline, marketplace_timeout):
+            search_seconds[key] = seconds
+            if products is None:
+                timed_out += 1
+                outcomes[key] = (None, None)
+                if seconds is not None:
+                    # A search that ran out of time counts as a slow miss
+                    self._record_search(search_plans[key], key[1], None, seconds)
+            elif products is SKIPPED:
+                outcomes[key] = (None, 'skipped')
+            else:
+                outcomes[key] = (products, {'status': MISS, 'age': 0})
+            finished = []
+            for index in waiting[key]:
+                remaining[index] -= 1
+                if remaining[index] == 0:
+                    finished.append(index)
+            for results in release(finished):
+                yield 'result', results
+
+        yield 'done', {
+            'items': len(items),
+            'unique_queries': len({key[0] for key in searches}),
+            'searches': len(searches),
+            'live_searches': len(live),
+            'skipped': sum(1 for _, cache_info in outcomes.values() if cache_info == 'skipped'),
+            'timed_out': timed_out,
+            'elapsed': round(time.time() - started, 3)
+        }
+
+    async def _compare_concurrently(self, product_title: str, current_marketplace: str, marketplaces: list,
+                                    results: dict, matcher: ProductMatcher, deadline: float,
+                                    marketplace_timeout: float, plan: Plan = None):
+        """Search marketplaces concurrently under an overall deadline and per-marketplace timeouts.
+
+        Yields match and timeout events in completion order. Searches wait for
+        rate limit budget on the event loop, and the per-marketplace timeout
+        includes that wait; a comparison that joins an identical search
+        already in flight spends no budget. A search that ran out of time
+        keeps running in the background so its results still reach the
+        cache. Once enough marketplaces have given a high-confidence
+        match and every search in the shopper's region has finished, the
+        remaining searches are dropped and listed in 'stopped_early'.
+        """
+        async def run_search(marketplace):
+            started = time.perf_counter()
+            search = keep_running(asyncio.ensure_future(
+                self._search_and_cache_async(product_title, marketplace, current_marketplace)))
+            try:
+                return await asyncio.wait_for(asyncio.shield(search), marketplace_timeout), \
+                    time.perf_counter() - started
+            except asyncio.TimeoutError:
+                # A search that ran out of time counts as a slow miss
+                self._record_search(plan, marketplace, None, marketplace_timeout)
+                raise
+
+        loop = asyncio.get_running_loop()
+        pending = {asyncio.ensure_future(run_search(marketplace)): marketplace for marketplace in marketplaces}
+        deadline_at = loop.time() + deadline
+        try:
+            while pending:
+                if self._can_stop_early(results, plan, pending.values()):
+                    # Queued searches give up their slot, running ones finish in the background
+                    for task, marketplace in pending.items():
+                        task.cancel()
+                        results['stopped_early'].append(marketplace)
+                    logger.debug("Stopped early with enough matches; not waiting for %s", results['stopped_early'])
+                    pending.clear()
+                    break
+
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, deadline_at - loop.time()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Overall deadline: queued searches give up their slot, running ones finish in the background
+                    for task, marketplace in pending.items():
+                        task.cancel()
+                        results['timed_out'].append(marketplace)
+                        logger.info("Search timed out for %s", marketplace)
+                        yield 'timeout', {'marketplace': marketplace}
+                    pending.clear()
+                    break
+
+                for task in done:
+                    marketplace = pending.pop(task)
+                    seconds = None
+                    try:
+                        products, seconds = task.result()
+                    except asyncio.TimeoutError:
+                        results['timed_out'].append(marketplace)
+                        logger.info("Search timed out for %s", marketplace)
+                        yield 'timeout', {'marketplace': marketplace}
+                        continue
+                    except BreakerOpen as e:
+                        # The breaker opened, or went half open with another probe, after the comparison checked it
+                        results['skipped'].append(marketplace)
+                        yield 'skipped', {'marketplace': marketplace, 'retry_in': e.retry_in}
+                        continue
+                    except Exception as e:
+                        logger.error("Error searching %s: %s", marketplace, e)
+                        products = []
+                    event = self._add_best_match(results, products, product_title, marketplace, matcher)
+                    self._record_search(plan, marketplace, event, seconds)
+                    yield 'match', event
+        finally:
+            # The consumer stopped early (e.g. a streaming client went away)
+            for task in pending:
+                task.cancel()
+
+    def _can_stop_early(self, results: dict, plan: Plan, remaining) -> bool:
+        """Whether to drop the remaining searches: enough matches, and none of them is in the shopper's region."""
+        if plan is not None and plan.region is not None and \
+                any(self.adapters[marketplace].region == plan.region for marketplace in remaining):
+            return False
+        return self._enough_matches(results)
+
+    @staticmethod
+    def _enough_matches(results: dict) -> bool:
+        """Whether enough marketplaces have given a high-confidence match to stop searching."""
+        if PLANNER_ENOUGH_MATCHES <= 0:
+            return False
+        confident = sum(1 for product in results['results']
+                        if product.get('match_score', 0) >= PLANNER_CONFIDENT_SCORE)
+        return confident >= PLANNER_ENOUGH_MATCHES
+
+    def _record_search(self, plan: Plan, marketplace: str, event: dict, seconds: float = None):
+        """Feed a live search's outcome (event is its match payload, None if it timed out) to the planner."""
+        if plan is None or (event is not None and event['cache']['status'] != MISS):
+            return
+        matches = event['results'] if event is not None else []
+        confident = any(product.get('match_score', 0) >= PLANNER_CONFIDENT_SCORE for product in matches)
+        self.planner.record(marketplace, plan.region, plan.category, bool(matches), confident, seconds)
+
+    def _search_concurrently(self, searches: dict, current_marketplace: str, deadline: float,
+                             marketplace_timeout: float):
+        """Run {key: (product_title, marketplace)} searches in parallel through the rate limiter.
+
+        Yields (key, products, seconds) in completion order, with products
+        None for a search that missed the overall deadline or its
+        per-marketplace timeout, or SKIPPED for one the marketplace's circuit
+        breaker turned away. seconds is how long the search ran, None if it
+        never left the rate limiter's queue.
+        """
+        start_times = {}
+
+        def run_search(key, product_title, marketplace):
+            start_times[key] = time.time()
+            return self._search_and_cache(product_title, marketplace, current_marketplace, throttle=False)
+
+        # Searches wait in the rate limiter's queue, not on a worker thread
+        pending = {rate_limiter.schedule(marketplace, run_search, key, title, marketplace): key
+                   for key, (title, marketplace) in searches.items()}
+        deadline_at = time.time() + deadline
+
+        while pending:
+            now = time.time()
+            # Wake up for the overall deadline or the earliest per-marketplace timeout
+            wake_at = deadline_at
+            for key in pending.values():
+                if key in start_times:
+                    wake_at = min(wake_at, start_times[key] + marketplace_timeout)
+            done, _ = wait(pending, timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                key = pending.pop(future)
+                try:
+                    products = future.result()
+                except BreakerOpen:
+                    products = SKIPPED
+                except Exception as e:
+                    logger.error("Error searching %s: %s", searches[key][1], e)
+                    products = []
+                yield key, products, time.time() - start_times[key]
+
+            now = time.time()
+            for future, key in list(pending.items()):
+                expired = now >= deadline_at
+                if key in start_times and now - start_times[key] >= marketplace_timeout:
+                    expired = True
+                if expired:
+                    # Queued searches are cancelled; running ones finish in the background
+                    future.cancel()
+                    del pending[future]
+                    logger.info("Search timed out for %s", searches[key][1])
+                    yield key, None, now - start_times[key] if key in start_times else None
+
+    def _cache_key(self, product_title: str, marketplace: str) -> tuple:
+        return (self.clean_product_title(product_title).lower(), marketplace)
+
+    def _cached_products(self, product_title: str, marketplace: str, current_marketplace: str, results: dict):
+        """Return cached products for a marketplace, or None on a miss.
+
+        Stale entries are returned immediately while a background search
+        refreshes them.
+        """
+        key = self._cache_key(product_title, marketplace)
+        products, age, status = self.cache.get(key)
+        if status == MISS:
+            return None
+        results['cache'][marketplace] = {'status': status, 'age': round(age, 1)}
+        if status == STALE and self.cache.start_refresh(key):
+            def refresh():
+                try:
+                    self._search_and_cache(product_title, marketplace, current_marketplace, throttle=False)
+                finally:
+                    self.cache.finish_refresh(key)
+            rate_limiter.schedule(marketplace, refresh)
+        return products
+
+    def _search_and_cache(self, product_title: str, marketplace: str, current_marketplace: str,
+                          throttle: bool = True) -> list:
+        """Search a marketplace live and store non-empty results in the cache and price history."""
+        return run_sync(self._search_and_cache_async(product_title, marketplace, current_marketplace, throttle))
+
+    async def _search_and_cache_async(self, product_title: str, marketplace: str, current_marketplace: str,
+                                      throttle: bool = True) -> list:
+        """Async form of _search_and_cache."""
+        products = await self.search_marketplace_async(product_title, marketplace, current_marketplace,
+                                                       throttle=throttle)
+        if self.cache is not None and products:
+            self.cache.set(self._cache_key(product_title, marketplace), products)
+        if self.history is not None and products:
+            self.history.record(self.clean_product_title(product_title).lower(), marketplace, products)
+        return products
 
-    def _find_best_match(self, products: list, query: str) -> list:
-        """Finds the best matching product from a list based on query similarity."""
+    def _add_best_match(self, results: dict, products: list, product_title: str, marketplace: str,
+                        matcher: ProductMatcher = None):
+        """Add the best match for one marketplace's products to the comparison results.
+
+        Returns the marketplace's match event payload.
+        """
+        return self._add_best_matches(results, {marketplace: products}, product_title, matcher)[marketplace]
+
+    def _add_best_matches(self, results: dict, products_by_marketplace: dict, product_title: str,
+                          matcher: ProductMatcher = None) -> dict:
+        """Add the best match for each marketplace's products, scored in one batch across marketplaces.
+
+        Returns each marketplace's match event payload.
+        """
+        matcher = matcher or ProductMatcher(product_title)
+        sampled = _debug_sampled()
+        if sampled:
+            logger.debug("Raw products found: %s", products_by_marketplace)
+        # Find the best match from the scraped products of every marketplace at once
+        stage_marketplace = next(iter(products_by_marketplace)) if len(products_by_marketplace) == 1 else ''
+        with time_stage('match', stage_marketplace):
+            best = matcher.best_matches(products_by_marketplace)
+        if sampled:
+            logger.debug("Best matches: %s", best)
+        events = {}
+        for marketplace in products_by_marketplace:
+            cache_info = results['cache'].setdefault(marketplace, {'status': MISS, 'age': 0})
+            matches = []
+            if marketplace in best:
+                score, product = best[marketplace]
+                # Copy so cached product dicts are never mutated
+                product = dict(product, match_score=score)
+                product['cache_status'] = cache_info['status']
+                product['age'] = cache_info['age']
+                matches.append(product)
+            results['results'].extend(matches)
+            events[marketplace] = {'marketplace': marketplace, 'results': matches, 'cache': cache_info}
+        return events
+
+    @staticmethod
+    def _price_sort_key(product: dict) -> float:
+        """Sort key ordering products by numeric price, unknown prices last."""
+        if product.get('price_value') is not None:
+            return product['price_value']
+        try:
+            price_str = product.get('price', '').replace('$', '').replace(',', '')
+            return float(price_str) if price_str else float('inf')
+        except:
+            return float('inf')
+
+    def score_products(self, products: list, query: str, matcher: ProductMatcher = None) -> list:
+        """Score products against the query; returns (score, product) pairs, best first."""
+        matcher = matcher or ProductMatcher(query)
+        return matcher.score_batch(products)
+
+    def _find_best_match(self, products: list, query: str, matcher: ProductMatcher = None,
+                         threshold: float = None) -> list:
+        """Finds the best matching product from a list based on query similarity.
+
+        Returns at most one product, copied with its 'match_score' added.
+        """
         if not products:
             return []
 
-        # Simple approach: prioritize exact title match or high similarity
-        best_match = None
-        highest_similarity = 0.0
-
-        cleaned_query = self.clean_product_title(query) # Clean the query once
-        print(f"_find_best_match: Cleaned Query: {cleaned_query}") # Debug print
+        matcher = matcher or ProductMatcher(query)
+        threshold = matcher.threshold if threshold is None else threshold
+        best_score, best_match = self.score_products(products, query, matcher)[0]
+        logger.debug("_find_best_match: best score %.3f for %r (threshold %.2f)",
+                     best_score, best_match.get('title'), threshold)
+        if best_score >= threshold:
+            return [dict(best_match, match_score=best_score)]
+        else:
+            return [] # No good match found
 
-        for product in products:
-            product_title = self.clean_product_title(product.get('title', '')) # Clean product title
-            print(f"_find_best_match: Comparing with Product Title: {product_title}") # Debug print
 
-            # Prioritize exact match
-            if cleaned_query == product_title:
-                print(f"_find_best_match: Exact match found: {product_title}") # Debug print
-                return [product] # Return immediately if exact match found
+_default_scraper = None
 
-            # Calculate similarity (e.g., using Jaccard index or simple word overlap)
-            # For simplicity, let's use word overlap for now
-            query_words = set(cleaned_query.split())
-            product_words = set(product_title.split())
-            
-            common_words = len(query_words.intersection(product_words))
-            total_words = len(query_words.union(product_words))
-            
-            if total_words > 0:
-                similarity = common_words / total_words
-            else:
-                similarity = 0.0
-            print(f"_find_best_match: Similarity: {similarity}") # Debug print
 
-            if similarity > highest_similarity:
-                highest_similarity = similarity
-                best_match = product
-        
-        print(f"_find_best_match: Best match found (before threshold): {best_match} with similarity {highest_similarity}") # Debug print
-        if best_match and highest_similarity >= 0.3: # Lowered threshold for testing
-            return [best_match]
-        else:
-            return [] # No good match found
+def get_default_scraper() -> PriceScraper:
+    """Shared scraper backed by the process-wide result cache and price history."""
+    global _default_scraper
+    if _default_scraper is None:
+        _default_scraper = PriceScraper(cache=get_result_cache(), history=get_history_store(),
+                                        planner=get_query_planner())
+    return _default_scraper
 
 
-def search_product_prices(product_title: str, current_marketplace: str = None, current_price: str = None) -> dict:
+def search_product_prices(product_title: str, current_marketplace: str = None, current_price: str = None,
+                          deadline: float = None) -> dict:
     """Main function to search for product prices across marketplaces."""
-    scraper = PriceScraper()
-    return scraper.compare_prices(product_title, current_marketplace, current_price)
+    scraper = get_default_scraper()
+    return scraper.compare_prices(product_title, current_marketplace, current_price, deadline=deadline)
+
+
+async def search_product_prices_async(product_title: str, current_marketplace: str = None,
+                                     current_price: str = None, deadline: float = None) -> dict:
+    """Async form of search_product_prices, for callers already on an event loop."""
+    scraper = get_default_scraper()
+    return await scraper.compare_prices_async(product_title, current_marketplace, current_price, deadline=deadline)
+
+
+def stream_product_prices_async(product_title: str, current_marketplace: str = None, current_price: str = None,
+                                deadline: float = None):
+    """Async generator form of stream_product_prices."""
+    scraper = get_default_scraper()
+    return scraper.iter_compare_prices_async(product_title, current_marketplace, current_price, deadline=deadline)
+
+
+def stream_batch_prices(items: list, in_order: bool = True, deadline: float = None):
+    """Batch form of stream_product_prices; yields ('result', results) per item, then ('done', stats)."""
+    scraper = get_default_scraper()
+    return scraper.iter_compare_batch(items, in_order=in_order, deadline=deadline)
+
+
+def stream_product_prices(product_title: str, current_marketplace: str = None, current_price: str = None,
+                          deadline: float = None):
+    """Like search_product_prices, but yields (event, payload) pairs as marketplaces finish."""
+    scraper = get_default_scraper()
+    return scraper.iter_compare_prices(product_title, current_marketplace, current_price, deadline=deadline)
 
 
 # Example usage
 if __name__ == "__main__":
     # Test the scraper
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
     test_query = "iPhone 14 Pro 128GB"
     results = search_product_prices(test_query, "amazon", "$999.00")
     print(json.dumps(results, indent=2))
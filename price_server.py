@@ -1,12 +1,122 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, g, send_file
 from flask_cors import CORS
 import os
+import sys
 import json
-from price_scraper import search_product_prices
+import atexit
+import hmac
+import logging
+import signal
+import time
+from price_scraper import search_product_prices, stream_product_prices, stream_batch_prices, get_default_scraper, rate_limiter
+from marketplace_health import get_health_tracker
+from marketplaces import all_adapters
+from metrics import REGISTRY, CONTENT_TYPE, HTTP_REQUESTS, HTTP_REQUEST_SECONDS
+from profiling import RequestProfile, ProfilingSwitch, get_profile_store
+from single_flight import SingleFlight
+from watchlist import WatchlistRefresher, WATCHLIST_ENABLED
+from browser_pool import shutdown_browser_pool
+from parse_pool import get_parse_pool, shutdown_parse_pool
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Point-in-time values refreshed on each /metrics scrape
+RATE_LIMIT_QUEUE_DEPTH = REGISTRY.gauge('price_rate_limit_queue_depth', 'Searches waiting for rate limit budget.',
+                                        ('marketplace',))
+CACHE_ENTRIES = REGISTRY.gauge('price_cache_entries', 'Entries in the search result cache.')
+CACHE_LOOKUPS = REGISTRY.gauge('price_cache_lookups', 'Search result cache lookups by result.', ('result',))
+
+# Concurrent identical comparisons attach to the scrape already running
+comparison_flights = SingleFlight()
+
+# Background refresher that keeps popular products' comparisons warm
+watchlist = WatchlistRefresher(get_default_scraper())
+
+# Largest number of titles accepted by one batch comparison
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 1000))
+
+# Admin endpoints and profiling need this token in X-Admin-Token; without one set only local requests are allowed
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+# Requests carrying this header (from an admin) are profiled end to end
+PROFILE_HEADER = 'X-Profile'
+PROFILED_ENDPOINTS = ('compare_prices', 'search_products')
+
+# Admin toggle that profiles the next N requests to the profiled endpoints
+profiling_switch = ProfilingSwitch()
+
+def parse_deadline(value):
+    """A request's deadline in seconds, or None if not given; raises ValueError if it is not a positive number."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError('deadline must be a number')
+    try:
+        deadline = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('deadline must be a number') from None
+    if not deadline > 0 or deadline == float('inf'):
+        raise ValueError('deadline must be a positive number')
+    return deadline
+
+def invalid_parameter(e: ValueError):
+    return jsonify({
+        'error': 'Invalid parameter',
+        'message': str(e)
+    }), 400
+
+def is_admin_request() -> bool:
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+def _should_profile() -> bool:
+    if request.headers.get(PROFILE_HEADER) and is_admin_request():
+        return True
+    return profiling_switch.take()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if request.endpoint in PROFILED_ENDPOINTS and _should_profile():
+        body = request.get_json(silent=True) or {}
+        g.profile = RequestProfile(request.endpoint, {
+            'path': request.path,
+            'query': body.get('title') or body.get('query'),
+            'marketplace': body.get('currentMarketplace') or body.get('marketplace')
+        })
+        g.profile.start()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.after_request
+def finish_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    profile.stop()
+    try:
+        get_profile_store().save(profile)
+    except OSError as e:
+        logger.error("Error saving profile %s: %s", profile.id, e)
+        return response
+    response.headers['X-Profile-Id'] = profile.id
+    data = response.get_json(silent=True) if response.is_json else None
+    if isinstance(data, dict):
+        data['profile_id'] = profile.id
+        response.set_data(json.dumps(data))
+    return response
+
 @app.route('/', methods=['GET'])
 def home():
     """Root endpoint with API information."""
@@ -17,8 +127,14 @@ def home():
         'endpoints': {
             'health': '/health',
             'compare_prices': '/compare-prices',
+            'compare_prices_stream': '/compare-prices/stream',
+            'compare_prices_batch': '/compare-prices/batch',
             'search': '/search',
-            'marketplaces': '/marketplaces'
+            'history': '/history',
+            'marketplaces': '/marketplaces',
+            'marketplace_health': '/marketplaces/health',
+            'marketplace_plan': '/marketplaces/plan',
+            'metrics': '/metrics'
         }
     })
 
@@ -27,9 +143,27 @@ def health_check():
     """Health check endpoint."""
     return jsonify({
         'status': 'healthy',
-        'service': 'Price Comparison Server'
+        'service': 'Price Comparison Server',
+        'rate_limits': rate_limiter.stats(),
+        'parse_pool': get_parse_pool().stats(),
+        'open_breakers': [marketplace for marketplace, stats in get_health_tracker().stats().items()
+                          if stats['state'] != 'closed'],
+        'watchlist': watchlist.stats()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage latency histograms and outcome counters in Prometheus text format."""
+    for marketplace, stats in rate_limiter.stats().items():
+        RATE_LIMIT_QUEUE_DEPTH.set(stats['queue_depth'], marketplace=marketplace)
+    cache = get_default_scraper().cache
+    if cache is not None:
+        cache_stats = cache.stats()
+        CACHE_ENTRIES.set(cache_stats['entries'])
+        for result in ('hits', 'stale_hits', 'misses'):
+            CACHE_LOOKUPS.set(cache_stats[result], result=result)
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/compare-prices', methods=['POST'])
 def compare_prices():
     """Compare prices across marketplaces."""
@@ -49,23 +183,148 @@ def compare_prices():
             return jsonify({
                 'error': 'Product title is required'
             }), 400
+        try:
+            deadline = parse_deadline(data.get('deadline'))
+        except ValueError as e:
+            return invalid_parameter(e)
         
-        # Perform price comparison
-        results = search_product_prices(
+        watchlist.track(title, current_marketplace)
+        
+        # Perform price comparison, sharing any identical comparison in flight
+        # Only comparisons with the same deadline share a flight, so nobody gets a result cut short by another's
+        flight_key = (get_default_scraper().clean_product_title(title).lower(), current_marketplace, deadline)
+        results, shared = comparison_flights.do(
+            flight_key,
+            search_product_prices,
             product_title=title,
             current_marketplace=current_marketplace,
-            current_price=current_price
+            current_price=current_price,
+            deadline=deadline
         )
+        if shared:
+            results = dict(results, query=title, current_price=current_price, shared=True)
         
         return jsonify(results)
         
     except Exception as e:
-        print(f"Error in compare_prices: {e}")
+        logger.exception("Error in compare_prices: %s", e)
         return jsonify({
             'error': 'Internal server error',
             'message': str(e)
         }), 500
 
+@app.route('/compare-prices/stream', methods=['GET', 'POST'])
+def compare_prices_stream():
+    """Stream each marketplace's best match as Server-Sent Events, then a summary."""
+    data = request.get_json(silent=True) if request.method == 'POST' else request.args
+    if not data:
+        return jsonify({
+            'error': 'No JSON data provided'
+        }), 400
+    
+    title = data.get('title')
+    current_marketplace = data.get('currentMarketplace')
+    current_price = data.get('currentPrice')
+    
+    if not title:
+        return jsonify({
+            'error': 'Product title is required'
+        }), 400
+    try:
+        deadline = parse_deadline(data.get('deadline'))
+    except ValueError as e:
+        return invalid_parameter(e)
+    
+    watchlist.track(title, current_marketplace)
+    
+    def generate():
+        try:
+            for event, payload in stream_product_prices(
+                product_title=title,
+                current_marketplace=current_marketplace,
+                current_price=current_price,
+                deadline=deadline
+            ):
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            logger.exception("Error in compare_prices_stream: %s", e)
+            yield f"event: error\ndata: {json.dumps({'error': 'Internal server error', 'message': str(e)})}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/compare-prices/batch', methods=['POST'])
+def compare_prices_batch():
+    """Compare many products at once, streaming one Server-Sent Event per product.
+
+    Body: {"items": [{"title": ..., "currentMarketplace": ..., "currentPrice": ...}],
+    "order": "input" | "completion", "deadline": seconds}. A plain list of titles
+    may be sent as "titles" instead of "items".
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({
+            'error': 'No JSON data provided'
+        }), 400
+    
+    raw_items = data.get('items')
+    if raw_items is None:
+        raw_items = [{'title': title} for title in data.get('titles') or []]
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({
+            'error': 'A non-empty list of items is required'
+        }), 400
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        return jsonify({
+            'error': f'At most {BATCH_MAX_ITEMS} items per batch'
+        }), 400
+    
+    items = []
+    invalid = []
+    for index, item in enumerate(raw_items):
+        if not isinstance(item, dict) or not item.get('title'):
+            invalid.append(index)
+            continue
+        items.append({
+            'title': item['title'],
+            'current_marketplace': item.get('currentMarketplace'),
+            'current_price': item.get('currentPrice')
+        })
+    if invalid:
+        return jsonify({
+            'error': 'Product title is required',
+            'invalid_items': invalid
+        }), 400
+    
+    order = data.get('order', 'input')
+    if order not in ('input', 'completion'):
+        return jsonify({
+            'error': "order must be 'input' or 'completion'"
+        }), 400
+    try:
+        deadline = parse_deadline(data.get('deadline'))
+    except ValueError as e:
+        return invalid_parameter(e)
+    
+    def generate():
+        try:
+            for event, payload in stream_batch_prices(
+                items,
+                in_order=order == 'input',
+                deadline=deadline
+            ):
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            logger.exception("Error in compare_prices_batch: %s", e)
+            yield f"event: error\ndata: {json.dumps({'error': 'Internal server error', 'message': str(e)})}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/search', methods=['POST'])
 def search_products():
     """Search for products on specific marketplace."""
@@ -92,7 +351,49 @@ def search_products():
         })
         
     except Exception as e:
-        print(f"Error in search_products: {e}")
+        logger.exception("Error in search_products: %s", e)
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+@app.route('/history', methods=['GET'])
+def price_history():
+    """Min/max/latest price series for a product, downsampled on the server."""
+    try:
+        title = request.args.get('title')
+        if not title:
+            return jsonify({
+                'error': 'Product title is required'
+            }), 400
+        
+        marketplace = request.args.get('marketplace')
+        days = float(request.args.get('days', 30))
+        points = int(request.args.get('points', 100))
+        
+        scraper = get_default_scraper()
+        normalized_title = scraper.clean_product_title(title).lower()
+        series = scraper.history.history(
+            normalized_title,
+            marketplace=marketplace,
+            since=time.time() - days * 86400,
+            max_points=points
+        )
+        
+        return jsonify({
+            'query': title,
+            'normalized_title': normalized_title,
+            'days': days,
+            'series': series
+        })
+        
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid parameter',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.exception("Error in price_history: %s", e)
         return jsonify({
             'error': 'Internal server error',
             'message': str(e)
@@ -102,60 +403,100 @@ def search_products():
 def get_marketplaces():
     """Get list of supported marketplaces."""
     return jsonify({
-        'marketplaces': [
-            {
-                'id': 'amazon',
-                'name': 'Amazon US',
-                'supported': True
-            },
-            {
-                'id': 'amazon_au',
-                'name': 'Amazon AU',
-                'supported': True
-            },
-            {
-                'id': 'ebay',
-                'name': 'eBay US',
-                'supported': True
-            },
-            {
-                'id': 'ebay_au',
-                'name': 'eBay AU',
-                'supported': True
-            },
-            {
-                'id': 'walmart',
-                'name': 'Walmart',
-                'supported': True
-            },
-            {
-                'id': 'target',
-                'name': 'Target US',
-                'supported': True
-            },
-            {
-                'id': 'target_au',
-                'name': 'Target AU',
-                'supported': True
-            },
-            {
-                'id': 'jbhifi_au',
-                'name': 'JB Hi-Fi AU',
-                'supported': True
-            },
-            {
-                'id': 'thegoodguys_au',
-                'name': 'The Good Guys AU',
-                'supported': True
-            },
-            {
-                'id': 'mydeal_au',
-                'name': 'MyDeal AU',
-                'supported': True
-            }
-        ]
+        'marketplaces': [adapter.describe() for adapter in all_adapters()]
+    })
+
+@app.route('/marketplaces/health', methods=['GET'])
+def get_marketplace_health():
+    """Circuit breaker state, error rate and fetch latency of each marketplace searched so far."""
+    return jsonify({
+        'marketplaces': get_health_tracker().stats()
     })
 
+@app.route('/marketplaces/plan', methods=['GET'])
+def get_marketplace_plan():
+    """The query planner's plan for a comparison, or its raw statistics when no title is given."""
+    title = request.args.get('title')
+    if not title:
+        return jsonify({
+            'stats': get_default_scraper().planner.stats()
+        })
+    try:
+        deadline = parse_deadline(request.args.get('deadline'))
+    except ValueError as e:
+        return invalid_parameter(e)
+    plan = get_default_scraper().plan_comparison(title, request.args.get('currentMarketplace'), deadline,
+                                                 explore=False, count=False)
+    return jsonify(plan.to_dict())
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def profiling_toggle():
+    """Show or change the profiling toggle: {"enabled": true, "count": 5} profiles the next 5 requests."""
+    if not is_admin_request():
+        return jsonify({
+            'error': 'Forbidden'
+        }), 403
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if data.get('enabled', True):
+            try:
+                count = int(data['count']) if data.get('count') is not None else None
+            except (TypeError, ValueError):
+                count = 0
+            if count is not None and count < 1:
+                return jsonify({
+                    'error': 'count must be a positive integer'
+                }), 400
+            profiling_switch.arm(count)
+        else:
+            profiling_switch.disarm()
+    
+    return jsonify(profiling_switch.state())
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Stored request profiles, newest first."""
+    if not is_admin_request():
+        return jsonify({
+            'error': 'Forbidden'
+        }), 403
+    
+    return jsonify({
+        'profiles': get_profile_store().list()
+    })
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """One profile's timeline and top functions."""
+    if not is_admin_request():
+        return jsonify({
+            'error': 'Forbidden'
+        }), 403
+    
+    artifact = get_profile_store().load(profile_id)
+    if artifact is None:
+        return jsonify({
+            'error': 'Profile not found'
+        }), 404
+    return jsonify(artifact)
+
+@app.route('/admin/profiles/<profile_id>/pstats', methods=['GET'])
+def download_profile_stats(profile_id):
+    """Raw cProfile stats, for pstats or snakeviz."""
+    if not is_admin_request():
+        return jsonify({
+            'error': 'Forbidden'
+        }), 403
+    
+    path = get_profile_store().pstats_path(profile_id)
+    if path is None:
+        return jsonify({
+            'error': 'Profile not found'
+        }), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f'{profile_id}.pstats')
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -172,9 +513,24 @@ if __name__ == '__main__':
     port = int(os.getenv('PORT', 8000))
     debug = os.getenv('DEBUG', 'false').lower() == 'true'
     
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'DEBUG' if debug else 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+    
     print(f"Starting Price Comparison Server on port {port}")
     print(f"Debug mode: {debug}")
     
+    # Close pooled browsers and parser processes, and save planner statistics, when the server stops
+    # (SIGTERM exits via atexit)
+    atexit.register(shutdown_browser_pool)
+    atexit.register(shutdown_parse_pool)
+    atexit.register(get_default_scraper().planner.save)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    if WATCHLIST_ENABLED:
+        watchlist.start()
+    
     app.run(
         host='0.0.0.0',
         port=port,
@@ -0,0 +1,195 @@
+import os
+import re
+from functools import lru_cache
+
+# Minimum score for a candidate to count as a match
+MATCH_THRESHOLD = float(os.getenv('MATCH_THRESHOLD', 0.35))
+
+# Words that say little about which product a listing is
+WEAK_TOKENS = frozenset([
+    'gaming', 'monitor', 'inches', 'curved', 'ultra', 'hd', 'hz', 'ms', 'amd', 'freesync', 'nvidia', 'g-sync',
+    'adaptive', 'sync', 'technology', 'oled', 'qhd', 'uhd', 'display', 'studio', 'portable', 'with', 'for', 'by',
+    'gen', 'inch', 'the', 'and', 'new', 'a', 'of', 'in', 'amazon', 'ebay', 'walmart', 'target', 'edition', 'pack'
+])
+
+# Words that mark a listing as an accessory for a product rather than the product itself
+ACCESSORY_TOKENS = frozenset([
+    'case', 'cases', 'cover', 'covers', 'protector', 'protectors', 'tempered', 'charger', 'cable', 'strap',
+    'stand', 'mount', 'holder', 'skin', 'skins', 'sleeve', 'adapter', 'replacement', 'compatible', 'decal',
+    'earpads', 'refill'
+])
+
+# Short letter/digit tokens that are specs rather than model numbers (S9, X1 and 3S are models)
+SPEC_TOKENS = frozenset(['4k', '8k', '2k', '5g', '4g', '3g', '3d', '1x', '2x'])
+
+# Brands; a listing naming a different brand from the query's is a different product
+BRANDS = frozenset([
+    'apple', 'samsung', 'sony', 'lg', 'dell', 'lenovo', 'hp', 'bose', 'jbl', 'asus', 'logitech', 'google',
+    'microsoft', 'acer', 'msi', 'razer', 'corsair', 'nintendo', 'xiaomi', 'oneplus', 'motorola', 'nokia',
+    'huawei', 'oppo', 'canon', 'nikon', 'fujifilm', 'panasonic', 'philips', 'tcl', 'hisense', 'sennheiser',
+    'beats', 'garmin', 'fitbit', 'dyson', 'breville', 'delonghi', 'sharp', 'toshiba', 'gopro', 'dji', 'anker',
+    'belkin', 'sandisk', 'seagate', 'kingston', 'netgear', 'tplink', 'sonos', 'jabra', 'skullcandy'
+])
+
+WEAK_WEIGHT = 0.2
+WORD_WEIGHT = 1.0
+NUMBER_WEIGHT = 1.5
+CAPACITY_WEIGHT = 1.5
+MODEL_WEIGHT = 3.0
+
+TOKEN_SHARE = 0.7
+NGRAM_SHARE = 0.3
+MODEL_MISSING_PENALTY = 0.6
+MODEL_MISMATCH_PENALTY = 0.3
+CAPACITY_MISMATCH_PENALTY = 0.5
+NUMBER_MISMATCH_PENALTY = 0.4
+BRAND_MISMATCH_PENALTY = 0.3
+ACCESSORY_PENALTY = 0.3
+MODEL_MATCH_BONUS = 0.1
+
+CAPACITY_RE = re.compile(r'\b(\d+(?:\.\d+)?)\s*(tb|gb|mb|mah)\b')
+TOKEN_RE = re.compile(r'[a-z0-9]+(?:[.-][a-z0-9]+)*')
+HAS_DIGIT_RE = re.compile(r'\d')
+HAS_ALPHA_RE = re.compile(r'[a-z]')
+
+CAPACITY_TO_GB = {'tb': 1024.0, 'gb': 1.0, 'mb': 1 / 1024.0}
+
+
+def _normalize_capacity(match) -> str:
+    value, unit = float(match.group(1)), match.group(2)
+    if unit in CAPACITY_TO_GB:
+        return f"{value * CAPACITY_TO_GB[unit]:g}gb"
+    return f"{value:g}{unit}"
+
+
+class TitleFeatures:
+    """Pre-computed matching features for one normalized title."""
+
+    __slots__ = ('weights', 'total_weight', 'ngrams', 'models', 'capacities', 'numbers', 'brands', 'accessory')
+
+    def __init__(self, title: str):
+        text = CAPACITY_RE.sub(_normalize_capacity, (title or '').lower())
+        weights = {}
+        models = set()
+        capacities = set()
+        numbers = set()
+        for raw in TOKEN_RE.findall(text):
+            # Hyphenated model numbers (WH-1000XM5) are indexed joined and split
+            if not CAPACITY_RE.fullmatch(raw) and '.' in raw:
+                raw = raw.replace('.', '-')
+            parts = raw.split('-')
+            candidates = [raw.replace('-', '')] + (parts if len(parts) > 1 else [])
+            for token in candidates:
+                if not token:
+                    continue
+                if CAPACITY_RE.fullmatch(token):
+                    weight = CAPACITY_WEIGHT
+                    capacities.add(token)
+                elif HAS_DIGIT_RE.search(token) and HAS_ALPHA_RE.search(token) and token not in SPEC_TOKENS:
+                    weight = MODEL_WEIGHT
+                    models.add(token)
+                elif token.isdigit():
+                    weight = NUMBER_WEIGHT
+                    numbers.add(token)
+                elif token in WEAK_TOKENS:
+                    weight = WEAK_WEIGHT
+                else:
+                    weight = WORD_WEIGHT
+                weights[token] = max(weights.get(token, 0.0), weight)
+        self.weights = weights
+        self.total_weight = sum(weights.values())
+        joined = ' '.join(sorted(weights))
+        self.ngrams = frozenset(joined[i:i + 3] for i in range(len(joined) - 2))
+        self.models = frozenset(models)
+        self.capacities = frozenset(capacities)
+        self.numbers = frozenset(numbers)
+        self.brands = BRANDS.intersection(weights)
+        self.accessory = not ACCESSORY_TOKENS.isdisjoint(weights)
+
+
+@lru_cache(maxsize=4096)
+def title_features(title: str) -> TitleFeatures:
+    """Memoized feature extraction; repeated candidate titles are cheap."""
+    return TitleFeatures(title)
+
+
+class ProductMatcher:
+    """Scores candidate listings against one query.
+
+    The query is normalized and tokenized once. Candidates are scored in a
+    batch with a weighted token overlap (model numbers and capacities such as
+    "128GB" weigh most, generic words least) blended with character trigram
+    overlap. A model number the candidate lacks or contradicts, a clashing
+    capacity, number (iPhone 14 vs 15) or brand, and accessory words the
+    query does not have (an iPhone 15 Pro case) scale the score down.
+    """
+
+    def __init__(self, query: str, threshold: float = MATCH_THRESHOLD):
+        self.query = query
+        self.threshold = threshold
+        self.features = title_features(query or '')
+
+    def score(self, title: str) -> float:
+        query = self.features
+        candidate = title_features(title or '')
+        if not query.total_weight or not candidate.total_weight:
+            return 0.0
+
+        shared = sum(weight for token, weight in query.weights.items() if token in candidate.weights)
+        token_score = 2 * shared / (query.total_weight + candidate.total_weight)
+
+        if query.ngrams and candidate.ngrams:
+            ngram_score = 2 * len(query.ngrams & candidate.ngrams) / (len(query.ngrams) + len(candidate.ngrams))
+        else:
+            ngram_score = 0.0
+
+        score = TOKEN_SHARE * token_score + NGRAM_SHARE * ngram_score
+        if query.models:
+            if query.models & candidate.models:
+                score += MODEL_MATCH_BONUS
+            elif candidate.models:
+                # A different model number (WH-1000XM4 for WH-1000XM5)
+                score *= MODEL_MISMATCH_PENALTY
+            else:
+                score *= MODEL_MISSING_PENALTY
+        if query.capacities and candidate.capacities and not query.capacities & candidate.capacities:
+            score *= CAPACITY_MISMATCH_PENALTY
+        # Different generation or size numbers (iPhone 14 vs 15) usually mean a different product
+        if query.numbers and candidate.numbers and not query.numbers & candidate.numbers:
+            score *= NUMBER_MISMATCH_PENALTY
+        if query.brands and candidate.brands and not query.brands & candidate.brands:
+            score *= BRAND_MISMATCH_PENALTY
+        if candidate.accessory and not query.accessory:
+            score *= ACCESSORY_PENALTY
+        return round(min(score, 1.0), 4)
+
+    def score_batch(self, products: list) -> list:
+        """Score every product, each distinct title once; returns (score, product) pairs, best first."""
+        scores = {}
+        scored = [(self._cached_score(product, scores), product) for product in products]
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored
+
+    def best_matches(self, products_by_marketplace: dict, threshold: float = None) -> dict:
+        """Best (score, product) per marketplace scoring at least threshold.
+
+        Candidates from every marketplace are scored in one pass, so a title
+        listed on several marketplaces is scored once; ties keep the
+        marketplace's first listing, as score_batch does.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        scores = {}
+        best = {}
+        for marketplace, products in products_by_marketplace.items():
+            for product in products:
+                score = self._cached_score(product, scores)
+                if score >= threshold and (marketplace not in best or score > best[marketplace][0]):
+                    best[marketplace] = (score, product)
+        return best
+
+    def _cached_score(self, product: dict, scores: dict) -> float:
+        title = product.get('title', '')
+        score = scores.get(title)
+        if score is None:
+            score = scores[title] = self.score(title)
+        return score
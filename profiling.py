@@ -0,0 +1,352 @@
+import asyncio
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from collections.abc import Coroutine
+
+# Profile artifact settings
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.profiles'))
+PROFILE_MAX_COUNT = int(os.getenv('PROFILE_MAX_COUNT', 50))
+PROFILE_TOP_FUNCTIONS = int(os.getenv('PROFILE_TOP_FUNCTIONS', 40))
+
+PROFILE_ID_RE = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+
+_current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+def current_profile():
+    """The RequestProfile collecting spans for the running code, or None."""
+    return _current_profile.get()
+
+
+class RequestProfile:
+    """cProfile stats and a stage timeline for one request.
+
+    The request thread is profiled between start() and stop(). Work handed
+    to other threads through wrap() is profiled there too and merged into
+    the same stats. So are the steps of tasks an event loop runs for this
+    request (see profiling_task_factory), but not other requests' tasks
+    sharing the loop thread. time_stage() spans recorded while the profile
+    is current become the timeline.
+    """
+
+    def __init__(self, name: str, meta: dict = None):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.name = name
+        self.meta = meta or {}
+        self.started_at = time.time()
+        self.elapsed = None
+        self.spans = []
+        self._origin = time.perf_counter()
+        self._profilers = []
+        self._running = 0
+        self._lock = threading.Lock()
+        self._token = None
+        self._profiler = None
+        # One profiler per event loop thread, enabled only while this request's tasks run a step
+        self._step_profilers = {}
+        self._step_lock = threading.RLock()
+        self._step_depth = 0
+        self._closed = False
+
+    def _enable_profiler(self):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler already owns the interpreter (Python 3.12+); keep the timeline only
+            return None
+        with self._lock:
+            self._running += 1
+        return profiler
+
+    def _disable_profiler(self, profiler):
+        if profiler is None:
+            return
+        profiler.disable()
+        with self._lock:
+            self._running -= 1
+            self._profilers.append(profiler)
+
+    def start(self, profile_thread: bool = True):
+        """Make this the current profile; profile_thread=False when the caller is an event loop thread."""
+        self._token = _current_profile.set(self)
+        if profile_thread:
+            self._profiler = self._enable_profiler()
+
+    def stop(self):
+        self._disable_profiler(self._profiler)
+        self._profiler = None
+        if self._token is not None:
+            _current_profile.reset(self._token)
+            self._token = None
+        self.elapsed = time.perf_counter() - self._origin
+
+    def add_span(self, stage: str, started: float, duration: float, marketplace: str = '', backend: str = ''):
+        """Add a timeline span; started is a time.perf_counter() value."""
+        span = {
+            'stage': stage,
+            'marketplace': marketplace,
+            'backend': backend,
+            'start': round(started - self._origin, 6),
+            'duration': round(duration, 6),
+            'thread': threading.current_thread().name
+        }
+        with self._lock:
+            self.spans.append(span)
+
+    def wrap(self, fn, marketplace: str = ''):
+        """Wrap fn to run under this profile on another thread, recording its queueing delay."""
+        queued = time.perf_counter()
+
+        def run(*args, **kwargs):
+            started = time.perf_counter()
+            self.add_span('queued', queued, started - queued, marketplace)
+            token = _current_profile.set(self)
+            profiler = self._enable_profiler()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._disable_profiler(profiler)
+                _current_profile.reset(token)
+                self.add_span('worker', started, time.perf_counter() - started, marketplace)
+        return run
+
+    def profile_coroutine(self, coro):
+        """Wrap coro so each of its steps is profiled into this profile."""
+        return ProfiledCoroutine(coro, self)
+
+    def _step(self, coro_method, *args):
+        with self._step_lock:
+            profiler = None
+            if not self._closed and self._step_depth == 0:
+                profiler = self._step_profilers.get(threading.get_ident())
+                if profiler is None:
+                    profiler = self._step_profilers[threading.get_ident()] = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    profiler = None
+            self._step_depth += 1
+            try:
+                return coro_method(*args)
+            finally:
+                self._step_depth -= 1
+                if profiler is not None:
+                    profiler.disable()
+
+    def stats(self):
+        """Merged pstats.Stats of every finished profiler, or None."""
+        with self._step_lock:
+            # Tasks still running from here on are no longer profiled
+            self._closed = True
+            step_profilers = [profiler for profiler in self._step_profilers.values() if profiler.getstats()]
+        with self._lock:
+            profilers = list(self._profilers) + step_profilers
+        if not profilers:
+            return None
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        return stats
+
+    def to_dict(self, stats=None) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span['start'])
+            running = self._running
+        summary = ''
+        if stats is not None:
+            buffer = io.StringIO()
+            stats.stream = buffer
+            stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+            summary = buffer.getvalue()
+        return {
+            'id': self.id,
+            'name': self.name,
+            'meta': self.meta,
+            'started_at': self.started_at,
+            'elapsed': round(self.elapsed, 6) if self.elapsed is not None else None,
+            # Workers still running when the request returned (e.g. timed out searches)
+            'unfinished_workers': running,
+            'timeline': spans,
+            'top_functions': summary
+        }
+
+
+class ProfiledCoroutine(Coroutine):
+    """Coroutine wrapper that profiles each step of coro into a RequestProfile.
+
+    Works both as a task's coroutine and when awaited directly.
+    """
+
+    def __init__(self, coro, profile: RequestProfile):
+        self._coro = coro
+        self._profile = profile
+
+    def send(self, value):
+        return self._profile._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._profile._step(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __next__(self):
+        return self.send(None)
+
+    def __iter__(self):
+        return self
+
+    def __await__(self):
+        return self
+
+
+def profiling_task_factory(loop, coro, **kwargs):
+    """Event loop task factory that profiles tasks created while a request profile is current."""
+    context = kwargs.get('context')
+    profile = context.get(_current_profile) if context is not None else _current_profile.get()
+    if profile is not None:
+        coro = profile.profile_coroutine(coro)
+    return asyncio.Task(coro, loop=loop, **kwargs)
+
+
+def install_task_factory(loop: asyncio.AbstractEventLoop):
+    """Profile request tasks on loop, unless it already has its own task factory."""
+    if loop.get_task_factory() is None:
+        loop.set_task_factory(profiling_task_factory)
+
+
+class ProfileStore:
+    """Ring buffer of profile artifacts on disk; the oldest are deleted past max_count.
+
+    Each profile is saved as <id>.json (metadata, timeline and the top
+    functions by cumulative time) and, if cProfile ran, <id>.pstats.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, max_count: int = PROFILE_MAX_COUNT):
+        self.directory = directory
+        self.max_count = max_count
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def save(self, profile: RequestProfile) -> str:
+        stats = profile.stats()
+        artifact = profile.to_dict(stats)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if stats is not None:
+                stats.dump_stats(self._path(profile.id, '.pstats'))
+            tmp_path = self._path(profile.id, '.json.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(artifact, f)
+            os.replace(tmp_path, self._path(profile.id, '.json'))
+            self._prune()
+        return profile.id
+
+    def _ids(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        # IDs start with a timestamp, so name order is age order
+        return sorted(name[:-5] for name in os.listdir(self.directory)
+                      if name.endswith('.json') and PROFILE_ID_RE.match(name[:-5]))
+
+    def _prune(self):
+        ids = self._ids()
+        for profile_id in ids[:max(0, len(ids) - self.max_count)]:
+            for suffix in ('.json', '.pstats'):
+                try:
+                    os.remove(self._path(profile_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> list:
+        """Summaries of stored profiles, newest first."""
+        summaries = []
+        for profile_id in reversed(self._ids()):
+            artifact = self.load(profile_id)
+            if artifact is None:
+                continue
+            summaries.append({
+                'id': profile_id,
+                'name': artifact['name'],
+                'meta': artifact['meta'],
+                'started_at': artifact['started_at'],
+                'elapsed': artifact['elapsed'],
+                'has_pstats': self.pstats_path(profile_id) is not None
+            })
+        return summaries
+
+    def load(self, profile_id: str):
+        if not PROFILE_ID_RE.match(profile_id or ''):
+            return None
+        try:
+            with open(self._path(profile_id, '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def pstats_path(self, profile_id: str):
+        if not PROFILE_ID_RE.match(profile_id or ''):
+            return None
+        path = self._path(profile_id, '.pstats')
+        return path if os.path.exists(path) else None
+
+
+class ProfilingSwitch:
+    """Admin toggle that profiles the next N requests (or all, until turned off)."""
+
+    def __init__(self):
+        self.enabled = False
+        self.remaining = None
+        self._lock = threading.Lock()
+
+    def arm(self, count: int = None):
+        with self._lock:
+            self.enabled = True
+            self.remaining = count
+
+    def disarm(self):
+        with self._lock:
+            self.enabled = False
+            self.remaining = None
+
+    def take(self) -> bool:
+        """True if the current request should be profiled."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if not self.enabled:
+                return False
+            if self.remaining is not None:
+                self.remaining -= 1
+                if self.remaining <= 0:
+                    self.enabled = False
+                    self.remaining = None
+            return True
+
+    def state(self) -> dict:
+        with self._lock:
+            return {'enabled': self.enabled, 'remaining': self.remaining}
+
+
+_profile_store = None
+_profile_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    """Return the process-wide profile store, creating it on first use."""
+    global _profile_store
+    with _profile_store_lock:
+        if _profile_store is None:
+            _profile_store = ProfileStore()
+        return _profile_store
@@ -0,0 +1,254 @@
+"""Deadline-aware planning of which marketplaces a comparison searches, and in what order.
+
+The planner keeps statistics per marketplace, split by the shopper's region
+and the product's category: searches, matches (and high-confidence ones)
+and an exponentially weighted search latency. Estimates for a thin slice
+(say, AU shoppers looking at headphones on eBay) are smoothed towards the
+marketplace's region-wide and overall figures, which in turn start from the
+adapter's prior_match_rate.
+
+For each comparison the planner drops marketplaces that rarely yield a
+match (except for an occasional exploratory search, so their statistics
+stay current) and those whose latency alone exceeds the caller's budget,
+and orders the rest by expected matches per unit of fetch cost, keeping
+marketplaces in the shopper's region ahead of the others.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PLANNER_STATS_PATH = os.getenv('PLANNER_STATS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'planner_stats.json'))
+PLANNER_SAVE_INTERVAL = float(os.getenv('PLANNER_SAVE_INTERVAL', 60))
+
+# Pruning: marketplaces expected to match less often than this are skipped...
+PLANNER_MIN_MATCH_RATE = float(os.getenv('PLANNER_MIN_MATCH_RATE', 0.1))
+# ...except for this fraction of comparisons, which search them anyway to keep their stats fresh
+PLANNER_EXPLORE_RATE = float(os.getenv('PLANNER_EXPLORE_RATE', 0.05))
+# Searches' worth of weight given to the prior when smoothing a match rate
+PLANNER_PRIOR_WEIGHT = float(os.getenv('PLANNER_PRIOR_WEIGHT', 5))
+# Latency samples needed before a marketplace is pruned for being slower than the budget
+PLANNER_MIN_SAMPLES = int(os.getenv('PLANNER_MIN_SAMPLES', 5))
+PLANNER_LATENCY_ALPHA = float(os.getenv('PLANNER_LATENCY_ALPHA', 0.2))
+
+# Early stop: a comparison finishes once this many marketplaces gave a high-confidence match (0 disables)
+PLANNER_ENOUGH_MATCHES = int(os.getenv('PLANNER_ENOUGH_MATCHES', 3))
+PLANNER_CONFIDENT_SCORE = float(os.getenv('PLANNER_CONFIDENT_SCORE', 0.7))
+
+# Relative cost of a fetch, and the latency assumed before a marketplace has any samples
+FETCH_COST = {'requests': 1.0, 'selenium': 4.0}
+DEFAULT_LATENCY = {'requests': 2.0, 'selenium': 8.0}
+
+ANY = '*'
+
+CATEGORY_KEYWORDS = {
+    'audio': ('headphones', 'headphone', 'earbuds', 'earphones', 'speaker', 'soundbar', 'airpods', 'buds'),
+    'tv': ('tv', 'television', 'qled', 'projector'),
+    'computers': ('laptop', 'notebook', 'macbook', 'chromebook', 'desktop', 'monitor', 'keyboard', 'mouse',
+                  'ssd', 'router', 'printer'),
+    'phones': ('iphone', 'galaxy', 'pixel', 'smartphone', 'phone', 'ipad', 'tablet', 'smartwatch', 'watch'),
+    'gaming': ('playstation', 'ps5', 'ps4', 'xbox', 'nintendo', 'switch', 'controller', 'console'),
+    'cameras': ('camera', 'lens', 'gopro', 'drone', 'mirrorless', 'dslr'),
+    'appliances': ('vacuum', 'fridge', 'refrigerator', 'washer', 'dryer', 'dishwasher', 'microwave', 'kettle',
+                   'toaster', 'blender', 'fryer', 'coffee', 'heater', 'fan', 'purifier'),
+}
+_CATEGORY_BY_WORD = {word: category for category, words in CATEGORY_KEYWORDS.items() for word in words}
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+PLANNER_DECISIONS = REGISTRY.counter(
+    'price_planner_decisions_total',
+    'Planner decisions per marketplace: searched, explored, low_yield or over_budget',
+    ('marketplace', 'decision')
+)
+
+
+def categorize(title: str) -> str:
+    """Coarse product category from the title's keywords, or 'other'."""
+    for word in _WORD_RE.findall((title or '').lower()):
+        category = _CATEGORY_BY_WORD.get(word)
+        if category is not None:
+            return category
+    return 'other'
+
+
+class Plan:
+    """Marketplaces to search, best first, and the reason each other candidate was dropped."""
+
+    def __init__(self, region: str, category: str, budget: float = None):
+        self.region = region
+        self.category = category
+        self.budget = budget
+        self.marketplaces = []
+        self.pruned = {}
+        self.estimates = {}
+
+    def to_dict(self) -> dict:
+        return {
+            'region': self.region,
+            'category': self.category,
+            'budget': self.budget,
+            'marketplaces': self.marketplaces,
+            'pruned': self.pruned,
+            'estimates': self.estimates
+        }
+
+
+class QueryPlanner:
+    """Per-marketplace yield and latency statistics, and comparison plans built from them."""
+
+    def __init__(self, path: str = PLANNER_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._dirty = False
+        self._saved_at = time.time()
+        self._load()
+
+    @staticmethod
+    def _key(marketplace: str, region: str, category: str) -> str:
+        return f"{marketplace}|{region}|{category}"
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                self._stats = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load planner statistics from %s: %s", self.path, e)
+
+    def save(self):
+        """Write the statistics to disk if they changed."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._stats, sort_keys=True)
+            self._dirty = False
+            self._saved_at = time.time()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not save planner statistics to %s: %s", self.path, e)
+
+    def record(self, marketplace: str, region: str, category: str, matched: bool, confident: bool,
+               seconds: float = None):
+        """Record one live search: whether it matched (confidently) and how long it took."""
+        region = region or ANY
+        with self._lock:
+            # Finest slice first, then the marketplace's region-wide and overall figures
+            for key in {self._key(marketplace, region, category), self._key(marketplace, region, ANY),
+                        self._key(marketplace, ANY, ANY)}:
+                entry = self._stats.setdefault(key, {'searches': 0, 'matches': 0, 'confident': 0,
+                                                     'latency': None, 'latency_samples': 0})
+                entry['searches'] += 1
+                entry['matches'] += int(matched)
+                entry['confident'] += int(confident)
+                if seconds is not None:
+                    entry['latency'] = seconds if entry['latency'] is None else \
+                        entry['latency'] + PLANNER_LATENCY_ALPHA * (seconds - entry['latency'])
+                    entry['latency_samples'] += 1
+            self._dirty = True
+            save_due = time.time() - self._saved_at >= PLANNER_SAVE_INTERVAL
+            if save_due:
+                self._saved_at = time.time()
+        if save_due:
+            threading.Thread(target=self.save, name='planner-save', daemon=True).start()
+
+    def estimate(self, adapter, region: str, category: str) -> dict:
+        """Expected match rate, latency and cost of searching adapter's marketplace for this request."""
+        region = region or ANY
+        # The slices record() updates, coarsest first; a request without a region reads marketplace|*|category
+        keys = list(dict.fromkeys([self._key(adapter.id, ANY, ANY), self._key(adapter.id, region, ANY),
+                                   self._key(adapter.id, region, category)]))
+        match_rate = adapter.prior_match_rate
+        latency = DEFAULT_LATENCY.get(adapter.fetch, DEFAULT_LATENCY['requests'])
+        latency_samples = 0
+        searches = 0
+        with self._lock:
+            for key in keys:
+                entry = self._stats.get(key)
+                if entry is None:
+                    continue
+                # Each slice is smoothed towards the coarser one above it
+                match_rate = (entry['matches'] + match_rate * PLANNER_PRIOR_WEIGHT) / \
+                             (entry['searches'] + PLANNER_PRIOR_WEIGHT)
+                searches = entry['searches']
+                if entry['latency'] is not None and entry['latency_samples'] >= min(3, PLANNER_MIN_SAMPLES):
+                    latency = entry['latency']
+                    latency_samples = entry['latency_samples']
+        cost = latency * FETCH_COST.get(adapter.fetch, 1.0)
+        return {
+            'match_rate': round(match_rate, 3),
+            'latency': round(latency, 3),
+            'latency_samples': latency_samples,
+            'searches': searches,
+            'cost': round(cost, 3),
+            'value': round(match_rate / cost, 4) if cost > 0 else match_rate
+        }
+
+    def plan(self, adapters: list, title: str, region: str = None, budget: float = None,
+             explore: bool = True, count: bool = True) -> Plan:
+        """Choose and order marketplaces from adapters (given in region priority order).
+
+        Marketplaces in the shopper's region come first, best value first,
+        then the other regions'; exploratory searches go last in each group.
+        Decisions are counted in PLANNER_DECISIONS unless count is False, for
+        plans that no comparison acts on (previews, watchlist scheduling).
+        """
+        plan = Plan(region, categorize(title), budget)
+        decisions = {}
+        kept = []
+        for position, adapter in enumerate(adapters):
+            foreign = region is not None and adapter.region != region
+            estimate = self.estimate(adapter, region, plan.category)
+            plan.estimates[adapter.id] = estimate
+            if estimate['match_rate'] < PLANNER_MIN_MATCH_RATE:
+                if explore and random.random() < PLANNER_EXPLORE_RATE:
+                    kept.append((foreign, True, 0, position, adapter.id))
+                    decisions[adapter.id] = 'explored'
+                else:
+                    plan.pruned[adapter.id] = 'low_yield'
+                    decisions[adapter.id] = 'low_yield'
+                continue
+            if budget is not None and estimate['latency_samples'] >= PLANNER_MIN_SAMPLES and \
+                    estimate['latency'] > budget:
+                plan.pruned[adapter.id] = 'over_budget'
+                decisions[adapter.id] = 'over_budget'
+                continue
+            kept.append((foreign, False, -estimate['value'], position, adapter.id))
+            decisions[adapter.id] = 'searched'
+        plan.marketplaces = [entry[-1] for entry in sorted(kept)]
+        if count:
+            for marketplace, decision in decisions.items():
+                PLANNER_DECISIONS.inc(marketplace=marketplace, decision=decision)
+        return plan
+
+    def stats(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+
+_query_planner = None
+_query_planner_lock = threading.Lock()
+
+
+def get_query_planner() -> QueryPlanner:
+    """Return the process-wide query planner, loading saved statistics on first use."""
+    global _query_planner
+    with _query_planner_lock:
+        if _query_planner is None:
+            _query_planner = QueryPlanner()
+        return _query_planner
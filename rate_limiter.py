@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from metrics import observe_stage
+from profiling import current_profile
+
+# Defaults for marketplaces without their own rate limit settings
+DEFAULT_RATE = float(os.getenv('RATE_LIMIT_RPS', 0.5))
+DEFAULT_BURST = int(os.getenv('RATE_LIMIT_BURST', 2))
+
+
+class TokenBucket:
+    """Classic token bucket: refills at rate tokens/second up to burst tokens."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def time_until_token(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+
+class _MarketplaceQueue:
+    def __init__(self, rate: float, burst: int):
+        self.bucket = TokenBucket(rate, burst)
+        self.waiting = deque()
+        self.immediate = 0
+        self.queued = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class RateLimitScheduler:
+    """Per-marketplace token-bucket scheduler that never sleeps on worker threads.
+
+    Work is dispatched to the executor straight away while a marketplace has
+    budget. Once the budget is used up, work waits in that marketplace's FIFO
+    queue and a single dispatcher thread releases it as tokens refill.
+    """
+
+    def __init__(self, executor_getter):
+        self._get_executor = executor_getter
+        self._queues = {}
+        self._cond = threading.Condition()
+        self._dispatcher = None
+
+    def configure(self, marketplace: str, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        """Set the requests-per-second rate and burst for a marketplace."""
+        with self._cond:
+            queue = self._queues.get(marketplace)
+            if queue is None:
+                self._queues[marketplace] = _MarketplaceQueue(rate, burst)
+            else:
+                queue.bucket.rate = rate
+                queue.bucket.burst = burst
+
+    def _queue(self, marketplace: str) -> _MarketplaceQueue:
+        queue = self._queues.get(marketplace)
+        if queue is None:
+            queue = self._queues[marketplace] = _MarketplaceQueue(DEFAULT_RATE, DEFAULT_BURST)
+        return queue
+
+    def schedule(self, marketplace: str, fn, *args, **kwargs) -> Future:
+        """Run fn on the executor as soon as the marketplace's budget allows."""
+        future = Future()
+        profile = current_profile()
+        if profile is not None and fn is not None:
+            # Keep profiling the request on whichever worker thread runs fn
+            fn = profile.wrap(fn, marketplace)
+        with self._cond:
+            queue = self._queue(marketplace)
+            if not queue.waiting and queue.bucket.try_take(time.monotonic()):
+                queue.immediate += 1
+                observe_stage('rate_limit_wait', 0.0, marketplace)
+                self._dispatch(future, fn, args, kwargs)
+                return future
+            queue.waiting.append((time.monotonic(), future, fn, args, kwargs))
+            queue.queued += 1
+            self._ensure_dispatcher()
+            self._cond.notify()
+        return future
+
+    def reserve(self, marketplace: str) -> Future:
+        """Future that completes once the marketplace's budget allows one request.
+
+        For callers that do the work themselves, e.g. on an event loop via
+        asyncio.wrap_future(). Cancelling the future gives up the slot.
+        """
+        return self.schedule(marketplace, None)
+
+    def try_reserve(self, marketplace: str) -> bool:
+        """Spend one request of budget if it is available right now and nobody is queued."""
+        with self._cond:
+            queue = self._queue(marketplace)
+            if queue.waiting or not queue.bucket.try_take(time.monotonic()):
+                return False
+            queue.immediate += 1
+        return True
+
+    def _dispatch(self, future: Future, fn, args, kwargs):
+        if fn is None:
+            # A reservation: the caller runs its own work once the future completes
+            if future.set_running_or_notify_cancel():
+                future.set_result(None)
+            return
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        self._get_executor().submit(run)
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name='rate-limit-dispatcher', daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                next_wake = None
+                for marketplace, queue in self._queues.items():
+                    while queue.waiting:
+                        # Drop cancelled work without spending a token on it
+                        if queue.waiting[0][1].cancelled():
+                            queue.waiting.popleft()
+                            continue
+                        if not queue.bucket.try_take(now):
+                            break
+                        enqueued, future, fn, args, kwargs = queue.waiting.popleft()
+                        waited = now - enqueued
+                        queue.waited += 1
+                        queue.total_wait += waited
+                        queue.max_wait = max(queue.max_wait, waited)
+                        observe_stage('rate_limit_wait', waited, marketplace)
+                        self._dispatch(future, fn, args, kwargs)
+                    if queue.waiting:
+                        wait = queue.bucket.time_until_token(now)
+                        next_wake = wait if next_wake is None else min(next_wake, wait)
+                self._cond.wait(timeout=next_wake)
+
+    def stats(self) -> dict:
+        """Queue depth and wait-time statistics per marketplace."""
+        with self._cond:
+            now = time.monotonic()
+            stats = {}
+            for marketplace, queue in self._queues.items():
+                queue.bucket._refill(now)
+                stats[marketplace] = {
+                    'rate': queue.bucket.rate,
+                    'burst': queue.bucket.burst,
+                    'tokens': round(queue.bucket.tokens, 2),
+                    'queue_depth': len(queue.waiting),
+                    'immediate': queue.immediate,
+                    'queued': queue.queued,
+                    'avg_wait': round(queue.total_wait / queue.waited, 3) if queue.waited else 0.0,
+                    'max_wait': round(queue.max_wait, 3)
+                }
+            return stats
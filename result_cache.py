@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Cache settings (seconds / bytes)
+CACHE_TTL = float(os.getenv('CACHE_TTL', 900))
+CACHE_STALE_TTL = float(os.getenv('CACHE_STALE_TTL', 3600))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 2000))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+FRESH = 'hit'
+STALE = 'stale'
+MISS = 'miss'
+
+
+class ResultCache:
+    """Thread-safe TTL/LRU cache bounded by entry count and approximate size.
+
+    Entries younger than ttl are fresh. Entries older than ttl but younger
+    than ttl + stale_ttl are still served, marked stale, so the caller can
+    refresh them in the background (stale-while-revalidate).
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, stale_ttl: float = CACHE_STALE_TTL,
+                 max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _sizeof(value) -> int:
+        return len(json.dumps(value, default=str))
+
+    def get(self, key):
+        """Return (value, age, status) where status is 'hit', 'stale' or 'miss'."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, None, MISS
+            value, stored_at, size = entry
+            age = now - stored_at
+            if age > self.ttl + self.stale_ttl:
+                self._remove(key)
+                self.misses += 1
+                return None, None, MISS
+            self._entries.move_to_end(key)
+            if age > self.ttl:
+                self.stale_hits += 1
+                return value, age, STALE
+            self.hits += 1
+            return value, age, FRESH
+
+    def age(self, key):
+        """Age of an entry in seconds, or None; does not touch LRU order or stats."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else time.time() - entry[1]
+
+    def set(self, key, value):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time(), size)
+            self._bytes += size
+            # Evict least recently used entries until both bounds hold
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def start_refresh(self, key) -> bool:
+        """Claim a background refresh for key; False if one is already running."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def finish_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses
+            }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Return the process-wide result cache, creating it on first use."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers that arrive while
+    it is still running wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs) -> tuple:
+        """Run fn once per in-flight key. Returns (result, shared)."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent awaits with the same key share one execution.
+
+    Calls are only shared within one event loop.
+    """
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, fn, *args, **kwargs) -> tuple:
+        """Await fn(*args, **kwargs) once per in-flight key. Returns (result, shared)."""
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        task = calls.get(key)
+        if task is not None:
+            # Shield so one follower giving up does not cancel the shared call
+            return await asyncio.shield(task), True
+
+        task = calls[key] = asyncio.ensure_future(fn(*args, **kwargs))
+
+        def done(finished):
+            if calls.get(key) is finished:
+                del calls[key]
+            if not finished.cancelled():
+                # Mark the exception retrieved even if every caller gave up waiting
+                finished.exception()
+        task.add_done_callback(done)
+        return await asyncio.shield(task), False
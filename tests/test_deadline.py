@@ -0,0 +1,17 @@
+import pytest
+
+from price_server import app, parse_deadline
+
+
+@pytest.mark.parametrize('deadline', [0, -1, True, 'soon'])
+def test_compare_rejects_a_deadline_that_is_not_a_positive_number(deadline):
+    response = app.test_client().post('/compare-prices', json={'title': 'Sony WH-1000XM5', 'deadline': deadline})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid parameter'
+
+
+def test_missing_deadline_uses_the_default():
+    assert parse_deadline(None) is None
+    assert parse_deadline('') is None
+    assert parse_deadline('2.5') == 2.5
@@ -0,0 +1,12 @@
+from fetch_store import TRUNCATED_HEADER, FetchBackend
+
+
+def test_record_mode_keeps_only_complete_pages(tmp_path):
+    backend = FetchBackend(mode='record', store_dir=str(tmp_path))
+
+    cut_short = backend.fetch('https://shop.example/cut', lambda: (200, {TRUNCATED_HEADER: 'cards'}, '<html>part'))
+    whole = backend.fetch('https://shop.example/whole', lambda: (200, {}, '<html>all</html>'))
+
+    assert (cut_short, whole) == ('<html>part', '<html>all</html>')
+    assert backend.store.get('https://shop.example/cut') is None
+    assert backend.store.get('https://shop.example/whole')['body'] == '<html>all</html>'
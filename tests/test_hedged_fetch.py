@@ -0,0 +1,51 @@
+import asyncio
+
+import price_scraper
+from price_scraper import PriceScraper
+
+MARKETPLACE = 'amazon_au'
+
+
+def hedge_immediately(monkeypatch, pages):
+    """Hedge every fetch straight away, with each request returning the next of pages once all have started."""
+    started = []
+    all_started = asyncio.Event()
+
+    async def fetch(url, use_selenium=False, browser_options=None, reader=None):
+        page = pages[len(started)]
+        started.append(url)
+        if len(started) == len(pages):
+            all_started.set()
+        await all_started.wait()
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+    monkeypatch.setattr(price_scraper, 'get_website_text_content_async', fetch)
+    monkeypatch.setattr(price_scraper.get_health_tracker(), 'hedge_delay', lambda marketplace: 0.01)
+    monkeypatch.setattr(price_scraper.rate_limiter, 'try_reserve', lambda marketplace: True)
+    return started
+
+
+def fetch_page(scraper):
+    adapter = scraper.adapters[MARKETPLACE]
+    return asyncio.run(scraper._fetch_search_page(adapter, adapter.search_url_for('jbl flip 6')))
+
+
+def test_hedged_fetch_uses_content_from_a_request_finishing_with_an_empty_one(monkeypatch):
+    scraper = PriceScraper()
+    started = hedge_immediately(monkeypatch, ['', '<html>results</html>'])
+    assert fetch_page(scraper) == '<html>results</html>'
+    assert len(started) == 2
+
+
+def test_hedged_fetch_failure_does_not_hide_the_other_requests_content(monkeypatch):
+    scraper = PriceScraper()
+    hedge_immediately(monkeypatch, ['<html>results</html>', RuntimeError('connection reset')])
+    assert fetch_page(scraper) == '<html>results</html>'
+
+
+def test_hedged_fetch_is_empty_when_neither_request_has_content(monkeypatch):
+    scraper = PriceScraper()
+    hedge_immediately(monkeypatch, ['', ''])
+    assert fetch_page(scraper) == ''
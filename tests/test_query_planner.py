@@ -0,0 +1,19 @@
+from marketplaces import all_adapters
+from query_planner import QueryPlanner
+
+
+def test_plan_keeps_the_shoppers_region_ahead_of_better_value_elsewhere():
+    planner = QueryPlanner(path='')
+    adapters = all_adapters()
+    au = [adapter for adapter in adapters if adapter.region == 'au']
+    others = [adapter for adapter in adapters if adapter.region != 'au']
+    # A foreign marketplace that always matches fast still comes after every AU one
+    for _ in range(50):
+        planner.record(others[0].id, 'au', 'audio', True, True, 0.1)
+
+    plan = planner.plan(au + others, 'Sony WH-1000XM5 headphones', 'au', explore=False, count=False)
+
+    local = [marketplace for marketplace in plan.marketplaces if marketplace in {a.id for a in au}]
+    assert local
+    assert plan.marketplaces[:len(local)] == local
+    assert others[0].id in plan.marketplaces[len(local):]
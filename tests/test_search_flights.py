@@ -0,0 +1,74 @@
+import asyncio
+
+import price_scraper
+from marketplace_health import get_health_tracker
+from price_scraper import PriceScraper
+
+MARKETPLACE = 'jbhifi_au'
+
+
+def test_identical_concurrent_searches_share_one_fetch_and_one_reservation(monkeypatch):
+    scraper = PriceScraper()
+    fetches = []
+    reservations = []
+
+    async def fetch_search_page(adapter, search_url):
+        fetches.append(search_url)
+        await asyncio.sleep(0.2)
+        return ''
+
+    reserve = price_scraper.rate_limiter.reserve
+
+    def counting_reserve(marketplace):
+        reservations.append(marketplace)
+        return reserve(marketplace)
+
+    monkeypatch.setattr(scraper, '_fetch_search_page', fetch_search_page)
+    monkeypatch.setattr(price_scraper.rate_limiter, 'reserve', counting_reserve)
+
+    async def search_all():
+        return await asyncio.gather(*(scraper.search_marketplace_async('Sony WH-1000XM5 headphones', MARKETPLACE)
+                                      for _ in range(3)))
+
+    try:
+        assert asyncio.run(search_all()) == [[], [], []]
+    finally:
+        get_health_tracker().reset(MARKETPLACE)
+    assert len(fetches) == 1
+    assert reservations == [MARKETPLACE]
+
+
+def test_concurrent_comparisons_of_one_product_share_each_marketplace_search(monkeypatch):
+    scraper = PriceScraper()
+    fetches = []
+    reservations = []
+
+    async def fetch_search_page(adapter, search_url):
+        fetches.append(adapter.id)
+        await asyncio.sleep(0.2)
+        return ''
+
+    reserve = price_scraper.rate_limiter.reserve
+
+    def counting_reserve(marketplace):
+        reservations.append(marketplace)
+        return reserve(marketplace)
+
+    monkeypatch.setattr(scraper, '_fetch_search_page', fetch_search_page)
+    monkeypatch.setattr(price_scraper.rate_limiter, 'reserve', counting_reserve)
+    monkeypatch.setattr(price_scraper, 'HISTORY_MAX_AGE', 0)
+    monkeypatch.setattr('query_planner.PLANNER_EXPLORE_RATE', 0)
+    searched = scraper.plan_comparison('Sony WH-1000XM5 headphones', 'amazon_au', count=False).marketplaces
+
+    async def compare_twice():
+        return await asyncio.gather(*(scraper.compare_prices_async('Sony WH-1000XM5 headphones', 'amazon_au')
+                                      for _ in range(2)))
+
+    try:
+        first, second = asyncio.run(compare_twice())
+    finally:
+        get_health_tracker().reset()
+    assert searched
+    assert sorted(fetches) == sorted(searched)
+    assert sorted(reservations) == sorted(searched)
+    assert first['timed_out'] == second['timed_out'] == []
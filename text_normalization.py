@@ -0,0 +1,105 @@
+import re
+from functools import lru_cache
+
+# Generic descriptive words dropped from search queries
+TITLE_STOP_WORDS = frozenset([
+    'gaming', 'monitor', 'inches', 'curved', 'ultra', 'hd', 'hz', 'ms', 'amd', 'freesync', 'nvidia', 'g-sync',
+    'adaptive', 'sync', 'technology', 'oled', 'qhd', 'uhd', 'display', 'studio', 'portable', 'with', 'for', 'by',
+    'gen', 'inch'
+])
+
+MARKETPLACE_NAMES_RE = re.compile(r'\b(amazon|ebay|walmart|target)\b', re.IGNORECASE)
+SPECIAL_CHARS_RE = re.compile(r'[^\w\s-]')
+WHITESPACE_RE = re.compile(r'\s+')
+PRICE_CHARS_RE = re.compile(r'[^\d.,]')
+
+MIN_PRICE = 1
+MAX_PRICE = 10000
+
+
+@lru_cache(maxsize=8192)
+def clean_title(title: str) -> str:
+    """Clean product title for better search results (memoized)."""
+    if not title:
+        return ""
+
+    # Remove common marketplace-specific terms and generic descriptive words
+    cleaned = MARKETPLACE_NAMES_RE.sub('', title)
+    cleaned = ' '.join(word for word in cleaned.split() if word.lower() not in TITLE_STOP_WORDS)
+
+    # Remove extra whitespace and special characters
+    cleaned = SPECIAL_CHARS_RE.sub(' ', cleaned)
+    return WHITESPACE_RE.sub(' ', cleaned).strip()
+
+
+# Every marketplace price pattern ends in this dollar amount
+PRICE_CORE = r'\$[\d,]+\.?\d*'
+PREFIX_WINDOW = 64
+
+
+class PriceExtractor:
+    """Single-pass price extractor for one marketplace's price patterns.
+
+    Patterns of the form "<prefix>$amount" (e.g. "AUD\\s*$...") are split
+    into one scan for dollar amounts plus a check of the text just before
+    each amount for any of the prefixes, so the page is scanned once.
+    Overlapping patterns report each price once, with the most specific raw
+    text. Other patterns fall back to a single combined alternation.
+    """
+
+    def __init__(self, patterns: list):
+        prefixes = []
+        others = []
+        for pattern in patterns:
+            if pattern == PRICE_CORE:
+                continue
+            if pattern.endswith(PRICE_CORE):
+                prefixes.append(pattern[:-len(PRICE_CORE)])
+            else:
+                others.append(pattern)
+        if others:
+            ordered = sorted(patterns, key=len, reverse=True)
+            self.pattern = re.compile('|'.join(f'(?:{p})' for p in ordered), re.IGNORECASE)
+            self.prefix = None
+        else:
+            self.pattern = re.compile(PRICE_CORE)
+            self.prefix = re.compile('(?:' + '|'.join(prefixes) + r')\Z', re.IGNORECASE) if prefixes else None
+
+    def _matches(self, text: str):
+        """Yield the raw text of every non-overlapping price match."""
+        last_end = 0
+        for match in self.pattern.finditer(text):
+            start = match.start()
+            if self.prefix is not None:
+                context = self.prefix.search(text, max(last_end, start - PREFIX_WINDOW), start)
+                if context:
+                    start = context.start()
+            last_end = match.end()
+            yield text[start:last_end]
+
+    def extract(self, text: str) -> list:
+        """Return [{'price', 'raw_text', 'value'}] for every price in text."""
+        if not text:
+            return []
+        prices = []
+        for raw_text in self._matches(text):
+            # Clean and validate price
+            price_str = PRICE_CHARS_RE.sub('', raw_text)
+            if not price_str or '.' not in price_str:
+                continue
+            try:
+                value = float(price_str.replace(',', ''))
+            except ValueError:
+                continue
+            if MIN_PRICE <= value <= MAX_PRICE:  # Reasonable price range
+                prices.append({
+                    'price': f"${value:.2f}",
+                    'raw_text': raw_text,
+                    'value': value
+                })
+        return prices
+
+    def extract_batch(self, texts: list) -> list:
+        """Extract prices from several documents; one result list per document."""
+        extract = self.extract
+        return [extract(text) for text in texts]
@@ -0,0 +1,169 @@
+import logging
+import os
+import threading
+import time
+from price_scraper import PriceScraper, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Watchlist settings (seconds)
+WATCHLIST_ENABLED = os.getenv('WATCHLIST_ENABLED', 'true').lower() == 'true'
+WATCHLIST_INTERVAL = float(os.getenv('WATCHLIST_INTERVAL', 600))
+WATCHLIST_TOP_N = int(os.getenv('WATCHLIST_TOP_N', 50))
+WATCHLIST_CONCURRENCY = int(os.getenv('WATCHLIST_CONCURRENCY', 2))
+WATCHLIST_MIN_REQUESTS = int(os.getenv('WATCHLIST_MIN_REQUESTS', 2))
+WATCHLIST_HALF_LIFE = float(os.getenv('WATCHLIST_HALF_LIFE', 6 * 3600))
+WATCHLIST_MAX_TRACKED = int(os.getenv('WATCHLIST_MAX_TRACKED', 5000))
+WATCHLIST_TICK = float(os.getenv('WATCHLIST_TICK', 5))
+
+# Staleness beyond this many intervals no longer raises a refresh's priority
+MAX_STALENESS_FACTOR = 10
+
+
+class WatchlistRefresher:
+    """Keeps comparisons for popular products warm in the background.
+
+    Each interactive request bumps a product's popularity, an exponentially
+    decayed request count. A scheduler thread re-searches the marketplaces of
+    the most popular products once their cached results are older than the
+    refresh interval. Work is split into (product, marketplace) searches,
+    ordered by popularity x staleness and limited by a global concurrency
+    budget. Searches go through the per-marketplace rate limiter.
+    """
+
+    def __init__(self, scraper: PriceScraper, interval: float = WATCHLIST_INTERVAL, top_n: int = WATCHLIST_TOP_N,
+                 concurrency: int = WATCHLIST_CONCURRENCY, min_requests: int = WATCHLIST_MIN_REQUESTS,
+                 half_life: float = WATCHLIST_HALF_LIFE, max_tracked: int = WATCHLIST_MAX_TRACKED):
+        self.scraper = scraper
+        self.interval = interval
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.min_requests = min_requests
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._items = {}
+        self._refreshed = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def _decayed(self, item: dict, now: float) -> float:
+        return item['score'] * 0.5 ** ((now - item['updated']) / self.half_life)
+
+    def track(self, title: str, current_marketplace: str = None):
+        """Record an interactive request for a product."""
+        key = self.scraper.clean_product_title(title).lower()
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                item = self._items[key] = {'title': title, 'current_marketplace': current_marketplace,
+                                           'score': 0.0, 'updated': now, 'requests': 0}
+            item['score'] = self._decayed(item, now) + 1.0
+            item['updated'] = now
+            item['requests'] += 1
+            item['current_marketplace'] = current_marketplace
+            if len(self._items) > self.max_tracked:
+                # Forget the least popular product
+                coldest = min(self._items, key=lambda k: self._decayed(self._items[k], now))
+                del self._items[coldest]
+                for refreshed_key in [k for k in self._refreshed if k[0] == coldest]:
+                    del self._refreshed[refreshed_key]
+
+    def _staleness(self, title: str, marketplace: str, now: float) -> float:
+        ages = []
+        if self.scraper.cache is not None:
+            age = self.scraper.cache.age(self.scraper._cache_key(title, marketplace))
+            if age is not None:
+                ages.append(age)
+        refreshed = self._refreshed.get(self.scraper._cache_key(title, marketplace))
+        if refreshed is not None:
+            ages.append(now - refreshed)
+        return min(ages) if ages else float('inf')
+
+    def due_refreshes(self, now: float = None) -> list:
+        """(priority, title, current_marketplace, marketplace) jobs, highest priority first."""
+        now = now or time.time()
+        with self._lock:
+            popular = sorted(
+                ((self._decayed(item, now), item) for item in self._items.values()
+                 if item['requests'] >= self.min_requests),
+                key=lambda pair: pair[0], reverse=True
+            )[:self.top_n]
+            in_flight = set(self._in_flight)
+
+        jobs = []
+        for popularity, item in popular:
+            plan = self.scraper.plan_comparison(item['title'], item['current_marketplace'], explore=False,
+                                               count=False)
+            for marketplace in plan.marketplaces:
+                key = self.scraper._cache_key(item['title'], marketplace)
+                if key in in_flight:
+                    continue
+                staleness = self._staleness(item['title'], marketplace, now)
+                if staleness < self.interval:
+                    continue
+                priority = popularity * min(staleness / self.interval, MAX_STALENESS_FACTOR)
+                jobs.append((priority, item['title'], item['current_marketplace'], marketplace))
+        jobs.sort(key=lambda job: job[0], reverse=True)
+        return jobs
+
+    def run_once(self):
+        """Start as many due refreshes as the concurrency budget allows."""
+        with self._lock:
+            free = self.concurrency - len(self._in_flight)
+        if free <= 0:
+            return
+        for _, title, current_marketplace, marketplace in self.due_refreshes()[:free]:
+            key = self.scraper._cache_key(title, marketplace)
+            with self._lock:
+                self._in_flight.add(key)
+            future = rate_limiter.schedule(marketplace, self._refresh, title, current_marketplace, marketplace)
+            future.add_done_callback(lambda f, key=key: self._finish(key, f))
+
+    def _refresh(self, title: str, current_marketplace: str, marketplace: str):
+        return self.scraper._search_and_cache(title, marketplace, current_marketplace, throttle=False)
+
+    def _finish(self, key, future):
+        with self._lock:
+            self._in_flight.discard(key)
+            self._refreshed[key] = time.time()
+            if future.cancelled() or future.exception() is not None:
+                self.failures += 1
+            else:
+                self.refreshes += 1
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.exception("Error in watchlist refresher: %s", e)
+            self._stop.wait(WATCHLIST_TICK)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='watchlist-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            top = sorted(self._items.items(), key=lambda kv: self._decayed(kv[1], now), reverse=True)[:10]
+            return {
+                'tracked': len(self._items),
+                'in_flight': len(self._in_flight),
+                'refreshes': self.refreshes,
+                'failures': self.failures,
+                'top': [{'title': item['title'], 'popularity': round(self._decayed(item, now), 2),
+                         'requests': item['requests']} for _, item in top]
+            }